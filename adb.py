@@ -0,0 +1,187 @@
+"""Asyncio front end for db.py.
+
+Every db.py data accessor has a coroutine twin here with the same name and
+arguments (`await adb.get_user_by_telegram(tid)`); connection, schema and
+profiler helpers (get_conn, init_db, transaction, explain, ...) do not. Reads run on a small pool
+of reader threads, each with its own connection. Writes go through one writer
+task that runs them on a single dedicated thread: jobs queued while a commit
+is in progress are committed together (group commit), each inside its own
+savepoint so a failing job does not take the others down with it.
+
+    await adb.start()
+    user = await adb.get_user_by_telegram(tid)
+    await adb.update_user_balance(user['id'], 5.0, 'bonus')
+    await adb.close()
+"""
+import asyncio
+import functools
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+import db
+
+READERS = 4
+# upper bound on jobs sharing one commit
+MAX_GROUP = 64
+
+READS = (
+    'get_user_by_telegram', 'get_user_by_refcode', 'get_user_by_id', 'list_user_investments',
+    'get_referral_stats', 'get_referrals_of', 'get_investment_by_id', 'get_latest_investment_for_user',
+    'has_pending_investment', 'list_users_page', 'list_receipts_page', 'list_all_users',
+    'get_all_active_investments', 'get_pending_investments', 'get_all_receipts',
+    'get_unfinished_payout_run', 'reconcile_balances', 'get_receipt',
+    'next_user_batch_bound', 'get_daily_accruals', 'load_payout_columns', 'next_outbox_due',
+    'get_admins_version', 'list_admins', 'load_user_state',
+)
+WRITES = (
+    'create_user', 'add_investment', 'add_active_investment', 'mark_investment_active',
+    'update_user_balance', 'apply_balance_deltas', 'add_receipt', 'add_withdrawal_request',
+    'enqueue_outbox', 'take_balance_snapshot', 'rebuild_referral_stats',
+    'start_payout_run', 'advance_payout_run', 'finish_payout_run',
+    'claim_outbox', 'delete_outbox', 'reschedule_outbox', 'reschedule_outbox_many', 'fail_outbox',
+    'requeue_sending_outbox', 'upsert_admin', 'remove_admin', 'sync_env_admins', 'save_user_states',
+)
+
+
+class Database:
+    def __init__(self, readers: int = READERS, max_group: int = MAX_GROUP):
+        self.readers = readers
+        self.max_group = max_group
+        self._reader_pool = None
+        self._writer_thread = None
+        self._queue = None
+        self._task = None
+
+    async def start(self):
+        self._reader_pool = ThreadPoolExecutor(max_workers=self.readers, thread_name_prefix='adb-read')
+        self._writer_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='adb-write')
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._writer())
+        return self
+
+    async def close(self):
+        """Finish the queued writes, then stop the writer and the reader threads."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        self._reader_pool.shutdown(wait=True)
+        self._writer_thread.shutdown(wait=True)
+
+    async def read(self, fn: Callable, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._reader_pool, functools.partial(fn, *args, **kwargs))
+
+    async def write(self, fn: Callable, *args, **kwargs):
+        """Queue `fn` for the writer. It may call several db.py functions; they commit as one unit."""
+        if self._task is None:
+            raise RuntimeError('database is not started')
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((functools.partial(fn, *args, **kwargs), future))
+        return await future
+
+    async def _writer(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            job = await self._queue.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.max_group and not self._queue.empty():
+                job = self._queue.get_nowait()
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+            try:
+                results = await loop.run_in_executor(self._writer_thread, _run_group, [fn for fn, _ in batch])
+            except Exception as e:
+                results = [(False, e)] * len(batch)
+            for (_, future), (ok, value) in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+
+def _run_group(jobs: List[Callable]) -> List[tuple]:
+    if len(jobs) == 1:
+        return [_run_one(jobs[0])]
+    try:
+        results = []
+        with db.transaction() as conn:
+            for job in jobs:
+                conn.execute('SAVEPOINT adb_job')
+                try:
+                    value = job()
+                except Exception as e:
+                    conn.execute('ROLLBACK TO adb_job')
+                    results.append((False, e))
+                else:
+                    results.append((True, value))
+                conn.execute('RELEASE adb_job')
+        return results
+    except sqlite3.OperationalError:
+        # BEGIN or COMMIT failed (e.g. another process held the lock past
+        # busy_timeout); everything was rolled back, so retry job by job
+        logging.warning('adb: group commit of %d jobs failed, retrying one by one', len(jobs), exc_info=True)
+        return [_run_one(job) for job in jobs]
+
+
+def _run_one(job: Callable) -> tuple:
+    try:
+        with db.transaction():
+            return True, job()
+    except Exception as e:
+        return False, e
+
+
+_database: Optional[Database] = None
+
+
+async def start(readers: int = READERS, max_group: int = MAX_GROUP) -> Database:
+    global _database
+    if _database is None:
+        _database = await Database(readers, max_group).start()
+    return _database
+
+
+async def close():
+    global _database
+    if _database is not None:
+        await _database.close()
+        _database = None
+
+
+def _default() -> Database:
+    if _database is None:
+        raise RuntimeError('adb.start() has not been called')
+    return _database
+
+
+async def write(fn: Callable, *args, **kwargs):
+    """Run a function of several db.py calls as one write job on the shared writer."""
+    return await _default().write(fn, *args, **kwargs)
+
+
+def _mirror(name: str, is_write: bool):
+    fn = getattr(db, name)
+
+    @functools.wraps(fn)
+    async def call(*args, **kwargs):
+        database = _default()
+        return await (database.write if is_write else database.read)(fn, *args, **kwargs)
+    return call
+
+
+for _name in READS:
+    globals()[_name] = _mirror(_name, False)
+for _name in WRITES:
+    globals()[_name] = _mirror(_name, True)
+del _name
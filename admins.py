@@ -0,0 +1,105 @@
+"""Admin permissions: the `admins` table plus an in-memory view of it.
+
+Checks (`is_admin`, `role`, `recipients`) read an immutable snapshot that is
+swapped in one assignment whenever the table changes, so they never touch
+the database. Every change bumps `meta.admins_version`; `watch()` polls that
+counter so other bot processes sharing the database pick changes up too.
+"""
+import logging
+import threading
+from typing import Dict, FrozenSet, Iterable, NamedTuple, Optional, Tuple
+
+from db import get_admins_version, list_admins, upsert_admin, remove_admin, sync_env_admins
+
+OWNER = 'owner'
+ADMIN = 'admin'
+ROLES = (OWNER, ADMIN)
+WATCH_INTERVAL = 5.0
+
+
+class _View(NamedTuple):
+    version: Optional[int]
+    ids: FrozenSet[int]
+    roles: Dict[int, str]
+    recipients: Tuple[int, ...]
+
+
+class AdminRegistry:
+    def __init__(self):
+        self._view = _View(None, frozenset(), {}, ())
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def refresh(self, force: bool = False) -> bool:
+        """Reload from the table if its version moved. Returns True when reloaded."""
+        with self._lock:
+            version = get_admins_version()
+            if version == self._view.version and not force:
+                return False
+            rows = list_admins()
+            self._view = _View(
+                version,
+                frozenset(r['telegram_id'] for r in rows),
+                {r['telegram_id']: r['role'] for r in rows},
+                tuple(r['telegram_id'] for r in rows if r['notify']),
+            )
+            return True
+
+    def __len__(self):
+        return len(self._view.ids)
+
+    def is_admin(self, telegram_id) -> bool:
+        return telegram_id in self._view.ids
+
+    def role(self, telegram_id) -> Optional[str]:
+        return self._view.roles.get(telegram_id)
+
+    def recipients(self) -> Tuple[int, ...]:
+        return self._view.recipients
+
+    def add(self, telegram_id: int, role: str = ADMIN, notify: bool = True, source: str = 'runtime'):
+        if role not in ROLES:
+            raise ValueError(f'unknown role: {role}')
+        upsert_admin(telegram_id, role, notify, source)
+        self.refresh()
+
+    def remove(self, telegram_id: int) -> bool:
+        removed = remove_admin(telegram_id)
+        self.refresh()
+        return removed
+
+    def seed(self, chat_ids: Iterable[int], owner_id: Optional[int] = None):
+        # ADMIN_CHAT_IDS receive notifications; ADMIN_TELEGRAM_ID is the owner
+        # and only gets them when it is listed in ADMIN_CHAT_IDS as well
+        chat_ids = set(chat_ids)
+        rows = [(tid, ADMIN, True) for tid in chat_ids if tid != owner_id]
+        if owner_id:
+            rows.append((owner_id, OWNER, owner_id in chat_ids))
+        sync_env_admins(rows)
+        self.refresh()
+
+    def watch(self, interval: float = WATCH_INTERVAL):
+        """Poll for changes made by other processes until stop()."""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._watch, args=(interval,), name='admins-watch', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+
+    def _watch(self, interval: float):
+        while not self._stopped.wait(interval):
+            try:
+                if self.refresh():
+                    logging.info('admins: reloaded, %d admins', len(self._view.ids))
+            except Exception:
+                logging.exception('admins: refresh failed')
+
+
+registry = AdminRegistry()
+is_admin = registry.is_admin
+role = registry.role
+recipients = registry.recipients
@@ -0,0 +1,5 @@
+"""Benchmarks for db.py and the payout jobs.
+
+    python -m bench.run --users 10000 --out bench_10k.json
+    python -m bench.run --users 10000 --compare bench_10k.json
+"""
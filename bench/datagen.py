@@ -0,0 +1,45 @@
+"""Deterministic synthetic data for benchmarks: users with a referral tree,
+investments (active and pending) and receipts, written with bulk inserts."""
+import os
+import random
+from datetime import datetime, timedelta
+
+import db
+
+PLANS = (50, 100, 150)
+
+
+def generate(path: str, users: int, investments_per_user: float = 1.5, referral_ratio: float = 0.7,
+             active_ratio: float = 0.8, receipt_ratio: float = 0.5, seed: int = 42) -> dict:
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    db.init_db(path)
+    rnd = random.Random(seed)
+    start = datetime(2025, 1, 1)
+    conn = db.get_conn()
+    with db.transaction():
+        user_rows = []
+        for uid in range(1, users + 1):
+            referrer = rnd.randrange(1, uid) if uid > 1 and rnd.random() < referral_ratio else None
+            created = (start + timedelta(seconds=uid * 30)).isoformat()
+            user_rows.append((uid, 100000000 + uid, f'user{uid}', 0.0, referrer, f'R{uid:08d}', created))
+        conn.executemany('INSERT INTO users (id, telegram_id, username, balance, referrer_id, referral_code, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)', user_rows)
+        del user_rows
+
+        inv_rows = []
+        receipt_rows = []
+        for inv_id in range(1, int(users * investments_per_user) + 1):
+            uid = rnd.randrange(1, users + 1)
+            amount = float(rnd.choice(PLANS))
+            active = 1 if rnd.random() < active_ratio else 0
+            created = (start + timedelta(seconds=inv_id * 20)).isoformat()
+            inv_rows.append((inv_id, uid, amount, f'plan_{int(amount)}', created, active))
+            if rnd.random() < receipt_ratio:
+                kind = 'photo' if rnd.random() < 0.7 else 'document'
+                receipt_rows.append((uid, inv_id, f'FILE{inv_id:010d}', kind, created))
+        conn.executemany('INSERT INTO investments (id, user_id, amount, plan, start_date, active) VALUES (?, ?, ?, ?, ?, ?)', inv_rows)
+        conn.executemany('INSERT INTO receipts (user_id, investment_id, file_id, file_type, created_at) VALUES (?, ?, ?, ?, ?)', receipt_rows)
+    db.rebuild_referral_stats()
+    db.take_balance_snapshot()
+    return {'users': users, 'investments': len(inv_rows), 'receipts': len(receipt_rows), 'seed': seed}
@@ -0,0 +1,94 @@
+"""Cold-start check: how long `import bot` takes, from `python -X importtime`.
+
+    python -m bench.importtime
+    python -m bench.importtime --budget-ms 300 --out importtime.json
+    python -m bench.importtime --compare importtime.json
+
+Each run is a fresh interpreter; the median cumulative time of the `bot`
+module is compared against --budget-ms (and an earlier results file with
+--compare). Modules that only the payout run or other optional paths need
+must not be imported at all; finding one fails the check regardless of
+timing. Exits 1 on a failure.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# loaded lazily by bot.py; seeing them at import time is a regression
+FORBIDDEN = ('numpy', 'payments', 'payout_engine', 'webhook', 'pip._vendor.pkg_resources')
+
+
+def import_times(module: str, env: dict) -> dict:
+    """{module: cumulative microseconds} for one `import module` in a new interpreter."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                          cwd=ROOT, env=env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'import {module} failed:\n{proc.stderr[-2000:]}')
+    times = {}
+    for line in proc.stderr.splitlines():
+        # "import time:      self [us] | cumulative | imported package"
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='bot')
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--budget-ms', type=float, default=300.0, help='max median import time of --module')
+    parser.add_argument('--top', type=int, default=15, help='slowest imports to list')
+    parser.add_argument('--out', help='write results JSON here')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown counted as a regression')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench-import-')
+    env = dict(os.environ, DATABASE_FILE=os.path.join(workdir, 'import.db'), TELEGRAM_TOKEN='')
+    try:
+        # first run compiles .pyc files; not counted
+        import_times(args.module, env)
+        runs = [import_times(args.module, env) for _ in range(args.runs)]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    median_ms = statistics.median(r[args.module] for r in runs) / 1000
+    slowest = sorted(runs[-1].items(), key=lambda kv: kv[1], reverse=True)
+    print(f"import {args.module}: median {median_ms:.1f} ms over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    for name, us in slowest[1:args.top + 1]:
+        print(f"  {us / 1000:8.1f} ms  {name}")
+
+    failed = False
+    loaded = [name for name in FORBIDDEN if name in runs[-1]]
+    if loaded:
+        print(f"FAIL: imported at startup: {', '.join(loaded)}")
+        failed = True
+    if median_ms > args.budget_ms:
+        print(f"FAIL: {median_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            base_ms = json.load(f)['median_ms']
+        change = median_ms / base_ms - 1
+        print(f"baseline {base_ms:.1f} ms, change {change:+.1%}")
+        if change > args.threshold:
+            print('FAIL: REGRESSION')
+            failed = True
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'module': args.module, 'median_ms': median_ms, 'runs': args.runs,
+                       'python': sys.version.split()[0], 'slowest': dict(slowest[:args.top + 1])}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
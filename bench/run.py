@@ -0,0 +1,256 @@
+"""Benchmark every db.py accessor plus the daily payout jobs.
+
+Each benchmark runs in its own interpreter against the shared database file
+(in order, so writes carry over as before) and reports ops/sec, p50/p99
+latency and that interpreter's peak RSS; ru_maxrss never goes down, so a
+single process could only report the largest peak seen so far. Results are
+written as JSON; --compare prints the change against an earlier results file
+and exits 1 on a regression.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from bench.datagen import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def peak_rss_kb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, KiB on Linux
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def measure(fn, make_args, max_iterations: int, budget: float) -> dict:
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < max_iterations and time.perf_counter() - started < budget:
+        args = make_args()
+        t0 = time.perf_counter()
+        fn(*args)
+        samples.append(time.perf_counter() - t0)
+    samples.sort()
+    total = sum(samples)
+    return {
+        'iterations': len(samples),
+        'ops_per_sec': len(samples) / total if total else None,
+        'p50_ms': samples[len(samples) // 2] * 1000,
+        'p99_ms': samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        'peak_rss_kb': peak_rss_kb(),
+    }
+
+
+def build_benchmarks(users: int, rnd: random.Random):
+    import db
+    import payments
+
+    investments = db.get_conn().execute('SELECT MAX(id) FROM investments').fetchone()[0] or 1
+    receipts = db.get_conn().execute('SELECT MAX(id) FROM receipts').fetchone()[0] or 1
+    uid = lambda: rnd.randrange(1, users + 1)
+    new_tg = iter(range(900000000, 2000000000))
+
+    def next_run_day():
+        # every payout benchmark needs a day no earlier case (or process) has paid
+        last = db.get_conn().execute('SELECT MAX(run_date) FROM payout_runs').fetchone()[0]
+        day = date(2030, 1, 1)
+        if last:
+            day = max(day, date.fromisoformat(last) + timedelta(days=1))
+        return day.isoformat()
+    pending = [r[0] for r in db.get_conn().execute('SELECT id FROM investments WHERE active=0')]
+    rnd.shuffle(pending)
+
+    quiet = contextlib.redirect_stdout(io.StringIO())
+
+    def adb_writes(n):
+        # n concurrent coroutine writes through the group-committing writer
+        import asyncio
+        import adb
+
+        async def go():
+            await adb.start()
+            try:
+                await asyncio.gather(*(adb.update_user_balance(uid(), 1.0) for _ in range(n)))
+            finally:
+                await adb.close()
+        asyncio.run(go())
+
+    def payout_run(run_date, shards=1):
+        with quiet:
+            payments.daily_payouts(run_date, shards=shards)
+
+    benches = [
+        # point reads
+        ('get_user_by_telegram', db.get_user_by_telegram, lambda: (100000000 + uid(),), 5000),
+        ('get_user_by_id', db.get_user_by_id, lambda: (uid(),), 5000),
+        ('get_user_by_refcode', db.get_user_by_refcode, lambda: (f'R{uid():08d}',), 5000),
+        ('get_investment_by_id', db.get_investment_by_id, lambda: (rnd.randrange(1, investments + 1),), 5000),
+        ('get_latest_investment_for_user', db.get_latest_investment_for_user, lambda: (uid(),), 5000),
+        ('list_user_investments', db.list_user_investments, lambda: (uid(),), 5000),
+        ('get_referrals_of', db.get_referrals_of, lambda: (uid(),), 5000),
+        ('get_referral_stats', db.get_referral_stats, lambda: (uid(),), 5000),
+        ('has_pending_investment', db.has_pending_investment, lambda: (uid(),), 5000),
+        # pages and scans
+        ('list_users_page', db.list_users_page, lambda: (uid(), None, 10), 2000),
+        ('list_receipts_page', db.list_receipts_page, lambda: (rnd.randrange(1, receipts + 1), 10), 2000),
+        ('get_all_active_investments', db.get_all_active_investments, lambda: (), 20),
+        ('get_pending_investments', db.get_pending_investments, lambda: (), 20),
+        ('list_all_users', db.list_all_users, lambda: (), 20),
+        ('get_all_receipts', db.get_all_receipts, lambda: (), 20),
+        ('reconcile_balances', db.reconcile_balances, lambda: (), 10),
+        # writes
+        ('create_user', db.create_user, lambda: (next(new_tg), 'bench', f'B{rnd.getrandbits(40):x}', uid()), 2000),
+        ('add_investment', db.add_investment, lambda: (uid(), 100.0, 'plan_100'), 2000),
+        ('add_active_investment', db.add_active_investment, lambda: (uid(), 100.0, 'plan_100'), 2000),
+        ('mark_investment_active', db.mark_investment_active, lambda: (pending.pop() if pending else 1,), 2000),
+        ('update_user_balance', db.update_user_balance, lambda: (uid(), 1.0), 2000),
+        ('add_receipt', db.add_receipt, lambda: (uid(), rnd.randrange(1, investments + 1), 'BENCHFILE', 'photo'), 2000),
+        ('add_withdrawal_request', db.add_withdrawal_request, lambda: (uid(), 50.0), 2000),
+        ('adb_update_user_balance_x100', adb_writes, lambda: (100,), 200),
+        ('take_balance_snapshot', db.take_balance_snapshot, lambda: (), 5),
+        # payout jobs
+        ('daily_payouts', payout_run, lambda: (next_run_day(),), 3),
+        ('daily_payouts_sharded', payout_run, lambda: (next_run_day(), max(2, os.cpu_count() or 1)), 3),
+    ]
+    try:
+        import bot
+    except ImportError as e:
+        print(f'skipping credit_daily_returns: {e}', file=sys.stderr)
+    else:
+        def credit_run(run_date):
+            with quiet:
+                bot.credit_daily_returns(run_date)
+        benches.append(('credit_daily_returns', credit_run, lambda: (next_run_day(),), 3))
+    return benches
+
+
+def run_case(name: str, args) -> dict:
+    # args.db is the generated database; the child prints its result as the last stdout line
+    cmd = [sys.executable, '-m', 'bench.run', '--case', name, '--db', args.db, '--users', str(args.users),
+           '--seed', str(args.seed), '--budget', str(args.budget)]
+    proc = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'benchmark {name} failed:\n{proc.stderr[-2000:]}')
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def case_main(args) -> int:
+    import db
+    db.init_db(args.db)
+    # distinct but reproducible argument streams per case
+    rnd = random.Random(f'{args.seed}:{args.case}')
+    for name, fn, make_args, iterations in build_benchmarks(args.users, rnd):
+        if name == args.case:
+            result = measure(fn, make_args, iterations, args.budget)
+            db.close_all()
+            print(json.dumps(result))
+            return 0
+    print(f'unknown benchmark {args.case!r}', file=sys.stderr)
+    return 2
+
+
+def benchmark_names(users: int) -> list:
+    return [name for name, *_ in build_benchmarks(users, random.Random(0))]
+
+
+def compare(results: dict, baseline_path: str, threshold: float) -> bool:
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)['results']
+    regressed = False
+    print(f"{'benchmark':32} {'base p50':>10} {'p50':>10} {'change':>8}")
+    for name, res in results.items():
+        old = baseline.get(name)
+        if not old or not old.get('p50_ms'):
+            continue
+        change = res['p50_ms'] / old['p50_ms'] - 1
+        flag = ''
+        if change > threshold:
+            flag = '  REGRESSION'
+            regressed = True
+        print(f"{name:32} {old['p50_ms']:10.3f} {res['p50_ms']:10.3f} {change:+8.1%}{flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10000, help='synthetic users (e.g. 10000, 100000, 1000000)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--budget', type=float, default=2.0, help='max seconds per benchmark')
+    parser.add_argument('--only', help='comma-separated benchmark names')
+    parser.add_argument('--out', help='write results JSON here')
+    parser.add_argument('--compare', help='earlier results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='p50 slowdown counted as a regression')
+    # internal: run one benchmark against an existing database (see run_case)
+    parser.add_argument('--case', help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.case:
+        return case_main(args)
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    path = os.path.join(workdir, 'bench.db')
+    os.environ['DATABASE_FILE'] = path
+    try:
+        t0 = time.perf_counter()
+        dataset = generate(path, args.users, seed=args.seed)
+        dataset['generate_seconds'] = round(time.perf_counter() - t0, 2)
+        print(f"generated {dataset['users']} users, {dataset['investments']} investments, {dataset['receipts']} receipts "
+              f"in {dataset['generate_seconds']}s", file=sys.stderr)
+
+        args.db = path
+        names = benchmark_names(args.users)
+        # the children open the file themselves
+        import db
+        db.close_all()
+        only = set(args.only.split(',')) if args.only else None
+        results = {}
+        for name in names:
+            if only and name not in only:
+                continue
+            results[name] = r = run_case(name, args)
+            rss = f"{r['peak_rss_kb'] / 1024:7.1f} MiB" if r['peak_rss_kb'] else 'n/a'
+            print(f"{name:32} {r['ops_per_sec']:10.1f} ops/s  p50 {r['p50_ms']:8.3f} ms  p99 {r['p99_ms']:8.3f} ms  "
+                  f"rss {rss}  ({r['iterations']} runs)", file=sys.stderr)
+
+        report = {
+            'meta': {
+                'dataset': dataset,
+                'python': platform.python_version(),
+                'sqlite': sqlite3.sqlite_version,
+                'platform': platform.platform(),
+                'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            },
+            'peak_rss_kb': max((r['peak_rss_kb'] or 0 for r in results.values()), default=None) or None,
+            'results': results,
+        }
+        if args.out:
+            with open(args.out, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+        regressed = compare(results, args.compare, args.threshold) if args.compare else False
+    finally:
+        import db
+        db.close_all()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if regressed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Micro-benchmark: sniff/imghdr.what against the previous imghdr shim.
+
+    python -m bench.sniff
+    python -m bench.sniff --out sniff.json
+
+Inputs are in-memory headers (how python-telegram-bot calls imghdr.what),
+whole files in memory, and files on disk, including a 20 MB one.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from bench.run import measure
+import imghdr
+import sniff
+
+
+def legacy_what(filename=None, h=None):
+    # the imghdr shim as it was before sniff.py
+    data = h
+    if filename and h is None:
+        try:
+            with open(filename, 'rb') as f:
+                data = f.read(32)
+        except Exception:
+            return None
+    if not data:
+        return None
+    if data.startswith(b"\xff\xd8\xff"):
+        return 'jpeg'
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return 'png'
+    if data.startswith(b"GIF87a") or data.startswith(b"GIF89a"):
+        return 'gif'
+    if data.startswith(b"RIFF") and b"WEBP" in data[:16]:
+        return 'webp'
+    return None
+
+
+SAMPLES = {
+    'jpeg': b'\xff\xd8\xff\xe0\x00\x10JFIF\x00',
+    'png': b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR',
+    'webp': b'RIFF\x24\x00\x00\x00WEBPVP8 ',
+    'pdf': b'%PDF-1.7\n%\xe2\xe3\xcf\xd3\n',
+    'heic': b'\x00\x00\x00\x18ftypmif1\x00\x00\x00\x00mif1heic',
+}
+
+
+def build_benchmarks(workdir: str):
+    body = os.urandom(64 * 1024)
+    big = os.path.join(workdir, 'big.jpg')
+    with open(big, 'wb') as f:
+        f.write(SAMPLES['jpeg'])
+        for _ in range(20 * 1024 * 1024 // len(body)):
+            f.write(body)
+    small = {}
+    for kind, head in SAMPLES.items():
+        small[kind] = os.path.join(workdir, f'small.{kind}')
+        with open(small[kind], 'wb') as f:
+            f.write(head + body)
+    whole = SAMPLES['png'] + body * 16
+
+    none = lambda: ()
+    for kind, head in SAMPLES.items():
+        yield f'legacy_header_{kind}', lambda h=head: legacy_what(None, h), none
+        yield f'what_header_{kind}', lambda h=head: imghdr.what(None, h), none
+    yield 'sniff_header_pdf', lambda: sniff.sniff(SAMPLES['pdf']), none
+    yield 'legacy_bytes_1mb', lambda: legacy_what(None, whole), none
+    yield 'what_bytes_1mb', lambda: imghdr.what(None, whole), none
+    yield 'legacy_file_jpeg', lambda: legacy_what(small['jpeg']), none
+    yield 'what_file_jpeg', lambda: imghdr.what(small['jpeg']), none
+    yield 'sniff_file_heic', lambda: sniff.sniff_file(small['heic']), none
+    yield 'legacy_file_20mb', lambda: legacy_what(big), none
+    yield 'what_file_20mb', lambda: imghdr.what(big), none
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200000)
+    parser.add_argument('--budget', type=float, default=1.0, help='max seconds per benchmark')
+    parser.add_argument('--out', help='write results JSON here')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench-sniff-')
+    results = {}
+    try:
+        for name, fn, make_args in build_benchmarks(workdir):
+            r = results[name] = measure(fn, make_args, args.iterations, args.budget)
+            print(f"{name:24} {r['ops_per_sec']:12.0f} ops/s  p50 {r['p50_ms'] * 1000:8.2f} us  p99 {r['p99_ms'] * 1000:8.2f} us",
+                  file=sys.stderr)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump({'results': results}, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,13 +1,17 @@
 import logging
 import os
+from urllib.parse import urlsplit
 from dotenv import load_dotenv
-from telegram import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup, InputMediaPhoto, InputMediaDocument
 from telegram.ext import Updater, CommandHandler, MessageHandler, Filters, CallbackContext, ConversationHandler, CallbackQueryHandler
-from db import init_db, create_user, get_user_by_telegram, get_user_by_refcode, add_investment, add_active_investment, list_user_investments, update_user_balance, add_withdrawal_request, get_referrals_of, get_investment_by_id, add_receipt, mark_investment_active, get_user_by_id, list_all_users, get_pending_investments, get_all_receipts
-from utils import gen_referral_code
-from payments import daily_payouts
-from apscheduler.schedulers.background import BackgroundScheduler
-import pytz
+from db import init_db, close_all, cache_stats, enable_profiler, slow_queries, transaction, create_user, get_user_by_telegram, get_user_by_refcode, add_investment, add_active_investment, list_user_investments, update_user_balance, add_withdrawal_request, get_referral_stats, get_investment_by_id, add_receipt, get_receipt, mark_investment_active, get_user_by_id, list_users_page, has_pending_investment, list_receipts_page, get_unfinished_payout_run
+import admins
+import metrics
+import outbox
+from dispatch import KeyedExecutor, per_user
+from persistence import SQLitePersistence
+from router import TextRouter, CallbackRouter, StateRouter, normalize
+from utils import gen_referral_code, sha256_stream
 from datetime import datetime, timezone
 
 # Load env
@@ -17,37 +21,54 @@ DB_FILE = os.getenv('DATABASE_FILE', 'data.db')
 # Payment recipient (users should send investments here via M10)
 ADMIN_PAYMENT_ACCOUNT = '200248061442058'
 ADMIN_PAYMENT_NAME = 'Abdulla Azizov'
+# Daily payout time (UTC, HH:MM); read in main() by payout_time()
+DEFAULT_PAYOUT_TIME = (0, 0)
+# Worker processes computing the payout run in id-range shards; 1 = in this process, 0 = one per CPU
+PAYOUT_SHARDS = int(os.getenv('PAYOUT_SHARDS', '1')) or os.cpu_count() or 1
 
-# Admin lists are loaded from env; use load_admins() to refresh in-memory state
-ADMIN_CHAT_IDS = []
-ADMIN_TELEGRAM_ID = None
-
+# Admins live in the admins table (see admins.py). ADMIN_CHAT_IDS and
+# ADMIN_TELEGRAM_ID from the env seed it on start; admins added at runtime
+# are kept in the db only.
 def load_admins():
-	global ADMIN_CHAT_IDS, ADMIN_TELEGRAM_ID
-	raw = os.getenv('ADMIN_CHAT_IDS', '') or ''
-	lst = [x.strip() for x in raw.split(',') if x.strip()]
+	chat_ids = []
+	for x in (os.getenv('ADMIN_CHAT_IDS', '') or '').split(','):
+		try:
+			chat_ids.append(int(x))
+		except ValueError:
+			continue
 	try:
-		ADMIN_CHAT_IDS = [int(x) for x in lst]
-	except Exception:
-		ADMIN_CHAT_IDS = []
-	ADMIN_TELEGRAM_ID = None
-	if os.getenv('ADMIN_TELEGRAM_ID'):
+		owner_id = int(os.getenv('ADMIN_TELEGRAM_ID') or 0) or None
+	except ValueError:
+		owner_id = None
+	admins.registry.seed(chat_ids, owner_id)
+
+def parse_recipients(raw):
+	# numeric chat IDs or @usernames; phone numbers are NOT supported by the Bot API
+	recipients = []
+	for item in [x.strip() for x in (raw or '').split(',') if x.strip()]:
 		try:
-			ADMIN_TELEGRAM_ID = int(os.getenv('ADMIN_TELEGRAM_ID'))
-		except Exception:
-			ADMIN_TELEGRAM_ID = None
+			recipients.append(int(item))
+		except ValueError:
+			recipients.append(item if item.startswith('@') else f"@{item}")
+	return recipients
+
+# RECEIPT_CONTENT_HASH=1 also fingerprints receipt contents (costs one download per receipt)
+RECEIPT_CONTENT_HASH = os.getenv('RECEIPT_CONTENT_HASH', '0') == '1'
+# Bot API getFile serves at most 20 MB
+RECEIPT_HASH_MAX_BYTES = 20 * 1024 * 1024
 
-# initial load
-load_admins()
+# Extra receipt recipients besides the admins (comma-separated)
+ADDITIONAL_RECIPIENTS = parse_recipients(os.getenv('ADDITIONAL_RECIPIENTS'))
 
 # Logging
 logging.basicConfig(level=logging.INFO)
 
-# Initialize DB
-init_db(DB_FILE)
-
 # Conversation states
 AMOUNT = 1
+# Users shown per page in the admin users browser
+ADMIN_USERS_PAGE_SIZE = 10
+# Receipts per page in the admin receipt feed (one album holds at most 10)
+RECEIPTS_PAGE_SIZE = 10
 
 # Keyboard
 main_kb = ReplyKeyboardMarkup([["🔗 Referallarım", "💼 Yatırım"], ["📈 Qazancım", "💰 Balans"], ["💸 Çıxarış", "🆘 Dəstək"]], resize_keyboard=True)
@@ -78,473 +99,478 @@ def start(update, context: CallbackContext):
 		f"💰 Sizin qazancınız üçün çalışırıq — uğurlar!"
 	)
 	# If admin, show admin keyboard
-	is_admin = False
-	try:
-		if (ADMIN_TELEGRAM_ID and tg_user.id == ADMIN_TELEGRAM_ID) or (tg_user.id in ADMIN_CHAT_IDS):
-			is_admin = True
-	except Exception:
-		is_admin = False
-	update.message.reply_text(welcome, reply_markup=admin_kb if is_admin else main_kb)
+	update.message.reply_text(welcome, reply_markup=admin_kb if admins.is_admin(tg_user.id) else main_kb)
 
 def help_cmd(update, context):
 	update.message.reply_text('ℹ️ Kömək: Aşağıdakı düymələrdən istifadə edin və sualınız varsa “🆘 Dəstək” bölməsinə yazın.', reply_markup=main_kb)
 
-def handle_text(update, context):
-	text = update.message.text
-	user = get_user_by_telegram(update.effective_user.id)
-	# Allow admin self-activation by sending a secret code (or bot numeric id) in private chat
-	try:
-		txt_strip = text.strip()
-	except Exception:
-		txt_strip = ''
-	admin_setup_code = os.getenv('ADMIN_SETUP_CODE') or os.getenv('ADMIN_TELEGRAM_ID') or ''
-	try:
-		bot_id_str = str(context.bot.id)
-	except Exception:
-		bot_id_str = ''
-	# If admin code was requested via /myid, handle the next message as the code
-	if context.user_data.get('awaiting_admin_code') and update.effective_chat.type == 'private' and txt_strip:
-		# accept either env code, bot id, or hardcoded expected admin code
-		expected = os.getenv('ADMIN_SETUP_CODE') or os.getenv('ADMIN_TELEGRAM_ID') or '8232696082'
-		if txt_strip == expected or (bot_id_str and txt_strip == bot_id_str):
-			# add this user's telegram id to ADMIN_CHAT_IDS and persist to .env
-			try:
-				uid = update.effective_user.id
-				if uid not in ADMIN_CHAT_IDS:
-					ADMIN_CHAT_IDS.append(uid)
-				# persist to .env (update ADMIN_CHAT_IDS line)
-				env_path = os.path.join(os.getcwd(), '.env')
-				try:
-					if os.path.exists(env_path):
-						with open(env_path, 'r', encoding='utf-8') as f:
-							lines = f.readlines()
-					else:
-						lines = []
-					found = False
-					new_lines = []
-					for ln in lines:
-						if ln.strip().startswith('ADMIN_CHAT_IDS='):
-							found = True
-							# build csv
-							existing = ln.split('=',1)[1].strip()
-							if existing:
-								parts = [p.strip() for p in existing.split(',') if p.strip()]
-							else:
-								parts = []
-							if str(uid) not in parts:
-								parts.append(str(uid))
-							new_lines.append('ADMIN_CHAT_IDS=' + ','.join(parts) + '\n')
-						else:
-							new_lines.append(ln)
-					if not found:
-						new_lines.append('\nADMIN_CHAT_IDS=' + str(uid) + '\n')
-					with open(env_path, 'w', encoding='utf-8') as f:
-						f.writelines(new_lines)
-					# reload admin config from .env into memory
-					try:
-						load_admins()
-					except Exception:
-						logging.exception('Failed to reload admins after persisting .env')
-				except Exception:
-					logging.exception('Failed to persist admin to .env')
-				update.message.reply_text('✅ Siz admin olaraq əlavə olundunuz. /start yazın və admin menyunu görün.')
-			except Exception:
-				logging.exception('Error setting admin')
-				update.message.reply_text('Admin əlavə edilərkən xəta baş verdi.')
-		else:
-			update.message.reply_text('Kod doğru deyil. Yenidən /myid yazıb təkrar cəhd edin.')
-		context.user_data.pop('awaiting_admin_code', None)
-		return
-    
-	if update.effective_chat.type == 'private' and txt_strip and (txt_strip == admin_setup_code or (bot_id_str and txt_strip == bot_id_str)):
-		# add this user's telegram id to ADMIN_CHAT_IDS and persist to .env
+# Routing tables: menu buttons by normalized text, callback data by prefix,
+# and the multi-step flows by the user's current state
+user_menu = TextRouter()
+admin_menu = TextRouter()
+callbacks = CallbackRouter()
+text_states = StateRouter()
+ADMIN_CALLBACK_PREFIXES = ('admin_', 'support_reply:')
+
+# Admin self-activation codes, resolved once (the bot id needs getMe)
+ADMIN_SETUP_CODE = os.getenv('ADMIN_SETUP_CODE') or os.getenv('ADMIN_TELEGRAM_ID') or ''
+_admin_codes = None
+
+def admin_codes(bot):
+	global _admin_codes
+	if _admin_codes is None:
 		try:
-			uid = update.effective_user.id
-			if uid not in ADMIN_CHAT_IDS:
-				ADMIN_CHAT_IDS.append(uid)
-			# persist to .env (update ADMIN_CHAT_IDS line)
-			env_path = os.path.join(os.getcwd(), '.env')
-			try:
-				if os.path.exists(env_path):
-					with open(env_path, 'r', encoding='utf-8') as f:
-						lines = f.readlines()
-				else:
-					lines = []
-				found = False
-				new_lines = []
-				for ln in lines:
-					if ln.strip().startswith('ADMIN_CHAT_IDS='):
-						found = True
-						# build csv
-						existing = ln.split('=',1)[1].strip()
-						if existing:
-							parts = [p.strip() for p in existing.split(',') if p.strip()]
-						else:
-							parts = []
-						if str(uid) not in parts:
-							parts.append(str(uid))
-						new_lines.append('ADMIN_CHAT_IDS=' + ','.join(parts) + '\n')
-					else:
-						new_lines.append(ln)
-				if not found:
-					new_lines.append('\nADMIN_CHAT_IDS=' + str(uid) + '\n')
-					with open(env_path, 'w', encoding='utf-8') as f:
-						f.writelines(new_lines)
-				# reload admin config from .env into memory
-				try:
-					load_admins()
-				except Exception:
-					logging.exception('Failed to reload admins after persisting .env')
-			except Exception:
-				logging.exception('Failed to persist admin to .env')
-			update.message.reply_text('✅ Siz admin olaraq əlavə olundunuz. /start yazın və admin menyunu görün.')
+			bot_id = str(bot.id)
 		except Exception:
-			logging.exception('Error setting admin')
-			update.message.reply_text('Admin əlavə edilərkən xəta baş verdi.')
-		return
-	# handle ongoing flows: withdrawal card/name, support message
+			return frozenset(c for c in (ADMIN_SETUP_CODE,) if c)
+		_admin_codes = frozenset(c for c in (ADMIN_SETUP_CODE, bot_id) if c)
+	return _admin_codes
+
+def grant_admin(update):
 	try:
-		txt_strip = text.strip()
+		admins.registry.add(update.effective_user.id, source='setup_code')
+		update.message.reply_text('✅ Siz admin olaraq əlavə olundunuz. /start yazın və admin menyunu görün.')
 	except Exception:
-		txt_strip = ''
+		logging.exception('Error setting admin')
+		update.message.reply_text('Admin əlavə edilərkən xəta baş verdi.')
 
-	# Support flow: if awaiting support message, forward to admins and ack
-	if context.user_data.get('awaiting_support'):
-		context.user_data.pop('awaiting_support', None)
-		# forward to admins
-		for aid in ADMIN_CHAT_IDS:
-			try:
-				uid = update.effective_user.id
-				uname = update.effective_user.username or ''
-				caption = f"📩 Dəstək mesajı\n\n👤 İstifadəçi: @{uname if uname else uid} (ID: {uid})\n\n{txt_strip}\n\n💬 Cavab vermək üçün aşağıdakı düymədən istifadə edin."
-				kb = InlineKeyboardMarkup([[InlineKeyboardButton('✍️ Cavab ver', callback_data=f'support_reply:{uid}')]])
-				context.bot.send_message(chat_id=int(aid), text=caption, reply_markup=kb)
-			except Exception:
-				pass
-		update.message.reply_text('✅ Mesajınız alındı — komandamız tezliklə cavab verəcək. Səbr üçün təşəkkürlər!', reply_markup=main_kb)
+def handle_text(update, context):
+	text = (update.message.text or '').strip()
+	state = text_states.current(context)
+	# Allow admin self-activation by sending the secret code (or bot numeric id) in private chat
+	if state != 'admin_code' and text and update.effective_chat.type == 'private' and text in admin_codes(context.bot):
+		return grant_admin(update)
+	# ongoing flows: admin code, support message, withdrawal card/name, admin message
+	handler = text_states.route(context)
+	if handler:
+		return handler(update, context, text)
+	if admins.is_admin(update.effective_user.id):
+		return (admin_menu.route(text) or admin_unknown)(update, context)
+	handler = user_menu.route(text)
+	if handler is None:
+		update.message.reply_text('Başa düşmədim. Aşağıdakı düymələrdən istifadə edin.', reply_markup=main_kb)
 		return
+	handler(update, context, get_user_by_telegram(update.effective_user.id))
 
-	# Withdrawal flow: expect 16-digit card
-	if context.user_data.get('awaiting_withdraw_card'):
-		if txt_strip.isdigit() and len(txt_strip) == 16:
-			context.user_data.pop('awaiting_withdraw_card', None)
-			context.user_data['withdraw_card'] = txt_strip
-			context.user_data['awaiting_withdraw_name'] = True
-			update.message.reply_text('Kart sahibinin tam ad və soyadını yazın:', reply_markup=main_kb)
-		else:
-			update.message.reply_text('Zəhmət olmasa 16 rəqəmli kart nömrəsini tam yazın (sadəcə rəqəmlər).', reply_markup=main_kb)
-		return
-	if context.user_data.get('awaiting_withdraw_name'):
-		# store name and show amount buttons
-		name = text.strip()
-		context.user_data.pop('awaiting_withdraw_name', None)
-		context.user_data['withdraw_name'] = name
-		kb = InlineKeyboardMarkup([[InlineKeyboardButton('💸 50 AZN', callback_data='withdraw_amt:50'), InlineKeyboardButton('💸 100 AZN', callback_data='withdraw_amt:100'), InlineKeyboardButton('💸 150 AZN', callback_data='withdraw_amt:150')]])
-		# Show card and name in monospaced format so user can easily copy
-		card = context.user_data.get('withdraw_card') or ''
-		info_text = f"Siz qeyd etdiniz:\nKart nömrəsi:\n<code>{card}</code>\nKart sahibi:\n<code>{name}</code>"
-		try:
-			# show an info header and keep monospaced card for copy
-			info_header = '🔒 Kart məlumatı (təhlükəsiz saxlayın)\n\n'
-			update.message.reply_text(info_header + info_text, reply_markup=kb, parse_mode='HTML')
-		except Exception:
-			# fallback without formatting
-			update.message.reply_text(f"Siz qeyd etdiniz:\nKart: {card}\nAd: {name}", reply_markup=kb)
+@text_states.on('admin_code')
+def admin_code_entered(update, context, text):
+	# the code requested via /myid: env code, bot id, or the built-in default
+	text_states.leave(context)
+	if update.effective_chat.type != 'private' or not text:
 		return
+	expected = ADMIN_SETUP_CODE or '8232696082'
+	if text == expected or text in admin_codes(context.bot):
+		grant_admin(update)
+	else:
+		update.message.reply_text('Kod doğru deyil. Yenidən /myid yazıb təkrar cəhd edin.')
 
-	# route admin users to admin handler
-	is_admin = False
+@text_states.on('support')
+def support_message_entered(update, context, text):
+	text_states.leave(context)
+	# forward to admins
 	try:
-		if (ADMIN_TELEGRAM_ID and update.effective_user.id == ADMIN_TELEGRAM_ID) or (update.effective_user.id in ADMIN_CHAT_IDS):
-			is_admin = True
+		uid = update.effective_user.id
+		uname = update.effective_user.username or ''
+		caption = f"📩 Dəstək mesajı\n\n👤 İstifadəçi: @{uname if uname else uid} (ID: {uid})\n\n{text}\n\n💬 Cavab vermək üçün aşağıdakı düymədən istifadə edin."
+		kb = InlineKeyboardMarkup([[InlineKeyboardButton('✍️ Cavab ver', callback_data=f'support_reply:{uid}')]])
+		outbox.send_many(admins.recipients(), caption, reply_markup=kb)
 	except Exception:
-		is_admin = False
-	if is_admin:
-		return handle_admin_text(update, context)
-	text = text.lower()
-	if text in ['referallarım', '🔗 referallarım', '🔗 Referallarım']:
-		refs = get_referrals_of(user['id'])
-		code = user['referral_code']
-		# compute referral earnings: 1 AZN per referal + 10% of their investments
-		ref_count = len(refs)
-		ref_bonus = 0.0
-		for r in refs:
-			try:
-				invs = list_user_investments(r.get('id'))
-				total = sum(float(i.get('amount') or 0) for i in invs)
-				ref_bonus += total * 0.10
-			except Exception:
-				pass
-		ref_bonus += ref_count * 1.0
-		update.message.reply_text(f"Sizin referal kodunuz: {code}\nReferallar sayı: {ref_count}\nReferal qazancı: {ref_bonus:.2f} AZN\nReferal link: https://t.me/{context.bot.username}?start={code}", reply_markup=main_kb)
-		return
-	if text in ['yatırım', '💼 yatırım', '💼 Yatırım']:
-		kb = InlineKeyboardMarkup([[InlineKeyboardButton('💳 50 AZN', callback_data='select_amt:50'), InlineKeyboardButton('💳 100 AZN', callback_data='select_amt:100'), InlineKeyboardButton('💳 150 AZN', callback_data='select_amt:150')]])
-		pay_text = (
-			f"💳 Investisiya seçin:\n\n"
-			f"Ödənişi M10 vasitəsilə göndərin:\n"
-			f"Hesab: {ADMIN_PAYMENT_ACCOUNT}\n"
-			f"Ad: {ADMIN_PAYMENT_NAME}\n\n"
-			f"Ödəniş etdikdən sonra 'Ödənişi təsdiq et' düyməsinə basın.\n\n"
-			f"Beynəlxalq kartınız varsa, Rusiya kartlarına köçürmə seçimi də mövcuddur (bu üsul daha sürətli təsdiq olunur). Məbləği seçdikdən sonra ödəniş təlimatları göstəriləcək."
-		)
-		update.message.reply_text(pay_text, reply_markup=kb)
-		return
-	if text in ['50', '100', '150']:
-		amount = float(text)
-		# Send payment instructions with confirm button
-		pay_text = (
-			f"💳 Investisiya: {int(amount)} AZN\n\n"
-			f"Ödənişi M10 vasitəsilə göndərin:\n"
-			f"Hesab: {ADMIN_PAYMENT_ACCOUNT}\n"
-			f"Ad: {ADMIN_PAYMENT_NAME}\n\n"
-			f"Ödəniş etdikdən sonra aşağıdakı " + '"Təsdiq et"' + " düyməsinə basın.\n"
-			f"Ödəniş yoxlanıldıqdan sonra yatırım hesabınıza əlavə ediləcək."
-		)
-		kb = InlineKeyboardMarkup([[InlineKeyboardButton('✅ Təsdiq et', callback_data=f'confirm_pay:{int(amount)}'), InlineKeyboardButton('❌ Ləğv et', callback_data='cancel_pay')]])
-		update.message.reply_text(pay_text, reply_markup=kb)
-		return
-	if text in ['balans', '💰 balans', '💰 Balans']:
-		update.message.reply_text(f"💰 Balansınız: {user['balance']:.2f} AZN", reply_markup=main_kb)
-		return
-	if text in ['qazancım', '📈 qazancım', '📈 Qazancım']:
-		invs = list_user_investments(user['id'])
-		# only count active investments
-		active_invs = [i for i in invs if int(i.get('active') or 0) == 1]
-		total = sum(float(i.get('amount') or 0) for i in active_invs)
-		# referrals info
-		refs = get_referrals_of(user['id'])
-		ref_count = len(refs)
-		ref_bonus = 0.0
-		for r in refs:
-			try:
-				invs_r = list_user_investments(r.get('id'))
-				total_r = sum(float(i.get('amount') or 0) for i in invs_r if int(i.get('active') or 0) == 1)
-				ref_bonus += total_r * 0.10
-			except Exception:
-				pass
-		ref_bonus += ref_count * 1.0
-		update.message.reply_text(f"📈 Aktiv yatırımlar: {len(active_invs)}\n💼 Cəmi aktiv yatırım: {total:.2f} AZN\n🔗 Referallar: {ref_count} — Referal qazancı: {ref_bonus:.2f} AZN\n💰 Balans: {user['balance']:.2f} AZN", reply_markup=main_kb)
-		return
-	if text in ['çıxarış', '💸 çıxarış', '💸 Çıxarış']:
-		# start withdrawal flow: ask for 16-digit card number
-		context.user_data['awaiting_withdraw_card'] = True
-		update.message.reply_text('💸 Çıxarış üçün 16 rəqəmli bank kart nömrəsini yazın:', reply_markup=main_kb)
-		return
-    
+		logging.exception('Failed to queue support message for admins')
+	update.message.reply_text('✅ Mesajınız alındı — komandamız tezliklə cavab verəcək. Səbr üçün təşəkkürlər!', reply_markup=main_kb)
 
-	if text in ['dəstək', '🆘 dəstək', '🆘 Dəstək']:
-		context.user_data['awaiting_support'] = True
-		update.message.reply_text('🆘 Dəstək üçün mesaj yazın — komandamız tezliklə cavab verəcək. Nə qədər konkret olsanız, o qədər sürətli kömək edə bilərik.', reply_markup=main_kb)
-		return
+@text_states.on('withdraw_card')
+def withdraw_card_entered(update, context, text):
+	# expect a 16-digit card number
+	if text.isdigit() and len(text) == 16:
+		context.user_data['withdraw_card'] = text
+		text_states.enter(context, 'withdraw_name')
+		update.message.reply_text('Kart sahibinin tam ad və soyadını yazın:', reply_markup=main_kb)
+	else:
+		update.message.reply_text('Zəhmət olmasa 16 rəqəmli kart nömrəsini tam yazın (sadəcə rəqəmlər).', reply_markup=main_kb)
+
+@text_states.on('withdraw_name')
+def withdraw_name_entered(update, context, name):
+	# store name and show amount buttons
+	text_states.leave(context)
+	context.user_data['withdraw_name'] = name
+	kb = InlineKeyboardMarkup([[InlineKeyboardButton('💸 50 AZN', callback_data='withdraw_amt:50'), InlineKeyboardButton('💸 100 AZN', callback_data='withdraw_amt:100'), InlineKeyboardButton('💸 150 AZN', callback_data='withdraw_amt:150')]])
+	# Show card and name in monospaced format so user can easily copy
+	card = context.user_data.get('withdraw_card') or ''
+	info_text = f"Siz qeyd etdiniz:\nKart nömrəsi:\n<code>{card}</code>\nKart sahibi:\n<code>{name}</code>"
+	try:
+		# show an info header and keep monospaced card for copy
+		info_header = '🔒 Kart məlumatı (təhlükəsiz saxlayın)\n\n'
+		update.message.reply_text(info_header + info_text, reply_markup=kb, parse_mode='HTML')
+	except Exception:
+		# fallback without formatting
+		update.message.reply_text(f"Siz qeyd etdiniz:\nKart: {card}\nAd: {name}", reply_markup=kb)
+
+@user_menu.on('🔗 Referallarım')
+def show_referrals(update, context, user):
+	stats = get_referral_stats(user['id'])
+	code = user['referral_code']
+	# referral earnings (1 AZN per referal + 10% of their active investments) are kept in referral_stats
+	ref_count = stats['referral_count']
+	ref_bonus = stats['earned_bonus']
+	update.message.reply_text(f"Sizin referal kodunuz: {code}\nReferallar sayı: {ref_count}\nReferal qazancı: {ref_bonus:.2f} AZN\nReferal link: https://t.me/{context.bot.username}?start={code}", reply_markup=main_kb)
+
+@user_menu.on('💼 Yatırım')
+def show_invest_menu(update, context, user):
+	kb = InlineKeyboardMarkup([[InlineKeyboardButton('💳 50 AZN', callback_data='select_amt:50'), InlineKeyboardButton('💳 100 AZN', callback_data='select_amt:100'), InlineKeyboardButton('💳 150 AZN', callback_data='select_amt:150')]])
+	pay_text = (
+		f"💳 Investisiya seçin:\n\n"
+		f"Ödənişi M10 vasitəsilə göndərin:\n"
+		f"Hesab: {ADMIN_PAYMENT_ACCOUNT}\n"
+		f"Ad: {ADMIN_PAYMENT_NAME}\n\n"
+		f"Ödəniş etdikdən sonra 'Ödənişi təsdiq et' düyməsinə basın.\n\n"
+		f"Beynəlxalq kartınız varsa, Rusiya kartlarına köçürmə seçimi də mövcuddur (bu üsul daha sürətli təsdiq olunur). Məbləği seçdikdən sonra ödəniş təlimatları göstəriləcək."
+	)
+	update.message.reply_text(pay_text, reply_markup=kb)
 
-	update.message.reply_text('Başa düşmədim. Aşağıdakı düymələrdən istifadə edin.', reply_markup=main_kb)
+@user_menu.on('50', '100', '150')
+def show_payment_instructions(update, context, user):
+	amount = float(normalize(update.message.text))
+	# Send payment instructions with confirm button
+	pay_text = (
+		f"💳 Investisiya: {int(amount)} AZN\n\n"
+		f"Ödənişi M10 vasitəsilə göndərin:\n"
+		f"Hesab: {ADMIN_PAYMENT_ACCOUNT}\n"
+		f"Ad: {ADMIN_PAYMENT_NAME}\n\n"
+		f"Ödəniş etdikdən sonra aşağıdakı " + '"Təsdiq et"' + " düyməsinə basın.\n"
+		f"Ödəniş yoxlanıldıqdan sonra yatırım hesabınıza əlavə ediləcək."
+	)
+	kb = InlineKeyboardMarkup([[InlineKeyboardButton('✅ Təsdiq et', callback_data=f'confirm_pay:{int(amount)}'), InlineKeyboardButton('❌ Ləğv et', callback_data='cancel_pay')]])
+	update.message.reply_text(pay_text, reply_markup=kb)
+
+@user_menu.on('💰 Balans')
+def show_balance(update, context, user):
+	update.message.reply_text(f"💰 Balansınız: {user['balance']:.2f} AZN", reply_markup=main_kb)
+
+@user_menu.on('📈 Qazancım')
+def show_earnings(update, context, user):
+	invs = list_user_investments(user['id'])
+	# only count active investments
+	active_invs = [i for i in invs if int(i.get('active') or 0) == 1]
+	total = sum(float(i.get('amount') or 0) for i in active_invs)
+	# referrals info
+	stats = get_referral_stats(user['id'])
+	ref_count = stats['referral_count']
+	ref_bonus = stats['earned_bonus']
+	update.message.reply_text(f"📈 Aktiv yatırımlar: {len(active_invs)}\n💼 Cəmi aktiv yatırım: {total:.2f} AZN\n🔗 Referallar: {ref_count} — Referal qazancı: {ref_bonus:.2f} AZN\n💰 Balans: {user['balance']:.2f} AZN", reply_markup=main_kb)
+
+@user_menu.on('💸 Çıxarış')
+def start_withdrawal(update, context, user):
+	# start withdrawal flow: ask for 16-digit card number
+	text_states.enter(context, 'withdraw_card')
+	update.message.reply_text('💸 Çıxarış üçün 16 rəqəmli bank kart nömrəsini yazın:', reply_markup=main_kb)
+
+@user_menu.on('🆘 Dəstək')
+def start_support(update, context, user):
+	text_states.enter(context, 'support')
+	update.message.reply_text('🆘 Dəstək üçün mesaj yazın — komandamız tezliklə cavab verəcək. Nə qədər konkret olsanız, o qədər sürətli kömək edə bilərik.', reply_markup=main_kb)
 
 def error_handler(update, context):
 	logging.exception('Exception while handling update: %s', context.error)
 
 
-def confirm_payment_cb(update, context: CallbackContext):
+def route_callback(update, context: CallbackContext):
 	query = update.callback_query
 	query.answer()
-	data = query.data
-	user = get_user_by_telegram(query.from_user.id)
-	# handle selection of amount button
-	if data.startswith('select_amt:'):
-		try:
-			amt = float(data.split(':', 1)[1])
-		except Exception:
-			query.edit_message_text('Xəta: məbləğ oxunmadı.', reply_markup=main_kb)
-			return
-		# edit message to add more payment info and present confirm/cancel
-		new_text = query.message.text + "\n\nRusiya kartlarına köçürmə"
-		kb = InlineKeyboardMarkup([[InlineKeyboardButton('Ödənişi təsdiq et', callback_data=f'confirm_pay:{int(amt)}'), InlineKeyboardButton('Ləğv et', callback_data='cancel_pay')]])
-		try:
-			query.edit_message_text(new_text, reply_markup=kb)
-		except Exception:
-			try:
-				query.message.reply_text(new_text, reply_markup=kb)
-			except Exception:
-				pass
+	# admin screens only answer admins
+	if (query.data or '').startswith(ADMIN_CALLBACK_PREFIXES) and not admins.is_admin(query.from_user.id):
 		return
-	if data == 'cancel_pay':
-		query.edit_message_text('Maliyyə çətinliyinizi başa düşürük — biz məhz bunun üçün burdayıq. Lazım olsa, komandamızla əlaqə saxlayın.')
-		try:
-			query.message.reply_text('Əsas menyu:', reply_markup=main_kb)
-		except Exception:
-			pass
+	handler, arg = callbacks.route(query.data)
+	if handler:
+		with metrics.handler_seconds.time(handler.__name__):
+			handler(update, context, arg)
+
+@callbacks.on('select_amt:')
+def select_amount_cb(update, context, arg):
+	# selection of amount button: add more payment info and present confirm/cancel
+	query = update.callback_query
+	try:
+		amt = float(arg)
+	except Exception:
+		query.edit_message_text('Xəta: məbləğ oxunmadı.', reply_markup=main_kb)
 		return
-	if data.startswith('confirm_pay:'):
-		try:
-			amt = float(data.split(':', 1)[1])
-		except Exception:
-			query.edit_message_text('Xəta: məbləğ oxunmadı.', reply_markup=main_kb)
-			return
-		# Create pending investment and ask for receipt
-		inv_id = add_investment(user['id'], amt, f"plan_{int(amt)}")
-		context.user_data['pending_investment'] = inv_id
-		# edit the inline message (no reply keyboard) and ask user to upload receipt
-		try:
-			query.edit_message_text(f'✅ Qəbul edildi — {int(amt)} AZN üçün yatırma qeydə alındı. Zəhmət olmasa ödəmə qəbzini (şəkil və ya sənəd) göndərin.')
-		except Exception:
-			pass
-		# provide an inline prompt button to remind user to upload receipt
-		kb_upload = InlineKeyboardMarkup([[InlineKeyboardButton('📎 Qəbz əlavə et', callback_data=f'prompt_upload:{inv_id}')]])
+	new_text = query.message.text + "\n\nRusiya kartlarına köçürmə"
+	kb = InlineKeyboardMarkup([[InlineKeyboardButton('Ödənişi təsdiq et', callback_data=f'confirm_pay:{int(amt)}'), InlineKeyboardButton('Ləğv et', callback_data='cancel_pay')]])
+	try:
+		query.edit_message_text(new_text, reply_markup=kb)
+	except Exception:
 		try:
-			query.message.reply_text('📎 Qəbzi yükləyin: şəkil və ya sənəd göndərin.', reply_markup=kb_upload)
+			query.message.reply_text(new_text, reply_markup=kb)
 		except Exception:
 			pass
-		# confirmation message for user (additional friendly text)
-		try:
-			context.bot.send_message(chat_id=user['telegram_id'], text='💰 Təşəkkürlər! Investisiyanız qəbul edildi. Maliyyə şöbəsi təsdiq etdikdə sizə məlumat göndərəcəyik — uğurlar və bol qazanc! 🚀')
-		except Exception:
-			try:
-				query.message.reply_text('💰 Təşəkkürlər! Investisiyanız qəbul edildi. Maliyyə şöbəsi təsdiq etdikdə sizə məlumat göndərəcəyik — uğurlar və bol qazanc! 🚀')
-			except Exception:
-				pass
-		# finally send main menu as normal message
+
+@callbacks.on('cancel_pay', exact=True)
+def cancel_payment_cb(update, context, arg):
+	query = update.callback_query
+	query.edit_message_text('Maliyyə çətinliyinizi başa düşürük — biz məhz bunun üçün burdayıq. Lazım olsa, komandamızla əlaqə saxlayın.')
+	try:
+		query.message.reply_text('Əsas menyu:', reply_markup=main_kb)
+	except Exception:
+		pass
+
+@callbacks.on('confirm_pay:')
+def confirm_payment_cb(update, context, arg):
+	query = update.callback_query
+	try:
+		amt = float(arg)
+	except Exception:
+		query.edit_message_text('Xəta: məbləğ oxunmadı.', reply_markup=main_kb)
+		return
+	user = get_user_by_telegram(query.from_user.id)
+	# Create pending investment and ask for receipt
+	inv_id = add_investment(user['id'], amt, f"plan_{int(amt)}")
+	context.user_data['pending_investment'] = inv_id
+	# edit the inline message (no reply keyboard) and ask user to upload receipt
+	try:
+		query.edit_message_text(f'✅ Qəbul edildi — {int(amt)} AZN üçün yatırma qeydə alındı. Zəhmət olmasa ödəmə qəbzini (şəkil və ya sənəd) göndərin.')
+	except Exception:
+		pass
+	# provide an inline prompt button to remind user to upload receipt
+	kb_upload = InlineKeyboardMarkup([[InlineKeyboardButton('📎 Qəbz əlavə et', callback_data=f'prompt_upload:{inv_id}')]])
+	try:
+		query.message.reply_text('📎 Qəbzi yükləyin: şəkil və ya sənəd göndərin.', reply_markup=kb_upload)
+	except Exception:
+		pass
+	# confirmation message for user (additional friendly text)
+	try:
+		context.bot.send_message(chat_id=user['telegram_id'], text='💰 Təşəkkürlər! Investisiyanız qəbul edildi. Maliyyə şöbəsi təsdiq etdikdə sizə məlumat göndərəcəyik — uğurlar və bol qazanc! 🚀')
+	except Exception:
 		try:
-			query.message.reply_text('Əsas menyu:', reply_markup=main_kb)
+			query.message.reply_text('💰 Təşəkkürlər! Investisiyanız qəbul edildi. Maliyyə şöbəsi təsdiq etdikdə sizə məlumat göndərəcəyik — uğurlar və bol qazanc! 🚀')
 		except Exception:
 			pass
+	# finally send main menu as normal message
+	try:
+		query.message.reply_text('Əsas menyu:', reply_markup=main_kb)
+	except Exception:
+		pass
 
-def admin_cb(update, context: CallbackContext):
-	query = update.callback_query
-	query.answer()
-	data = query.data
+@callbacks.on('admin_user:')
+def admin_user_cb(update, context, arg):
 	# admin: view user details
-	if data.startswith('admin_user:'):
+	query = update.callback_query
+	try:
+		uid = int(arg)
+	except Exception:
+		query.edit_message_text('İstifadəçi tapılmadı.')
+		return
+	u = get_user_by_id(uid)
+	if not u:
+		query.edit_message_text('İstifadəçi tapılmadı.')
+		return
+	# check pending
+	has_pending = has_pending_investment(uid)
+	txt = f"İstifadəçi: {u.get('username') or ''}\nID: {u.get('id')}\nTelegram ID: {u.get('telegram_id')}\nBalans: {u.get('balance'):.2f} AZN\nReferal ID: {u.get('referrer_id') or '—'}\nPending ödəniş: {'🔴 Var' if has_pending else '🟢 Yox'}"
+	kb = InlineKeyboardMarkup([
+		[InlineKeyboardButton('✉️ Mesaj göndər', callback_data=f'admin_msg:{uid}'), InlineKeyboardButton('🛒 Alış et', callback_data=f'admin_alish:{uid}')],
+		[InlineKeyboardButton('◀️ Geri', callback_data='admin_back')]
+	])
+	query.edit_message_text(txt, reply_markup=kb)
+
+@callbacks.on('admin_users:')
+def admin_users_cb(update, context, arg):
+	# users browser paging: admin_users:next:<last id> / admin_users:prev:<first id>
+	query = update.callback_query
+	try:
+		direction, ref_id = arg.split(':')
+		ref_id = int(ref_id)
+	except Exception:
+		query.edit_message_text('Səhifə tapılmadı.')
+		return
+	if direction == 'next':
+		page = list_users_page(before_id=ref_id, limit=ADMIN_USERS_PAGE_SIZE)
+	else:
+		page = list_users_page(after_id=ref_id, limit=ADMIN_USERS_PAGE_SIZE)
+	if not page['users']:
+		return
+	txt, kb = render_users_page(page)
+	query.edit_message_text(txt, reply_markup=kb)
+
+@callbacks.on('admin_back', exact=True)
+def admin_back_cb(update, context, arg):
+	query = update.callback_query
+	query.edit_message_text('🧾 Admin menyu', reply_markup=None)
+	query.message.reply_text('👑 Admin menyu:', reply_markup=admin_kb)
+
+@callbacks.on('support_reply:')
+def support_reply_cb(update, context, arg):
+	# admin clicked reply on a forwarded support message
+	query = update.callback_query
+	try:
+		uid = int(arg)
+	except Exception:
+		query.edit_message_text('İstifadəçi tapılmadı.')
+		return
+	# send this admin's next message to uid (telegram id)
+	context.user_data['admin_msg_target'] = uid
+	text_states.enter(context, 'admin_msg')
+	query.edit_message_text(f'İndi mesaj yazın — bu mesaj seçilmiş istifadəçiyə göndəriləcək (Telegram ID {uid}).')
+
+@callbacks.on('admin_msg:')
+def admin_msg_cb(update, context, arg):
+	query = update.callback_query
+	try:
+		uid = int(arg)
+	except Exception:
+		query.edit_message_text('Hedef istifadəçi tapılmadı.')
+		return
+	# uid here is the DB user id; map to telegram_id
+	u = get_user_by_id(uid)
+	if not u:
+		query.edit_message_text('Hedef istifadəçi tapılmadı (db record yoxdur).')
+		return
+	tg = u.get('telegram_id')
+	if not tg:
+		query.edit_message_text('Hedef istifadəçinin Telegram ID-si tapılmadı.')
+		return
+	context.user_data['admin_msg_target'] = tg
+	text_states.enter(context, 'admin_msg')
+	# show helpful text with username if available
+	query.edit_message_text(f'İndi mesaj yazın — bu mesaj seçilmiş istifadəçiyə göndəriləcək (Telegram ID {tg}, username: @{u.get("username") or "—"}).')
+
+@callbacks.on('admin_alish:')
+def admin_alish_cb(update, context, arg):
+	query = update.callback_query
+	try:
+		uid = int(arg)
+	except Exception:
+		query.edit_message_text('Hedef istifadəçi tapılmadı.')
+		return
+	kb = InlineKeyboardMarkup([[InlineKeyboardButton('50 AZN', callback_data=f'admin_buy:{uid}:50'), InlineKeyboardButton('100 AZN', callback_data=f'admin_buy:{uid}:100'), InlineKeyboardButton('150 AZN', callback_data=f'admin_buy:{uid}:150')]])
+	query.edit_message_text(f'İstifadəçi ID {uid} üçün plan seçin:', reply_markup=kb)
+
+@callbacks.on('admin_buy:')
+def admin_buy_cb(update, context, arg):
+	query = update.callback_query
+	try:
+		uid, amt = arg.split(':')
+		uid = int(uid); amt = float(amt)
+	except Exception:
+		query.edit_message_text('Parametr xətası.')
+		return
+	# create active investment for user so it appears in qazancım
+	add_active_investment(uid, amt, f'plan_{int(amt)}')
+	# notify admin and user (map DB id -> telegram id)
+	query.edit_message_text(f'{amt:.0f} AZN aktiv yatırım istifadəçiyə əlavə edildi.')
+	u_row = get_user_by_id(uid)
+	if u_row and u_row.get('telegram_id'):
 		try:
-			uid = int(data.split(':',1)[1])
+			context.bot.send_message(chat_id=u_row.get('telegram_id'), text=f'✅ Admin tərəfindən sizin hesabınıza {int(amt)} AZN investisiya əlavə edildi.')
 		except Exception:
-			query.edit_message_text('İstifadəçi tapılmadı.')
-			return
-		u = get_user_by_id(uid)
-		if not u:
-			query.edit_message_text('İstifadəçi tapılmadı.')
-			return
-		# check pending
-		pending = get_pending_investments()
-		has_pending = any(p['user_id']==uid for p in pending)
-		txt = f"İstifadəçi: {u.get('username') or ''}\nID: {u.get('id')}\nTelegram ID: {u.get('telegram_id')}\nBalans: {u.get('balance'):.2f} AZN\nReferal ID: {u.get('referrer_id') or '—'}\nPending ödəniş: {'🔴 Var' if has_pending else '🟢 Yox'}"
-		kb = InlineKeyboardMarkup([
-			[InlineKeyboardButton('✉️ Mesaj göndər', callback_data=f'admin_msg:{uid}'), InlineKeyboardButton('🛒 Alış et', callback_data=f'admin_alish:{uid}')],
-			[InlineKeyboardButton('◀️ Geri', callback_data='admin_back')]
-		])
-		query.edit_message_text(txt, reply_markup=kb)
-		return
-	if data == 'admin_back':
-		query.edit_message_text('🧾 Admin menyu', reply_markup=None)
-		query.message.reply_text('👑 Admin menyu:', reply_markup=admin_kb)
-		return
-	if data.startswith('support_reply:'):
-		# admin clicked reply on a forwarded support message
+			logging.exception('Failed to notify user about admin_buy')
+	else:
+		logging.info('admin_buy: could not find telegram_id for user id %s', uid)
+
+@callbacks.on('admin_payments', exact=True)
+@callbacks.on('admin_receipts:')
+def admin_receipts_cb(update, context, arg):
+	# receipt review feed: admin_payments is the newest page, admin_receipts:<id> pages to older ones
+	query = update.callback_query
+	before_id = None
+	if arg:
 		try:
-			uid = int(data.split(':',1)[1])
+			before_id = int(arg)
 		except Exception:
-			query.edit_message_text('İstifadəçi tapılmadı.')
+			query.edit_message_text('Səhifə tapılmadı.')
 			return
-		# set this admin's context to send the next message to uid (telegram id)
-		context.user_data['admin_msg_target'] = uid
-		query.edit_message_text(f'İndi mesaj yazın — bu mesaj seçilmiş istifadəçiyə göndəriləcək (Telegram ID {uid}).')
+	receipts = list_receipts_page(before_id, limit=RECEIPTS_PAGE_SIZE)
+	if not receipts:
+		query.edit_message_text('Hələ heç bir qəbz yoxdur.' if before_id is None else 'Daha köhnə qəbz yoxdur.')
 		return
-	if data.startswith('admin_msg:'):
-		try:
-			uid = int(data.split(':',1)[1])
-		except Exception:
-			query.edit_message_text('Hedef istifadəçi tapılmadı.')
-			return
-		# uid here is the DB user id; map to telegram_id
-		u = get_user_by_id(uid)
-		if not u:
-			query.edit_message_text('Hedef istifadəçi tapılmadı (db record yoxdur).')
-			return
-		tg = u.get('telegram_id')
-		if not tg:
-			query.edit_message_text('Hedef istifadəçinin Telegram ID-si tapılmadı.')
-			return
-		context.user_data['admin_msg_target'] = tg
-		# show helpful text with username if available
-		query.edit_message_text(f'İndi mesaj yazın — bu mesaj seçilmiş istifadəçiyə göndəriləcək (Telegram ID {tg}, username: @{u.get("username") or "—"}).')
+	send_receipts_page(context.bot, update.effective_chat.id, receipts)
+	if before_id is None:
+		query.edit_message_text(f'Son {len(receipts)} qəbz göndərildi.')
+	else:
+		# the previous page keeps its verify buttons; only its "older" cursor is spent
+		_drop_older_button(query)
+
+def _drop_older_button(query):
+	markup = query.message.reply_markup if query.message else None
+	if not markup:
 		return
-	if data.startswith('admin_alish:'):
-		try:
-			uid = int(data.split(':',1)[1])
-		except Exception:
-			query.edit_message_text('Hedef istifadəçi tapılmadı.')
-			return
-		kb = InlineKeyboardMarkup([[InlineKeyboardButton('50 AZN', callback_data=f'admin_buy:{uid}:50'), InlineKeyboardButton('100 AZN', callback_data=f'admin_buy:{uid}:100'), InlineKeyboardButton('150 AZN', callback_data=f'admin_buy:{uid}:150')]])
-		query.edit_message_text(f'İstifadəçi ID {uid} üçün plan seçin:', reply_markup=kb)
+	rows = [[b for b in row if not (b.callback_data or '').startswith('admin_receipts:')] for row in markup.inline_keyboard]
+	rows = [row for row in rows if row]
+	try:
+		query.edit_message_reply_markup(reply_markup=InlineKeyboardMarkup(rows) if rows else None)
+	except Exception:
+		logging.exception('Failed to update receipts page markup')
+
+@callbacks.on('admin_verify:')
+def admin_verify_cb(update, context, arg):
+	query = update.callback_query
+	try:
+		inv_id = int(arg)
+	except Exception:
+		query.edit_message_text('Invalid invest id')
 		return
-	if data.startswith('admin_buy:'):
-		parts = data.split(':')
-		try:
-			uid = int(parts[1]); amt = float(parts[2])
-		except Exception:
-			query.edit_message_text('Parametr xətası.')
-			return
-		# create active investment for user so it appears in qazancım
-		add_active_investment(uid, amt, f'plan_{int(amt)}')
-		# notify admin and user (map DB id -> telegram id)
-		query.edit_message_text(f'{amt:.0f} AZN aktiv yatırım istifadəçiyə əlavə edildi.')
-		u_row = get_user_by_id(uid)
+	inv = get_investment_by_id(inv_id)
+	if not inv:
+		query.edit_message_text('Invest tapılmadı.')
+		return
+	if inv.get('active') == 1:
+		query.edit_message_text('Artıq aktivdir.')
+		return
+	with transaction():
+		# activation is the guard: only one concurrent verify gets to credit
+		activated = mark_investment_active(inv_id)
+		if activated:
+			update_user_balance(inv.get('user_id'), float(inv.get('amount') or 0), 'deposit', f'investment:{inv_id}')
+	if not activated:
+		query.edit_message_text('Artıq aktivdir.')
+		return
+	query.edit_message_text(f'✅ Invest {inv_id} təsdiq edildi və balans yeniləndi.')
+	# notify user by Telegram ID (map DB user id -> telegram_id)
+	try:
+		u_row = get_user_by_id(inv.get('user_id'))
 		if u_row and u_row.get('telegram_id'):
-			try:
-				context.bot.send_message(chat_id=u_row.get('telegram_id'), text=f'✅ Admin tərəfindən sizin hesabınıza {int(amt)} AZN investisiya əlavə edildi.')
-			except Exception:
-				logging.exception('Failed to notify user about admin_buy')
+			context.bot.send_message(chat_id=u_row.get('telegram_id'), text=f'🎉 Uğurlu! Sizin yatırımınız (ID {inv_id}) admin tərəfindən təsdiq edildi. Bol qazanc! 💰')
 		else:
-			logging.info('admin_buy: could not find telegram_id for user id %s', uid)
-		return
-	if data == 'admin_payments':
-		# show receipts
-		receipts = get_all_receipts()
-		if not receipts:
-			query.edit_message_text('Hələ heç bir qəbz yoxdur.')
-			return
-		# send a list and inline open buttons
-		for r in receipts[:20]:
-			inv = get_investment_by_id(r.get('investment_id'))
-			u = get_user_by_id(r.get('user_id'))
-			caption = f"📎 Qəbz ID: {r.get('id')}\n👤 İstifadəçi ID: {u.get('id') if u else r.get('user_id')}\n💼 Invest ID: {r.get('investment_id')}\n💰 Məbləğ: {inv.get('amount') if inv else '—'} AZN"
+			logging.info('admin_verify: telegram_id not found for user %s', inv.get('user_id'))
+	except Exception:
+		logging.exception('Failed to notify user after admin_verify')
+
+
+def send_receipts_page(bot, chat_id, receipts):
+	# photos and documents go out as albums (max 10 per album, types can't be mixed),
+	# followed by one message with the verify buttons and the "older" cursor
+	photos, documents = [], []
+	for r in receipts:
+		caption = f"📎 Qəbz ID: {r.get('id')}\n👤 İstifadəçi ID: {r.get('user_id')}\n💼 Invest ID: {r.get('investment_id')}\n💰 Məbləğ: {r.get('amount') if r.get('amount') is not None else '—'} AZN"
+		if r.get('duplicate_of'):
+			caption += f"\n⚠️ Təkrar: Qəbz ID {r.get('duplicate_of')}"
+		if r.get('file_type') == 'photo':
+			photos.append(InputMediaPhoto(r.get('file_id'), caption=caption))
+		else:
+			documents.append(InputMediaDocument(r.get('file_id'), caption=caption))
+	for media in (photos, documents):
+		for i in range(0, len(media), 10):
+			group = media[i:i + 10]
 			try:
-				if r.get('file_type') == 'photo':
-					context.bot.send_photo(chat_id=update.effective_chat.id, photo=r.get('file_id'), caption=caption, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('✅ Təsdiq et', callback_data=f'admin_verify:{r.get("investment_id")}'), InlineKeyboardButton('◀️ Geri', callback_data='admin_back')]]))
+				if len(group) == 1:
+					item = group[0]
+					if isinstance(item, InputMediaPhoto):
+						bot.send_photo(chat_id=chat_id, photo=item.media, caption=item.caption)
+					else:
+						bot.send_document(chat_id=chat_id, document=item.media, caption=item.caption)
 				else:
-					context.bot.send_document(chat_id=update.effective_chat.id, document=r.get('file_id'), caption=caption, reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton('✅ Təsdiq et', callback_data=f'admin_verify:{r.get("investment_id")}'), InlineKeyboardButton('◀️ Geri', callback_data='admin_back')]]))
+					bot.send_media_group(chat_id=chat_id, media=group)
 			except Exception:
-				logging.exception('Failed to send receipt to admin view')
-		query.edit_message_text('Göndərdim (əgər çoxdursa, ən son 20 göstərildi).')
-		return
-	if data.startswith('admin_verify:'):
-		try:
-			inv_id = int(data.split(':',1)[1])
-		except Exception:
-			query.edit_message_text('Invalid invest id')
-			return
-		inv = get_investment_by_id(inv_id)
-		if not inv:
-			query.edit_message_text('Invest tapılmadı.')
-			return
-		if inv.get('active') == 1:
-			query.edit_message_text('Artıq aktivdir.')
-			return
-		mark_investment_active(inv_id)
-		update_user_balance(inv.get('user_id'), float(inv.get('amount') or 0))
-		query.edit_message_text(f'✅ Invest {inv_id} təsdiq edildi və balans yeniləndi.')
-		# notify user by Telegram ID (map DB user id -> telegram_id)
-		try:
-			u_row = get_user_by_id(inv.get('user_id'))
-			if u_row and u_row.get('telegram_id'):
-				context.bot.send_message(chat_id=u_row.get('telegram_id'), text=f'🎉 Uğurlu! Sizin yatırımınız (ID {inv_id}) admin tərəfindən təsdiq edildi. Bol qazanc! 💰')
-			else:
-				logging.info('admin_verify: telegram_id not found for user %s', inv.get('user_id'))
-		except Exception:
-			logging.exception('Failed to notify user after admin_verify')
-		return
+				logging.exception('Failed to send receipt album to admin view')
+	buttons = [InlineKeyboardButton(f"✅ Qəbz {r.get('id')}", callback_data=f"admin_verify:{r.get('investment_id')}") for r in receipts if r.get('investment_active') == 0]
+	rows = [buttons[i:i + 3] for i in range(0, len(buttons), 3)]
+	nav = [InlineKeyboardButton('◀️ Geri', callback_data='admin_back')]
+	if len(receipts) == RECEIPTS_PAGE_SIZE:
+		nav.append(InlineKeyboardButton('Köhnələr ▶️', callback_data=f"admin_receipts:{receipts[-1].get('id')}"))
+	rows.append(nav)
+	pending = len(buttons)
+	bot.send_message(chat_id=chat_id, text=f"📥 Qəbzlər: {len(receipts)} göstərildi, təsdiq gözləyən: {pending}", reply_markup=InlineKeyboardMarkup(rows))
 
 
-def forward_receipt_to_admins(bot, from_user, investment, file_id, file_type, caption_extra: str = ''):
+def forward_receipt_to_admins(from_user, investment, file_id, file_type, caption_extra: str = ''):
 	caption = (
 		f"📥 Yeni ödəmə qəbzi\n\n"
 		f"👤 İstifadəçi: {from_user.get('username') or from_user.get('telegram_id')}\n"
@@ -552,52 +578,23 @@ def forward_receipt_to_admins(bot, from_user, investment, file_id, file_type, ca
 		f"💰 Məbləğ: {investment.get('amount')} AZN\n"
 		f"{caption_extra}"
 	)
-	# Send to configured admin chat ids
-	for aid in ADMIN_CHAT_IDS:
-		try:
-			# try as int
-			chat_id = int(aid)
-		except Exception:
-			continue
-		try:
-			if file_type == 'photo':
-				bot.send_photo(chat_id=chat_id, photo=file_id, caption=caption)
-			else:
-				bot.send_document(chat_id=chat_id, document=file_id, caption=caption)
-		except Exception as e:
-			logging.exception('Failed to forward receipt to admin %s: %s', aid, e)
-
-	# Also send to any additional recipients listed in env ADDITIONAL_RECIPIENTS (comma-separated)
-	# Items can be numeric chat IDs or @usernames. Phone numbers are NOT supported by Bot API.
-	extra = os.getenv('ADDITIONAL_RECIPIENTS', '') or ''
-	for item in [x.strip() for x in extra.split(',') if x.strip()]:
-		# try numeric id first
-		try:
-			chat = int(item)
-		except Exception:
-			# ensure username starts with @
-			chat = item if item.startswith('@') else f"@{item}"
-		try:
-			if file_type == 'photo':
-				bot.send_photo(chat_id=chat, photo=file_id, caption=caption)
-			else:
-				bot.send_document(chat_id=chat, document=file_id, caption=caption)
-		except Exception:
-			logging.exception('Failed to forward receipt to additional recipient %s', item)
+	# admins that receive notifications, plus ADDITIONAL_RECIPIENTS
+	recipients = list(admins.recipients()) + ADDITIONAL_RECIPIENTS
+	try:
+		if file_type == 'photo':
+			outbox.send_many(recipients, caption, method='send_photo', photo=file_id)
+		else:
+			outbox.send_many(recipients, caption, method='send_document', document=file_id)
+	except Exception:
+		logging.exception('Failed to queue receipt for admins')
 
 
-def withdraw_cb(update, context: CallbackContext):
+@callbacks.on('withdraw_amt:')
+def withdraw_cb(update, context, arg):
 	query = update.callback_query
-	query.answer()
+	logging.info('withdraw_cb triggered; data=%s user=%s', query.data, query.from_user.id)
 	try:
-		logging.info('withdraw_cb triggered; data=%s user=%s', query.data, query.from_user.id)
-	except Exception:
-		pass
-	data = query.data
-	if not data.startswith('withdraw_amt:'):
-		return
-	try:
-		amt = float(data.split(':',1)[1])
+		amt = float(arg)
 	except Exception:
 		query.edit_message_text('Xəta: məbləğ oxunmadı.')
 		return
@@ -615,11 +612,7 @@ def withdraw_cb(update, context: CallbackContext):
 			pass
 		# notify admins about insufficient attempt (optional)
 		try:
-			for aid in ADMIN_CHAT_IDS:
-				try:
-					context.bot.send_message(chat_id=int(aid), text=f"⚠️ Çıxarış cəhdi: istifadəçi {query.from_user.id} seçdi {amt:.2f} AZN amma balans yetərli deyil.")
-				except Exception:
-					pass
+			outbox.send_many(admins.recipients(), f"⚠️ Çıxarış cəhdi: istifadəçi {query.from_user.id} seçdi {amt:.2f} AZN amma balans yetərli deyil.")
 		except Exception:
 			pass
 		return
@@ -653,23 +646,20 @@ def withdraw_cb(update, context: CallbackContext):
 		card = context.user_data.get('withdraw_card')
 		name = context.user_data.get('withdraw_name')
 		try:
-			for aid in ADMIN_CHAT_IDS:
-				try:
-					msg = f"ℹ️ Gözləmə: İstifadəçi {query.from_user.id} çıxarış üçün {amt:.2f} AZN seçdi. Qeydiyyatdan sonra {days_passed}/10 tamamlanıb — {remaining} gün gözləmə var."
-					if card:
-						msg += f"\nKart: {card}"
-					if name:
-						msg += f"\nAd: {name}"
-					context.bot.send_message(chat_id=int(aid), text=msg)
-				except Exception:
-					pass
+			msg = f"ℹ️ Gözləmə: İstifadəçi {query.from_user.id} çıxarış üçün {amt:.2f} AZN seçdi. Qeydiyyatdan sonra {days_passed}/10 tamamlanıb — {remaining} gün gözləmə var."
+			if card:
+				msg += f"\nKart: {card}"
+			if name:
+				msg += f"\nAd: {name}"
+			outbox.send_many(admins.recipients(), msg)
 		except Exception:
 			pass
 		return
 	# proceed with withdrawal
 	try:
-		add_withdrawal_request(user.get('id'), amt)
-		update_user_balance(user.get('id'), -amt)
+		with transaction():
+			wd_id = add_withdrawal_request(user.get('id'), amt)
+			update_user_balance(user.get('id'), -amt, 'withdrawal', f'withdrawal:{wd_id}')
 		query.edit_message_text(f'Çıxarış sorğunuz qəbul edildi: {amt} AZN')
 		try:
 			query.message.reply_text('Əsas menyu:', reply_markup=main_kb)
@@ -679,50 +669,26 @@ def withdraw_cb(update, context: CallbackContext):
 		card = context.user_data.get('withdraw_card')
 		name = context.user_data.get('withdraw_name')
 		try:
-			for aid in ADMIN_CHAT_IDS:
-				try:
-					msg = f"✅ Yeni çıxarış sorğusu:\nİstifadəçi: {query.from_user.id}\nMəbləğ: {amt:.2f} AZN"
-					if name:
-						msg += f"\nAd: {name}"
-					if card:
-						msg += f"\nKart: {card}"
-					context.bot.send_message(chat_id=int(aid), text=msg)
-				except Exception:
-					pass
+			msg = f"✅ Yeni çıxarış sorğusu:\nİstifadəçi: {query.from_user.id}\nMəbləğ: {amt:.2f} AZN"
+			if name:
+				msg += f"\nAd: {name}"
+			if card:
+				msg += f"\nKart: {card}"
+			outbox.send_many(admins.recipients(), msg)
 		except Exception:
 			pass
 	except Exception:
 		query.edit_message_text('Çıxarış zamanı xəta baş verdi. Zəhmət olmasa yenidən cəhd edin.', reply_markup=main_kb)
 
 
-def credit_daily_returns():
-	# iterate users and credit 10% of each active investment to their balance
+def credit_daily_returns(run_date=None):
+	# scheduled payout run (returns + referral bonuses); queue a notice for each paid user
+	def notify(rows):
+		outbox.send_batch((r['telegram_id'], f"📈 Gündəlik qazancınız əlavə edildi: {r['returns'] + r['referral']:.2f} AZN") for r in rows if r.get('telegram_id'))
 	try:
-		users = list_all_users()
-		for u in users:
-			uid = u.get('id')
-			try:
-				invs = list_user_investments(uid)
-				payout = 0.0
-				for i in invs:
-					try:
-						if int(i.get('active') or 0) == 1:
-							amount = float(i.get('amount') or 0)
-							payout += amount * 0.10
-					except Exception:
-						pass
-				if payout > 0:
-					update_user_balance(uid, payout)
-					# optional notify user
-					try:
-						# send simple notification if bot available
-						from telegram import Bot
-						bot = Bot(token=TOKEN)
-						bot.send_message(chat_id=u.get('telegram_id'), text=f'📈 Gündəlik qazancınız əlavə edildi: {payout:.2f} AZN')
-					except Exception:
-						pass
-			except Exception:
-				logging.exception('Error calculating payout for user %s', uid)
+		# imported on first run: payments pulls in payout_engine and numpy
+		from payments import daily_payouts
+		daily_payouts(run_date, notify=notify, shards=PAYOUT_SHARDS)
 	except Exception:
 		logging.exception('credit_daily_returns failed')
 
@@ -730,15 +696,7 @@ def verify_command(update, context: CallbackContext):
 	user = update.effective_user
 	chat_id = update.effective_chat.id
 	# Only allow admins
-	is_admin = False
-	try:
-		if user.id == ADMIN_TELEGRAM_ID:
-			is_admin = True
-	except Exception:
-		pass
-	if user.id in ADMIN_CHAT_IDS:
-		is_admin = True
-	if not is_admin:
+	if not admins.is_admin(user.id):
 		update.message.reply_text('Siz admin deyilsiniz. Bu əmri icra edə bilmərsiniz.')
 		return
 	args = context.args
@@ -758,23 +716,21 @@ def verify_command(update, context: CallbackContext):
 		update.message.reply_text(f'Invest ID {inv_id} artıq aktivdir.')
 		return
 	# mark active and credit user's balance
-	mark_investment_active(inv_id)
 	uid = inv.get('user_id')
 	amount = float(inv.get('amount') or 0)
-	update_user_balance(uid, amount)
-	# referral immediate payout: 1 AZN + 10% of investment to referrer (if any)
-	user_row = get_user_by_id(uid)
-	if user_row and user_row.get('referrer_id'):
-		ref_id = user_row.get('referrer_id')
-		bonus = 1.0 + (amount * 0.10)
-		update_user_balance(ref_id, bonus)
-		# notify referrer if possible
-		try:
-			for aid in ADMIN_CHAT_IDS:
-				# optional: send notification to admins only
-				pass
-		except Exception:
-			pass
+	with transaction():
+		activated = mark_investment_active(inv_id)
+		if activated:
+			update_user_balance(uid, amount, 'deposit', f'investment:{inv_id}')
+			# referral immediate payout: 1 AZN + 10% of investment to referrer (if any)
+			user_row = get_user_by_id(uid)
+			if user_row and user_row.get('referrer_id'):
+				ref_id = user_row.get('referrer_id')
+				bonus = 1.0 + (amount * 0.10)
+				update_user_balance(ref_id, bonus, 'referral_bonus', f'investment:{inv_id}')
+	if not activated:
+		update.message.reply_text(f'Invest ID {inv_id} artıq aktivdir.')
+		return
 	# notify investor
 	try:
 		u_row = get_user_by_id(inv.get('user_id'))
@@ -792,161 +748,294 @@ def myid_command(update, context: CallbackContext):
 	uid = user.id
 	username = user.username or ''
 	# show id and prompt for admin code to activate
-	context.user_data['awaiting_admin_code'] = True
+	text_states.enter(context, 'admin_code')
 	update.message.reply_text(f'Sizin Telegram numeric ID: {uid}\nUsername: {username}\n\nAdmin nömrəsini daxil edin:')
 
 def reload_admins_command(update, context: CallbackContext):
+	if not admins.is_admin(update.effective_user.id):
+		return
 	try:
-		load_admins()
-		update.message.reply_text(f'Adminlar yeniləndi. Hazırki admin sayısı: {len(ADMIN_CHAT_IDS)}')
-	except Exception as e:
+		admins.registry.refresh(force=True)
+		update.message.reply_text(f'Adminlar yeniləndi. Hazırki admin sayısı: {len(admins.registry)}')
+	except Exception:
 		logging.exception('reload_admins failed')
 		update.message.reply_text('Admin yeniləmək alınmadı.')
 
-def handle_admin_text(update, context: CallbackContext):
-	text = update.message.text
-	# admin messaging flow
-	if 'admin_msg_target' in context.user_data:
-		target = context.user_data.pop('admin_msg_target')
-		try:
-			# ensure target is int if possible
-			try:
-				chat_id = int(target)
-			except Exception:
-				chat_id = target
-			context.bot.send_message(chat_id=chat_id, text=f'📩 Maliyyə xidməti\n\n{text}')
-			update.message.reply_text('Mesaj göndərildi.', reply_markup=admin_kb)
-		except Exception:
-			# Log detailed error and give actionable message to admin
-			logging.exception('Failed to send admin message to %s', target)
-			err = None
-			try:
-				import telegram
-				err = telegram
-			except Exception:
-				err = None
-			# Common reason: bot hasn't been started by the user or blocked by user
-			update.message.reply_text('Mesaj göndərilərkən xəta baş verdi. Ən çox rastlanan səbəb: istifadəçi botla söhbətə başlamayıb və ya bot bloklanıb. İstifadəçidən əvvəlcə /start yazmasını xahiş edin.', reply_markup=admin_kb)
-		return
-	# admin menu options
-	if text == 'İstifadəçilər':
-		users = list_all_users()
-		if not users:
-			update.message.reply_text('Heç bir istifadəçi yoxdur.', reply_markup=admin_kb)
-			return
-		# send brief list with inline buttons
-		for u in users[:50]:
-			pending = get_pending_investments()
-			flag = '🔴' if any(p['user_id']==u.get('id') for p in pending) else '🟢'
-			kb = InlineKeyboardMarkup([[InlineKeyboardButton('Aç', callback_data=f'admin_user:{u.get("id")}')]])
-			update.message.reply_text(f"{flag} {u.get('username') or ''} — ID:{u.get('id')} — Balans: {u.get('balance'):.2f} AZN", reply_markup=kb)
-		update.message.reply_text('İstifadəçilər listi (ən çox 50 göstərildi).', reply_markup=admin_kb)
+def slow_queries_command(update, context: CallbackContext):
+	# admin only: /slowqueries [count|max|n] - statements recorded by the DB_SLOW_QUERY_MS profiler
+	if not admins.is_admin(update.effective_user.id):
 		return
-	if text == 'Mesajlar':
-		update.message.reply_text('Mesaj göndərmək üçün istifadəçini seçin: İstifadəçilər bölməsindən bir istifadəçi açın və "Mesaj göndər" düyməsinə basın.', reply_markup=admin_kb)
+	if not os.getenv('DB_SLOW_QUERY_MS'):
+		update.message.reply_text('Sorğu profili söndürülüb (DB_SLOW_QUERY_MS təyin edilməyib).')
 		return
-	if text == 'Alışlar':
-		update.message.reply_text('İstifadəçinin qarşısında alış əlavə etmək üçün əvvəlcə İstifadəçilər -> Aç -> Alış et istifadə edin.', reply_markup=admin_kb)
+	args = context.args
+	order_by = {'count': 'count', 'max': 'max_ms'}.get(args[0] if args else '', 'total_ms')
+	limit = next((int(a) for a in args if a.isdigit()), 5)
+	entries = slow_queries(min(limit, 20), order_by)
+	if not entries:
+		update.message.reply_text('Yavaş sorğu qeydə alınmayıb.')
 		return
-	if text == 'Ödənişlər':
-		# show receipts via callback flow
-		# create a small inline button to trigger payments view
-		kb = InlineKeyboardMarkup([[InlineKeyboardButton('Qəbzləri göstər', callback_data='admin_payments')]])
-		update.message.reply_text('Admin ödənişlər səhifəsi:', reply_markup=kb)
+	lines = []
+	for i, e in enumerate(entries, 1):
+		scan = ' ⚠️ SCAN: ' + ', '.join(e['full_scans']) if e['full_scans'] else ''
+		lines.append(f"{i}. {e['count']}x, cəmi {e['total_ms']:.1f} ms, max {e['max_ms']:.1f} ms, {e['shape']}{scan}\n{e['sql'][:300]}")
+	text = '🐢 Yavaş sorğular:\n\n' + '\n\n'.join(lines)
+	update.message.reply_text(text[:4000])
+
+def add_admin_command(update, context: CallbackContext):
+	# owner only: /addadmin <telegram_id> [admin|owner]
+	if admins.role(update.effective_user.id) != admins.OWNER:
+		update.message.reply_text('Bu əmr yalnız sahib üçündür.')
 		return
-	if text == 'Geri' or text.lower() == 'geri':
-		update.message.reply_text('Geri', reply_markup=admin_kb)
+	args = context.args
+	try:
+		tid = int(args[0])
+		role = args[1] if len(args) > 1 else admins.ADMIN
+		admins.registry.add(tid, role, source='command')
+	except (IndexError, ValueError):
+		update.message.reply_text('İstifadə: /addadmin <telegram_id> [admin|owner]')
 		return
-	update.message.reply_text('Admin: bilinməyən əməliyyat.', reply_markup=admin_kb)
+	update.message.reply_text(f'{tid} admin olaraq əlavə edildi ({role}).')
 
-	# provide clearer guidance and log context for debugging
+def remove_admin_command(update, context: CallbackContext):
+	# owner only: /deladmin <telegram_id>
+	if admins.role(update.effective_user.id) != admins.OWNER:
+		update.message.reply_text('Bu əmr yalnız sahib üçündür.')
+		return
 	try:
-		logging.info('Admin unknown operation. user=%s keys=%s', update.effective_user.id, list(context.user_data.keys()))
-	except Exception:
-		pass
-	if 'admin_msg_target' in context.user_data:
-		tgt = context.user_data.get('admin_msg_target')
-		try:
-			update.message.reply_text(f'Admin: mesaj məqsədi mövcuddur (ID: {tgt}). Mesajınızı yazın və göndərəcək. Əgər problem davam edərsə, /canceladmin ilə ləğv edə bilərsiniz.', reply_markup=admin_kb)
-		except Exception:
-			update.message.reply_text('Admin: məlum olmayan əməliyyat. Mesaj məqsədi mövcuddur. /canceladmin ilə ləğv edin.', reply_markup=admin_kb)
+		tid = int(context.args[0])
+	except (IndexError, ValueError):
+		update.message.reply_text('İstifadə: /deladmin <telegram_id>')
+		return
+	if admins.registry.remove(tid):
+		update.message.reply_text(f'{tid} adminlərdən silindi.')
 	else:
+		update.message.reply_text(f'{tid} admin deyil.')
+
+def render_users_page(page):
+	users = page['users']
+	lines = ['👥 İstifadəçilər:']
+	for u in users:
+		flag = '🔴' if u.get('has_pending') else '🟢'
+		lines.append(f"{flag} {u.get('username') or ''} — ID:{u.get('id')} — Balans: {u.get('balance'):.2f} AZN")
+	buttons = [InlineKeyboardButton(f"Aç {u.get('id')}", callback_data=f"admin_user:{u.get('id')}") for u in users]
+	rows = [buttons[i:i + 5] for i in range(0, len(buttons), 5)]
+	nav = []
+	if page['has_prev']:
+		nav.append(InlineKeyboardButton('◀️ Əvvəlki', callback_data=f"admin_users:prev:{users[0].get('id')}"))
+	if page['has_next']:
+		nav.append(InlineKeyboardButton('Növbəti ▶️', callback_data=f"admin_users:next:{users[-1].get('id')}"))
+	if nav:
+		rows.append(nav)
+	return '\n'.join(lines), InlineKeyboardMarkup(rows)
+
+@text_states.on('admin_msg')
+def admin_message_entered(update, context, text):
+	# admin messaging flow: send this message to the selected user
+	text_states.leave(context)
+	target = context.user_data.pop('admin_msg_target', None)
+	try:
+		# ensure target is int if possible
 		try:
-			update.message.reply_text('Admin: bilinməyən əməliyyat. Mesaj göndərmək üçün əvvəlcə İstifadəçilər → Aç → "Mesaj göndər" düyməsinə basın, sonra mesaj yazın.', reply_markup=admin_kb)
+			chat_id = int(target)
 		except Exception:
-			pass
+			chat_id = target
+		context.bot.send_message(chat_id=chat_id, text=f'📩 Maliyyə xidməti\n\n{update.message.text}')
+		update.message.reply_text('Mesaj göndərildi.', reply_markup=admin_kb)
+	except Exception:
+		# Log detailed error and give actionable message to admin
+		logging.exception('Failed to send admin message to %s', target)
+		# Common reason: bot hasn't been started by the user or blocked by user
+		update.message.reply_text('Mesaj göndərilərkən xəta baş verdi. Ən çox rastlanan səbəb: istifadəçi botla söhbətə başlamayıb və ya bot bloklanıb. İstifadəçidən əvvəlcə /start yazmasını xahiş edin.', reply_markup=admin_kb)
 
-def handle_receipt_photo(update, context: CallbackContext):
+@admin_menu.on('👥 İstifadəçilər')
+def admin_users(update, context):
+	page = list_users_page(limit=ADMIN_USERS_PAGE_SIZE)
+	if not page['users']:
+		update.message.reply_text('Heç bir istifadəçi yoxdur.', reply_markup=admin_kb)
+		return
+	# one message per page, with open buttons and Prev/Next paging
+	txt, kb = render_users_page(page)
+	update.message.reply_text(txt, reply_markup=kb)
+
+@admin_menu.on('✉️ Mesajlar')
+def admin_messages(update, context):
+	update.message.reply_text('Mesaj göndərmək üçün istifadəçini seçin: İstifadəçilər bölməsindən bir istifadəçi açın və "Mesaj göndər" düyməsinə basın.', reply_markup=admin_kb)
+
+@admin_menu.on('🛒 Alışlar')
+def admin_purchases(update, context):
+	update.message.reply_text('İstifadəçinin qarşısında alış əlavə etmək üçün əvvəlcə İstifadəçilər -> Aç -> Alış et istifadə edin.', reply_markup=admin_kb)
+
+@admin_menu.on('📥 Ödənişlər')
+def admin_payments(update, context):
+	# a small inline button triggers the receipts view
+	kb = InlineKeyboardMarkup([[InlineKeyboardButton('Qəbzləri göstər', callback_data='admin_payments')]])
+	update.message.reply_text('Admin ödənişlər səhifəsi:', reply_markup=kb)
+
+@admin_menu.on('◀️ Geri')
+def admin_back(update, context):
+	update.message.reply_text('Geri', reply_markup=admin_kb)
+
+def admin_unknown(update, context):
+	logging.info('Admin unknown operation. user=%s keys=%s', update.effective_user.id, list(context.user_data.keys()))
+	update.message.reply_text('Admin: bilinməyən əməliyyat. Mesaj göndərmək üçün əvvəlcə İstifadəçilər → Aç → "Mesaj göndər" düyməsinə basın, sonra mesaj yazın.', reply_markup=admin_kb)
+
+def receipt_content_hash(bot, file_id, file_size):
+	# optional second fingerprint: sha256 of the file, streamed from the Bot API
+	if not RECEIPT_CONTENT_HASH or (file_size and file_size > RECEIPT_HASH_MAX_BYTES):
+		return None
+	try:
+		return sha256_stream(bot.get_file(file_id).file_path, RECEIPT_HASH_MAX_BYTES)
+	except Exception:
+		logging.warning('Could not hash receipt file %s', file_id, exc_info=True)
+		return None
+
+def store_receipt(update, context, file, file_type):
 	user = update.effective_user
 	tg_user = get_user_by_telegram(user.id)
 	if 'pending_investment' not in context.user_data:
 		update.message.reply_text('Heç bir pending ödəniş tapılmadı. Əvvəlcə ödənişi təsdiq edin.', reply_markup=main_kb)
 		return
 	inv_id = context.user_data.pop('pending_investment')
-	photo = update.message.photo[-1]
-	file_id = photo.file_id
-	add_receipt(tg_user['id'], inv_id, file_id, 'photo')
+	content_hash = receipt_content_hash(context.bot, file.file_id, file.file_size)
+	receipt_id = add_receipt(tg_user['id'], inv_id, file.file_id, file_type, file.file_unique_id, content_hash)
+	receipt = get_receipt(receipt_id)
+	caption_extra = ''
+	if receipt and receipt.get('duplicate_of'):
+		caption_extra = f"⚠️ TƏKRAR QƏBZ: əvvəl Qəbz ID {receipt['duplicate_of']} (Invest ID {receipt.get('duplicate_investment_id')}) kimi göndərilib\n"
+		logging.info('Duplicate receipt %s of %s from user %s', receipt_id, receipt['duplicate_of'], user.id)
 	investment = get_investment_by_id(inv_id)
 	# forward to admins
-	forward_receipt_to_admins(context.bot, {'telegram_id': user.id, 'username': user.username}, investment, file_id, 'photo')
+	forward_receipt_to_admins({'telegram_id': user.id, 'username': user.username}, investment, file.file_id, file_type, caption_extra)
 	update.message.reply_text('Qəbz admin-ə göndərildi. Təsdiq gözlənilir.', reply_markup=main_kb)
 
+def handle_receipt_photo(update, context: CallbackContext):
+	store_receipt(update, context, update.message.photo[-1], 'photo')
+
 def handle_receipt_document(update, context: CallbackContext):
-	user = update.effective_user
-	tg_user = get_user_by_telegram(user.id)
-	if 'pending_investment' not in context.user_data:
-		update.message.reply_text('Heç bir pending ödəniş tapılmadı. Əvvəlcə ödənişi təsdiq edin.', reply_markup=main_kb)
-		return
-	inv_id = context.user_data.pop('pending_investment')
-	doc = update.message.document
-	file_id = doc.file_id
-	add_receipt(tg_user['id'], inv_id, file_id, 'document')
-	investment = get_investment_by_id(inv_id)
-	forward_receipt_to_admins(context.bot, {'telegram_id': user.id, 'username': user.username}, investment, file_id, 'document')
-	update.message.reply_text('Qəbz admin-ə göndərildi. Təsdiq gözlənilir.', reply_markup=main_kb)
+	store_receipt(update, context, update.message.document, 'document')
+
+
+def payout_time(value):
+	# PAYOUT_TIME_UTC as (hour, minute); a malformed value is logged and the default used
+	if not value:
+		return DEFAULT_PAYOUT_TIME
+	try:
+		hour, minute = (int(x) for x in value.strip().split(':'))
+		if 0 <= hour < 24 and 0 <= minute < 60:
+			return hour, minute
+	except ValueError:
+		pass
+	logging.error('PAYOUT_TIME_UTC=%r is not a valid HH:MM time; using %02d:%02d', value, *DEFAULT_PAYOUT_TIME)
+	return DEFAULT_PAYOUT_TIME
 
 
 def main():
 	if not TOKEN:
 		print('TELEGRAM_TOKEN not set in environment. Create a .env file from .env.example')
 		return
-	updater = Updater(TOKEN, use_context=True)
+	# DB_SLOW_QUERY_MS: log statements at least this slow, with their query plan (/slowqueries lists them)
+	if os.getenv('DB_SLOW_QUERY_MS'):
+		enable_profiler(float(os.getenv('DB_SLOW_QUERY_MS')))
+	# done here rather than at import so importing bot stays cheap
+	init_db(DB_FILE)
+	load_admins()
+	# TELEGRAM_API_URL points the bot at another Bot API server (e.g. loadtest.fake_api)
+	api_kwargs = {}
+	if os.getenv('TELEGRAM_API_URL'):
+		api_kwargs['base_url'] = os.getenv('TELEGRAM_API_URL')
+	if os.getenv('TELEGRAM_FILE_URL'):
+		api_kwargs['base_file_url'] = os.getenv('TELEGRAM_FILE_URL')
+	# user_data (pending receipt, withdrawal details, current flow) survives restarts
+	state_store = SQLitePersistence(float(os.getenv('STATE_FLUSH_INTERVAL', '1')))
+	updater = Updater(TOKEN, use_context=True, persistence=state_store, **api_kwargs)
+	state_store.start()
 	try:
 		me = updater.bot.get_me()
 		print(f"Bot account: @{me.username} (id: {me.id})")
 	except Exception:
 		print("Bot hesabı alınamadı - token düzgün olmayabilir.")
 	dp = updater.dispatcher
+	# single sender for all queued fan-out messages, sharing the updater's Bot
+	sender = outbox.OutboxWorker(updater.bot, workers=int(os.getenv('OUTBOX_WORKERS', '4')))
+	sender.start()
+	# pick up admin changes made by other processes sharing the database
+	admins.registry.watch(float(os.getenv('ADMIN_SYNC_INTERVAL', '5')))
 
-	dp.add_handler(CommandHandler('start', start))
-	dp.add_handler(CommandHandler('help', help_cmd))
-	dp.add_handler(CommandHandler('myid', myid_command))
-	dp.add_handler(MessageHandler(Filters.text & ~Filters.command, handle_text))
-	# Admin-specific callbacks (prefix admin_)
-	dp.add_handler(CallbackQueryHandler(admin_cb, pattern='^admin_'))
-	# Withdrawal callback (match withdraw_amt precisely)
-	dp.add_handler(CallbackQueryHandler(withdraw_cb, pattern='^withdraw_amt:'))
-	# Generic confirm payment callbacks (select amount + confirm)
-	dp.add_handler(CallbackQueryHandler(confirm_payment_cb))
+	# HANDLER_WORKERS > 0: handlers run on a worker pool, in parallel across users
+	# and strictly in order per user; 0 keeps everything on the dispatcher thread
+	handler_workers = int(os.getenv('HANDLER_WORKERS', '8'))
+	handler_pool = KeyedExecutor(handler_workers) if handler_workers > 0 else None
+	def h(callback):
+		callback = metrics.handler(callback)
+		return per_user(handler_pool, callback) if handler_pool else callback
+
+	# METRICS_PORT: Prometheus text format on http://METRICS_LISTEN:METRICS_PORT/metrics
+	if os.getenv('METRICS_PORT'):
+		metrics.instrument_request(updater.bot.request)
+		metrics.Gauge('db_user_cache_hits_total', 'User row cache hits', lambda: cache_stats()['hits'], kind='counter')
+		metrics.Gauge('db_user_cache_misses_total', 'User row cache misses', lambda: cache_stats()['misses'], kind='counter')
+		metrics.Gauge('db_user_cache_rows', 'Rows in the user cache', lambda: cache_stats()['size'])
+		if handler_pool:
+			metrics.Gauge('handler_queue_depth', 'Updates waiting for a handler worker', handler_pool.pending)
+		metrics.serve(int(os.getenv('METRICS_PORT')), os.getenv('METRICS_LISTEN', '127.0.0.1'))
+
+	dp.add_handler(CommandHandler('start', h(start)))
+	dp.add_handler(CommandHandler('help', h(help_cmd)))
+	dp.add_handler(CommandHandler('myid', h(myid_command)))
+	dp.add_handler(MessageHandler(Filters.text & ~Filters.command, h(handle_text)))
+	# all callback data goes through the prefix router
+	dp.add_handler(CallbackQueryHandler(h(route_callback)))
 
 	# Receipt handlers (photo and document)
-	dp.add_handler(MessageHandler(Filters.photo, handle_receipt_photo))
-	dp.add_handler(MessageHandler(Filters.document, handle_receipt_document))
+	dp.add_handler(MessageHandler(Filters.photo, h(handle_receipt_photo)))
+	dp.add_handler(MessageHandler(Filters.document, h(handle_receipt_document)))
 
 	# Admin verify command
-	dp.add_handler(CommandHandler('verify', verify_command))
+	dp.add_handler(CommandHandler('verify', h(verify_command)))
+	# Admin registry commands
+	dp.add_handler(CommandHandler('reload_admins', h(reload_admins_command)))
+	dp.add_handler(CommandHandler('addadmin', h(add_admin_command)))
+	dp.add_handler(CommandHandler('deladmin', h(remove_admin_command)))
+	dp.add_handler(CommandHandler('slowqueries', h(slow_queries_command)))
 	dp.add_error_handler(error_handler)
 
-	# Scheduler for daily payouts (runs every day at 00:00 server time)
+	# Scheduler for the daily payout run (every day at PAYOUT_TIME_UTC)
+	from apscheduler.schedulers.background import BackgroundScheduler
+	import pytz
+	payout_hour, payout_minute = payout_time(os.getenv('PAYOUT_TIME_UTC'))
 	sched = BackgroundScheduler(timezone=pytz.UTC)
-	sched.add_job(daily_payouts, 'interval', hours=24, timezone=pytz.UTC)
-	# also credit daily returns (10% of active investments)
-	sched.add_job(credit_daily_returns, 'interval', hours=24, timezone=pytz.UTC)
+	sched.add_job(credit_daily_returns, 'cron', hour=payout_hour, minute=payout_minute, timezone=pytz.UTC,
+		id='daily_payouts', max_instances=1, coalesce=True, misfire_grace_time=3600)
+	# resume a run that was interrupted by a crash or restart
+	unfinished = get_unfinished_payout_run()
+	if unfinished:
+		sched.add_job(credit_daily_returns, args=[unfinished['run_date']], id='resume_payouts')
 	sched.start()
 
-	updater.start_polling()
-	print('Bot started')
-	updater.idle()
+	# BOT_MODE=webhook: Telegram pushes updates to an embedded HTTP server instead of long polling
+	server = None
+	if os.getenv('BOT_MODE', 'polling') == 'webhook':
+		import webhook
+		url = os.getenv('WEBHOOK_URL')
+		path = urlsplit(url).path if url else '/telegram'
+		server = webhook.WebhookServer(dp, listen=os.getenv('WEBHOOK_LISTEN', '0.0.0.0'), port=int(os.getenv('PORT', '8443')),
+			path=path, secret=os.getenv('WEBHOOK_SECRET') or None)
+	try:
+		if server:
+			webhook.serve(updater, server, url)
+		else:
+			updater.start_polling()
+			print('Bot started')
+			updater.idle()
+	finally:
+		sched.shutdown(wait=False)
+		if handler_pool:
+			handler_pool.shutdown(wait=True)
+		state_store.stop()
+		sender.stop()
+		admins.registry.stop()
+		close_all()
 
 if __name__ == '__main__':
 	main()
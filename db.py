@@ -1,20 +1,382 @@
+import logging
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional, List, Dict
 
+import metrics
+
 DB_FILE = None
+# Referral rule: 1 AZN per referral + 10% of the referral's active investments
+REFERRAL_BONUS = 1.0
+REFERRAL_RATE = 0.10
+# Per-connection prepared statement cache (sqlite3 default is 128)
+STATEMENT_CACHE_SIZE = 256
+
+# One connection per thread. Every connection handed out is also tracked in
+# _conns so close_all() can close the ones owned by other threads on shutdown.
+_local = threading.local()
+_conns = []
+_conns_lock = threading.Lock()
+_generation = 0
+
+# PRAGMAs applied to every new connection. WAL lets the payout jobs write while
+# handlers keep reading; journal_mode is persisted in the db file itself.
+STORAGE_PROFILE = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'cache_size': -16000,
+    'mmap_size': 64 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+def apply_storage_profile(conn, profile: Optional[Dict] = None):
+    for name, value in (profile or STORAGE_PROFILE).items():
+        conn.execute(f'PRAGMA {name}={value}')
+
+# Opt-in slow query profiler (enable_profiler). Connections opened while it
+# is on are _ProfilingConnections: their cursors time each statement from
+# execute() until its rows are consumed or the cursor is dropped, and a
+# progress handler counts VM steps. Statements over the threshold are
+# aggregated by SQL text; the first time one is slow its EXPLAIN QUERY PLAN
+# is captured and full table scans are flagged.
+PROFILER_PROGRESS_STEPS = 1000
+_profiler_threshold = None
+_slow: Dict[str, Dict] = {}
+_slow_lock = threading.Lock()
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+def _params_shape(params) -> str:
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in params.items()) + '}'
+    return '(' + ', '.join(type(v).__name__ for v in params or ()) + ')'
+
+def _explain(conn, sql: str, params) -> List[str]:
+    if not sql.lstrip().upper().startswith(_EXPLAINABLE):
+        return []
+    try:
+        # a plain cursor, so the plan query is not profiled itself
+        rows = sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, params or ()).fetchall()
+    except sqlite3.Error as e:
+        return [f'(plan unavailable: {e})']
+    return [r[3] for r in rows]
+
+def _record_slow(conn, sql: str, params, shape: str, elapsed: float, steps: int):
+    key = ' '.join(sql.split())
+    with _slow_lock:
+        entry = _slow.get(key)
+        first = entry is None
+        if first:
+            entry = _slow[key] = {'sql': key, 'shape': shape, 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                  'vm_steps': 0, 'plan': [], 'full_scans': []}
+        entry['count'] += 1
+        entry['total_ms'] += elapsed * 1000
+        entry['max_ms'] = max(entry['max_ms'], elapsed * 1000)
+        entry['vm_steps'] += steps * PROFILER_PROGRESS_STEPS
+    if first:
+        plan = _explain(conn, sql, params)
+        # "SCAN users" reads the whole table; "SCAN users USING INDEX ..." and "SCAN CONSTANT ROW" do not count
+        entry['full_scans'] = [d for d in plan if d.startswith('SCAN ') and 'INDEX' not in d and 'CONSTANT ROW' not in d]
+        entry['plan'] = plan
+        logging.warning('slow query %.1f ms %s: %s%s', elapsed * 1000, shape, key,
+                        ''.join(f'\n    {d}' for d in plan))
+
+class _ProfilingCursor(sqlite3.Cursor):
+    _sql = None
+
+    def _start(self, sql, params, shape):
+        self._finish()
+        self._sql, self._params, self._shape = sql, params, shape
+        self._elapsed = 0.0
+        self._steps = self.connection.steps
+
+    def _timed(self, fn, *args):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args)
+        finally:
+            self._elapsed += time.perf_counter() - t0
+
+    def _finish(self):
+        sql, self._sql = self._sql, None
+        if sql is not None and self._elapsed >= _profiler_threshold:
+            _record_slow(self.connection, sql, self._params, self._shape, self._elapsed, self.connection.steps - self._steps)
+
+    def execute(self, sql, params=()):
+        self._start(sql, params, _params_shape(params))
+        return self._timed(super().execute, sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        first = seq_of_params[0] if seq_of_params else ()
+        self._start(sql, first, f'{len(seq_of_params)} x {_params_shape(first)}')
+        return self._timed(super().executemany, sql, seq_of_params)
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if not rows:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+class _ProfilingConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.steps = 0
+        self.set_progress_handler(self._progress, PROFILER_PROGRESS_STEPS)
+
+    def _progress(self):
+        self.steps += 1
+        return 0
+
+    def cursor(self, factory=_ProfilingCursor):
+        return super().cursor(factory)
+
+    # Connection.execute does not go through cursor()
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq_of_params):
+        return self.cursor().executemany(sql, seq_of_params)
+
+def enable_profiler(threshold_ms: float = 0.0):
+    """Record statements taking at least threshold_ms from now on (reopens pooled connections)."""
+    global _profiler_threshold
+    _profiler_threshold = threshold_ms / 1000
+    close_all()
+
+def disable_profiler():
+    global _profiler_threshold
+    _profiler_threshold = None
+    close_all()
+
+def slow_queries(limit: int = 10, order_by: str = 'total_ms') -> List[Dict]:
+    """Slowest statements so far (by total_ms, max_ms or count), full table scans included."""
+    with _slow_lock:
+        entries = [dict(e) for e in _slow.values()]
+    entries.sort(key=lambda e: e[order_by], reverse=True)
+    return entries[:limit]
+
+def reset_slow_queries():
+    with _slow_lock:
+        _slow.clear()
+
+def _connect():
+    factory = _ProfilingConnection if _profiler_threshold is not None else sqlite3.Connection
+    conn = sqlite3.connect(DB_FILE, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE, factory=factory)
+    conn.row_factory = sqlite3.Row
+    apply_storage_profile(conn)
+    return conn
 
 def get_conn():
     global DB_FILE
     if DB_FILE is None:
         DB_FILE = 'data.db'
-    conn = sqlite3.connect(DB_FILE, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.generation == _generation:
+        return conn
+    conn = _connect()
+    with _conns_lock:
+        # drop connections whose owner thread has exited
+        alive = []
+        for t, c in _conns:
+            if t.is_alive():
+                alive.append((t, c))
+            else:
+                c.close()
+        alive.append((threading.current_thread(), conn))
+        _conns[:] = alive
+        _local.conn = conn
+        _local.generation = _generation
+    _local.tx_depth = 0
     return conn
 
+def close_all():
+    """Close every pooled connection; the next get_conn() in any thread reconnects."""
+    global _generation
+    with _conns_lock:
+        for _, c in _conns:
+            try:
+                c.close()
+            except Exception:
+                pass
+        _conns.clear()
+        _generation += 1
+    _user_cache.clear()
+
+@contextmanager
+def transaction():
+    """Run several db.py calls atomically on this thread's connection.
+
+    Functions called inside the block skip their own commit; the block commits
+    once on success and rolls back on error. Nested blocks join the outer one.
+    """
+    conn = get_conn()
+    if _local.tx_depth:
+        _local.tx_depth += 1
+        try:
+            yield conn
+        finally:
+            _local.tx_depth -= 1
+        return
+    _local.tx_depth = 1
+    _local.dirty_users = set()
+    _local.dirty_telegram_ids = set()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _local.tx_depth = 0
+        # other threads may have re-cached the old row before the commit
+        if _local.dirty_users or _local.dirty_telegram_ids:
+            _user_cache.invalidate(_local.dirty_users, _local.dirty_telegram_ids)
+
+def explain(sql: str, params=()) -> List[str]:
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement."""
+    cur = get_conn().execute('EXPLAIN QUERY PLAN ' + sql, params)
+    return [r['detail'] for r in cur.fetchall()]
+
+def _commit(conn):
+    if not getattr(_local, 'tx_depth', 0):
+        conn.commit()
+
+# Bounded LRU cache of users rows, keyed by id with a telegram_id index.
+# Writes made through this module invalidate the rows they touch (again after
+# their transaction ends); the TTL bounds staleness from other processes.
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 60.0
+
+class _UserCache:
+    def __init__(self, size: int, ttl: float):
+        self.size = size
+        self.ttl = ttl
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self._rows = OrderedDict()  # id -> (expires_at, row)
+        self._by_tg = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, by_telegram: bool = False) -> Optional[Dict]:
+        with self._lock:
+            uid = self._by_tg.get(key) if by_telegram else key
+            entry = self._rows.get(uid)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    self._drop(uid)
+                self.misses += 1
+                return None
+            self._rows.move_to_end(uid)
+            self.hits += 1
+            return dict(entry[1])
+
+    def put(self, row: Dict, version: int):
+        # version is read before the query: a write that invalidated in
+        # between means this row may already be stale, so it is not kept
+        with self._lock:
+            if version != self.version:
+                return
+            self._drop(row['id'])
+            self._rows[row['id']] = (time.monotonic() + self.ttl, dict(row))
+            if row['telegram_id'] is not None:
+                self._by_tg[row['telegram_id']] = row['id']
+            while len(self._rows) > self.size:
+                self._drop(next(iter(self._rows)))
+
+    def invalidate(self, ids=(), telegram_ids=()):
+        with self._lock:
+            self.version += 1
+            for uid in ids:
+                self._drop(uid)
+            for tg in telegram_ids:
+                uid = self._by_tg.get(tg)
+                if uid is not None:
+                    self._drop(uid)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._rows.clear()
+            self._by_tg.clear()
+
+    def _drop(self, uid):
+        entry = self._rows.pop(uid, None)
+        if entry is not None and self._by_tg.get(entry[1]['telegram_id']) == uid:
+            del self._by_tg[entry[1]['telegram_id']]
+
+_user_cache = _UserCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+def _invalidate_users(ids=(), telegram_ids=()):
+    _user_cache.invalidate(ids, telegram_ids)
+    if getattr(_local, 'tx_depth', 0):
+        _local.dirty_users.update(ids)
+        _local.dirty_telegram_ids.update(telegram_ids)
+
+def _cached_user(row, version: int):
+    if row is None:
+        return None
+    row = dict(row)
+    # rows read inside a transaction may not be committed yet
+    if not getattr(_local, 'tx_depth', 0):
+        _user_cache.put(row, version)
+    return row
+
+def cache_stats() -> Dict:
+    hits, misses = _user_cache.hits, _user_cache.misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else None,
+        'size': len(_user_cache._rows),
+    }
+
+def _ensure_columns(cur, table: str, columns: List[tuple]):
+    # add columns introduced after a table was first created
+    cur.execute(f'PRAGMA table_info({table})')
+    existing = {r['name'] for r in cur.fetchall()}
+    for name, decl in columns:
+        if name not in existing:
+            cur.execute(f'ALTER TABLE {table} ADD COLUMN {name} {decl}')
+
 def init_db(db_file: Optional[str] = None):
     global DB_FILE
-    if db_file:
+    if db_file and db_file != DB_FILE:
+        close_all()
         DB_FILE = db_file
     conn = get_conn()
     cur = conn.cursor()
@@ -55,27 +417,150 @@ def init_db(db_file: Optional[str] = None):
         investment_id INTEGER,
         file_id TEXT,
         file_type TEXT,
+        created_at TEXT,
+        file_unique_id TEXT,
+        content_hash TEXT,
+        duplicate_of INTEGER
+    )
+    ''')
+    _ensure_columns(cur, 'receipts', [('file_unique_id', 'TEXT'), ('content_hash', 'TEXT'), ('duplicate_of', 'INTEGER')])
+    # first receipt seen for each fingerprint ('u:<file_unique_id>' / 'h:<sha256>')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS receipt_fingerprints (
+        fingerprint TEXT PRIMARY KEY,
+        receipt_id INTEGER NOT NULL
+    ) WITHOUT ROWID
+    ''')
+    # one row per UTC payout day; checkpoint is the last users.id committed
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS payout_runs (
+        id INTEGER PRIMARY KEY,
+        run_date TEXT UNIQUE,
+        status TEXT,
+        checkpoint INTEGER DEFAULT 0,
+        users_paid INTEGER DEFAULT 0,
+        total_paid REAL DEFAULT 0,
+        started_at TEXT,
+        finished_at TEXT
+    )
+    ''')
+    # outbound Telegram messages waiting for the rate-limited sender (outbox.py)
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS outbox (
+        id INTEGER PRIMARY KEY,
+        chat_id TEXT,
+        method TEXT,
+        payload TEXT,
+        status TEXT DEFAULT 'pending',
+        attempts INTEGER DEFAULT 0,
+        not_before REAL DEFAULT 0,
+        last_error TEXT,
+        created_at TEXT
+    )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_outbox_due ON outbox (status, not_before)')
+    # per-referrer counters kept current by create_user / investment activation
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS referral_stats (
+        user_id INTEGER PRIMARY KEY,
+        referral_count INTEGER DEFAULT 0,
+        active_referral_investment REAL DEFAULT 0,
+        earned_bonus REAL DEFAULT 0
+    )
+    ''')
+    # append-only balance journal and its periodic snapshot checkpoints
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS ledger_entries (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        delta REAL,
+        kind TEXT,
+        ref TEXT,
         created_at TEXT
     )
     ''')
-    conn.commit()
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS ledger_snapshots (
+        id INTEGER PRIMARY KEY,
+        last_entry_id INTEGER,
+        created_at TEXT
+    )
+    ''')
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS balance_snapshots (
+        snapshot_id INTEGER,
+        user_id INTEGER,
+        balance REAL,
+        PRIMARY KEY (snapshot_id, user_id)
+    )
+    ''')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_ledger_user ON ledger_entries (user_id, id)')
+    # admins and their roles; source 'env' rows are re-synced from the env on start
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS admins (
+        telegram_id INTEGER PRIMARY KEY,
+        role TEXT NOT NULL DEFAULT 'admin',
+        notify INTEGER NOT NULL DEFAULT 1,
+        source TEXT,
+        added_at TEXT
+    )
+    ''')
+    # per-user conversation state (PTB user_data) as JSON, see persistence.py
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS user_state (
+        user_id INTEGER PRIMARY KEY,
+        data TEXT NOT NULL,
+        updated_at TEXT
+    )
+    ''')
+    # small named counters; admins_version is bumped on every admins change
+    cur.execute('''
+    CREATE TABLE IF NOT EXISTS meta (
+        key TEXT PRIMARY KEY,
+        value INTEGER
+    )
+    ''')
+    # secondary indexes for the per-user, per-referrer and feed queries
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_investments_user_active ON investments (user_id, active, amount)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_investments_active ON investments (active)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_users_referrer ON users (referrer_id)')
+    cur.execute('CREATE INDEX IF NOT EXISTS idx_receipts_created ON receipts (created_at)')
+    _commit(conn)
+    cur.execute('SELECT 1 FROM referral_stats LIMIT 1')
+    empty = cur.fetchone() is None
+    # rows turned NULL by a NULL-amount investment before that was handled
+    cur.execute('SELECT 1 FROM referral_stats WHERE active_referral_investment IS NULL OR earned_bonus IS NULL LIMIT 1')
+    if empty or cur.fetchone() is not None:
+        rebuild_referral_stats()
+    # baseline checkpoint so balances from before the ledger existed reconcile
+    cur.execute('SELECT 1 FROM ledger_snapshots LIMIT 1')
+    if cur.fetchone() is None:
+        take_balance_snapshot()
 
 def create_user(telegram_id: int, username: str, referral_code: str, referrer_id: Optional[int]):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('INSERT OR IGNORE INTO users (telegram_id, username, referral_code, referrer_id, created_at) VALUES (?, ?, ?, ?, ?)',
-                (telegram_id, username, referral_code, referrer_id, datetime.utcnow().isoformat()))
-    conn.commit()
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT OR IGNORE INTO users (telegram_id, username, referral_code, referrer_id, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (telegram_id, username, referral_code, referrer_id, datetime.utcnow().isoformat()))
+        if cur.rowcount == 1 and referrer_id:
+            cur.execute('''INSERT INTO referral_stats (user_id, referral_count, earned_bonus) VALUES (?, 1, ?)
+                           ON CONFLICT(user_id) DO UPDATE SET referral_count = referral_count + 1,
+                                                              earned_bonus = earned_bonus + excluded.earned_bonus''',
+                        (referrer_id, REFERRAL_BONUS))
+        _invalidate_users(telegram_ids=(telegram_id,))
     cur.execute('SELECT * FROM users WHERE telegram_id=?', (telegram_id,))
     row = cur.fetchone()
     return dict(row) if row else None
 
 def get_user_by_telegram(telegram_id: int):
+    row = _user_cache.get(telegram_id, by_telegram=True)
+    if row is not None:
+        return row
+    version = _user_cache.version
     conn = get_conn()
     cur = conn.cursor()
     cur.execute('SELECT * FROM users WHERE telegram_id=?', (telegram_id,))
-    row = cur.fetchone()
-    return dict(row) if row else None
+    return _cached_user(cur.fetchone(), version)
 
 def get_user_by_refcode(code: str):
     conn = get_conn()
@@ -89,16 +574,17 @@ def add_investment(user_id: int, amount: float, plan: str):
     cur = conn.cursor()
     cur.execute('INSERT INTO investments (user_id, amount, plan, start_date, active) VALUES (?, ?, ?, ?, ?)',
                 (user_id, amount, plan, datetime.utcnow().isoformat(), 0))
-    conn.commit()
+    _commit(conn)
     return cur.lastrowid
 
 def add_active_investment(user_id: int, amount: float, plan: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('INSERT INTO investments (user_id, amount, plan, start_date, active) VALUES (?, ?, ?, ?, ?)',
-                (user_id, amount, plan, datetime.utcnow().isoformat(), 1))
-    conn.commit()
-    return cur.lastrowid
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('INSERT INTO investments (user_id, amount, plan, start_date, active) VALUES (?, ?, ?, ?, ?)',
+                    (user_id, amount, plan, datetime.utcnow().isoformat(), 1))
+        inv_id = cur.lastrowid
+        _add_referral_investment(cur, inv_id)
+    return inv_id
 
 def list_user_investments(user_id: int) -> List[Dict]:
     conn = get_conn()
@@ -106,11 +592,147 @@ def list_user_investments(user_id: int) -> List[Dict]:
     cur.execute('SELECT * FROM investments WHERE user_id=?', (user_id,))
     return [dict(r) for r in cur.fetchall()]
 
-def update_user_balance(user_id: int, delta: float):
+# Balance changes: users.balance is the materialized balance; every change is
+# also appended to ledger_entries in the same transaction (kind says why, ref
+# points at the investment / withdrawal / payout run behind it).
+
+def update_user_balance(user_id: int, delta: float, kind: str = 'adjustment', ref: Optional[str] = None):
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('UPDATE users SET balance = balance + ? WHERE id=?', (delta, user_id))
+        _invalidate_users((user_id,))
+        if cur.rowcount == 1:
+            cur.execute('INSERT INTO ledger_entries (user_id, delta, kind, ref, created_at) VALUES (?, ?, ?, ?, ?)',
+                        (user_id, delta, kind, ref, datetime.utcnow().isoformat()))
+
+def apply_balance_deltas(deltas: List[tuple], kind: str = 'adjustment', ref: Optional[str] = None):
+    # deltas: [(user_id, delta), ...] applied and journaled with one executemany each
+    now = datetime.utcnow().isoformat()
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.executemany('UPDATE users SET balance = balance + ? WHERE id=?', [(d, uid) for uid, d in deltas])
+        _invalidate_users([uid for uid, _ in deltas])
+        cur.executemany('''INSERT INTO ledger_entries (user_id, delta, kind, ref, created_at)
+                           SELECT ?, ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM users WHERE id = ?)''',
+                        [(uid, d, kind, ref, now, uid) for uid, d in deltas])
+
+def take_balance_snapshot(keep: int = 7) -> int:
+    # Checkpoint every user's balance together with the last ledger entry it
+    # includes; reconciliation replays only the entries after it.
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('SELECT COALESCE(MAX(id), 0) AS last_id FROM ledger_entries')
+        last_id = cur.fetchone()['last_id']
+        cur.execute('INSERT INTO ledger_snapshots (last_entry_id, created_at) VALUES (?, ?)', (last_id, datetime.utcnow().isoformat()))
+        snap_id = cur.lastrowid
+        cur.execute('INSERT INTO balance_snapshots (snapshot_id, user_id, balance) SELECT ?, id, balance FROM users', (snap_id,))
+        cur.execute('DELETE FROM balance_snapshots WHERE snapshot_id <= ?', (snap_id - keep,))
+        cur.execute('DELETE FROM ledger_snapshots WHERE id <= ?', (snap_id - keep,))
+    return snap_id
+
+def reconcile_balances() -> List[Dict]:
+    # latest snapshot + ledger entries after it vs users.balance; returns mismatches
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM ledger_snapshots ORDER BY id DESC LIMIT 1')
+    snap = cur.fetchone()
+    snap_id, last_id = (snap['id'], snap['last_entry_id']) if snap else (0, 0)
+    cur.execute('''SELECT u.id AS user_id, u.balance AS balance,
+                          COALESCE(b.balance, 0) + COALESCE(l.total, 0) AS expected
+                   FROM users u
+                   LEFT JOIN balance_snapshots b ON b.snapshot_id = ? AND b.user_id = u.id
+                   LEFT JOIN (SELECT user_id, SUM(delta) AS total FROM ledger_entries
+                              WHERE id > ? GROUP BY user_id) l ON l.user_id = u.id
+                   WHERE ABS(u.balance - (COALESCE(b.balance, 0) + COALESCE(l.total, 0))) > 0.000001''',
+                (snap_id, last_id))
+    return [dict(r) for r in cur.fetchall()]
+
+def next_user_batch_bound(after_id: int, size: int) -> Optional[int]:
+    # highest users.id among the next `size` users after `after_id`
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT MAX(id) AS hi FROM (SELECT id FROM users WHERE id > ? ORDER BY id LIMIT ?)', (after_id, size))
+    row = cur.fetchone()
+    return row['hi'] if row else None
+
+def get_daily_accruals(lo: int, hi: int, rate: float, referral_rate: float, referral_bonus: float) -> List[Dict]:
+    # Returns on own active investments plus referral bonuses (per active
+    # referral investment) for users with lo < id <= hi, in one grouped pass.
+    # `+active` keeps the planner on the (user_id, active) index: without
+    # ANALYZE stats it would otherwise walk every active investment through
+    # idx_investments_active on each batch.
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('''WITH own AS (
+                       SELECT user_id, SUM(amount) AS total FROM investments
+                       WHERE +active = 1 AND user_id > ? AND user_id <= ?
+                       GROUP BY user_id),
+                   ref AS (
+                       SELECT r.referrer_id AS user_id, SUM(i.amount * ? + ?) AS bonus
+                       FROM users r
+                       JOIN investments i ON i.user_id = r.id AND +i.active = 1
+                       WHERE r.referrer_id > ? AND r.referrer_id <= ?
+                       GROUP BY r.referrer_id)
+                   SELECT u.id AS user_id, u.telegram_id,
+                          COALESCE(own.total, 0) * ? AS returns,
+                          COALESCE(ref.bonus, 0) AS referral
+                   FROM users u
+                   LEFT JOIN own ON own.user_id = u.id
+                   LEFT JOIN ref ON ref.user_id = u.id
+                   WHERE u.id > ? AND u.id <= ? AND (own.total > 0 OR ref.bonus > 0)
+                   ORDER BY u.id''',
+                (lo, hi, referral_rate, referral_bonus, lo, hi, rate, lo, hi))
+    return [dict(r) for r in cur.fetchall()]
+
+def load_payout_columns(lo: int, hi: int) -> Dict[str, List[tuple]]:
+    # Raw rows for the vectorized payout engine, users with lo < id <= hi:
+    # the users themselves, their own active investments, and the active
+    # investments of the users they referred. NULL amounts are left out, as
+    # the SUMs in get_daily_accruals skip them. `+active` as there.
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT id, telegram_id FROM users WHERE id > ? AND id <= ? ORDER BY id', (lo, hi))
+    users = cur.fetchall()
+    cur.execute('SELECT user_id, amount FROM investments WHERE +active = 1 AND amount IS NOT NULL AND user_id > ? AND user_id <= ?', (lo, hi))
+    own = cur.fetchall()
+    cur.execute('''SELECT r.referrer_id, i.amount FROM users r
+                   JOIN investments i ON i.user_id = r.id AND +i.active = 1 AND i.amount IS NOT NULL
+                   WHERE r.referrer_id > ? AND r.referrer_id <= ?''', (lo, hi))
+    referral = cur.fetchall()
+    return {'users': [tuple(r) for r in users], 'own': [tuple(r) for r in own], 'referral': [tuple(r) for r in referral]}
+
+def start_payout_run(run_date: str) -> Dict:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("INSERT OR IGNORE INTO payout_runs (run_date, status, checkpoint, started_at) VALUES (?, 'running', 0, ?)",
+                (run_date, datetime.utcnow().isoformat()))
+    _commit(conn)
+    cur.execute('SELECT * FROM payout_runs WHERE run_date=?', (run_date,))
+    return dict(cur.fetchone())
+
+def advance_payout_run(run_id: int, expected: int, checkpoint: int, users_paid: int, amount: float) -> bool:
+    # Move the checkpoint from `expected` to `checkpoint`. False when it is no
+    # longer at `expected`: another process running the same day got there first.
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute('UPDATE users SET balance = balance + ? WHERE id=?', (delta, user_id))
-    conn.commit()
+    cur.execute("UPDATE payout_runs SET checkpoint=?, users_paid = users_paid + ?, total_paid = total_paid + ? "
+                "WHERE id=? AND checkpoint=? AND status='running'",
+                (checkpoint, users_paid, amount, run_id, expected))
+    _commit(conn)
+    return cur.rowcount == 1
+
+def finish_payout_run(run_id: int):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("UPDATE payout_runs SET status='done', finished_at=? WHERE id=?", (datetime.utcnow().isoformat(), run_id))
+    _commit(conn)
+
+def get_unfinished_payout_run():
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM payout_runs WHERE status='running' ORDER BY id LIMIT 1")
+    row = cur.fetchone()
+    return dict(row) if row else None
 
 def get_all_active_investments():
     conn = get_conn()
@@ -130,12 +752,55 @@ def list_all_users():
     cur.execute('SELECT * FROM users ORDER BY id DESC')
     return [dict(r) for r in cur.fetchall()]
 
+def list_users_page(before_id: Optional[int] = None, after_id: Optional[int] = None, limit: int = 10) -> Dict:
+    # Keyset page of users, newest first, with a pending-investment flag from the
+    # same query. before_id pages to older users, after_id back to newer ones.
+    conn = get_conn()
+    cur = conn.cursor()
+    base = '''SELECT u.*, EXISTS(SELECT 1 FROM investments i WHERE i.user_id = u.id AND i.active = 0) AS has_pending
+              FROM users u'''
+    if after_id is not None:
+        cur.execute(base + ' WHERE u.id > ? ORDER BY u.id ASC LIMIT ?', (after_id, limit + 1))
+    elif before_id is not None:
+        cur.execute(base + ' WHERE u.id < ? ORDER BY u.id DESC LIMIT ?', (before_id, limit + 1))
+    else:
+        cur.execute(base + ' ORDER BY u.id DESC LIMIT ?', (limit + 1,))
+    rows = [dict(r) for r in cur.fetchall()]
+    more = len(rows) > limit
+    rows = rows[:limit]
+    if after_id is not None:
+        rows.reverse()
+        return {'users': rows, 'has_prev': more, 'has_next': True}
+    return {'users': rows, 'has_prev': before_id is not None, 'has_next': more}
+
+def has_pending_investment(user_id: int) -> bool:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT 1 FROM investments WHERE user_id=? AND active=0 LIMIT 1', (user_id,))
+    return cur.fetchone() is not None
+
 def get_all_receipts():
     conn = get_conn()
     cur = conn.cursor()
     cur.execute('SELECT * FROM receipts ORDER BY created_at DESC')
     return [dict(r) for r in cur.fetchall()]
 
+def list_receipts_page(before_id: Optional[int] = None, limit: int = 10) -> List[Dict]:
+    # Newest receipts first, joined with their investment and user. before_id is
+    # the last receipt of the previous page (keyset on created_at, id).
+    conn = get_conn()
+    cur = conn.cursor()
+    sql = '''SELECT r.*, i.amount, i.active AS investment_active, u.username, u.telegram_id
+             FROM receipts r
+             LEFT JOIN investments i ON i.id = r.investment_id
+             LEFT JOIN users u ON u.id = r.user_id'''
+    if before_id is not None:
+        cur.execute(sql + ''' WHERE (r.created_at, r.id) < (SELECT created_at, id FROM receipts WHERE id = ?)
+                     ORDER BY r.created_at DESC, r.id DESC LIMIT ?''', (before_id, limit))
+    else:
+        cur.execute(sql + ' ORDER BY r.created_at DESC, r.id DESC LIMIT ?', (limit,))
+    return [dict(r) for r in cur.fetchall()]
+
 def get_latest_investment_for_user(user_id: int):
     conn = get_conn()
     cur = conn.cursor()
@@ -143,19 +808,81 @@ def get_latest_investment_for_user(user_id: int):
     row = cur.fetchone()
     return dict(row) if row else None
 
-def mark_investment_active(investment_id: int):
+def mark_investment_active(investment_id: int) -> bool:
+    # True only for the call that actually switched the investment to active
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('UPDATE investments SET active=1 WHERE id=? AND active=0', (investment_id,))
+        activated = cur.rowcount == 1
+        if activated:
+            _add_referral_investment(cur, investment_id)
+    return activated
+
+def _add_referral_investment(cur, investment_id: int):
+    # credit a newly active investment to the investor's referrer's stats row;
+    # a NULL amount counts as 0 (as SUM does in rebuild_referral_stats) instead
+    # of turning the counters NULL for good
+    cur.execute('''INSERT INTO referral_stats (user_id, active_referral_investment, earned_bonus)
+                   SELECT u.referrer_id, COALESCE(i.amount, 0), COALESCE(i.amount, 0) * ?
+                   FROM investments i JOIN users u ON u.id = i.user_id
+                   WHERE i.id = ? AND u.referrer_id IS NOT NULL
+                   ON CONFLICT(user_id) DO UPDATE SET
+                       active_referral_investment = active_referral_investment + excluded.active_referral_investment,
+                       earned_bonus = earned_bonus + excluded.earned_bonus''',
+                (REFERRAL_RATE, investment_id))
+
+def get_referral_stats(user_id: int) -> Dict:
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute('UPDATE investments SET active=1 WHERE id=?', (investment_id,))
-    conn.commit()
+    cur.execute('SELECT * FROM referral_stats WHERE user_id=?', (user_id,))
+    row = cur.fetchone()
+    if row:
+        return dict(row)
+    return {'user_id': user_id, 'referral_count': 0, 'active_referral_investment': 0.0, 'earned_bonus': 0.0}
 
-def add_receipt(user_id: int, investment_id: int, file_id: str, file_type: str):
+def rebuild_referral_stats():
+    # full recount from users/investments; init_db runs it when the table is empty
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM referral_stats')
+        cur.execute('''INSERT INTO referral_stats (user_id, referral_count, active_referral_investment, earned_bonus)
+                       SELECT referrer_id, COUNT(*), SUM(active_total), COUNT(*) * ? + SUM(active_total) * ?
+                       FROM (SELECT r.referrer_id,
+                                    COALESCE((SELECT SUM(i.amount) FROM investments i
+                                              WHERE i.user_id = r.id AND i.active = 1), 0) AS active_total
+                             FROM users r WHERE r.referrer_id IS NOT NULL)
+                       GROUP BY referrer_id''', (REFERRAL_BONUS, REFERRAL_RATE))
+
+def add_receipt(user_id: int, investment_id: int, file_id: str, file_type: str,
+                file_unique_id: Optional[str] = None, content_hash: Optional[str] = None):
+    # Each fingerprint belongs to the first receipt that claimed it; a later
+    # receipt with the same fingerprint records that one in duplicate_of.
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('''INSERT INTO receipts (user_id, investment_id, file_id, file_type, created_at, file_unique_id, content_hash)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    (user_id, investment_id, file_id, file_type, datetime.utcnow().isoformat(), file_unique_id, content_hash))
+        receipt_id = cur.lastrowid
+        duplicate_of = None
+        fingerprints = [f'u:{file_unique_id}' if file_unique_id else None, f'h:{content_hash}' if content_hash else None]
+        for fp in filter(None, fingerprints):
+            cur.execute('INSERT OR IGNORE INTO receipt_fingerprints (fingerprint, receipt_id) VALUES (?, ?)', (fp, receipt_id))
+            if cur.rowcount == 0 and duplicate_of is None:
+                cur.execute('SELECT receipt_id FROM receipt_fingerprints WHERE fingerprint=?', (fp,))
+                duplicate_of = cur.fetchone()['receipt_id']
+        if duplicate_of is not None:
+            cur.execute('UPDATE receipts SET duplicate_of=? WHERE id=?', (duplicate_of, receipt_id))
+    return receipt_id
+
+def get_receipt(receipt_id: int):
+    # with the investment of the receipt it duplicates, if any
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute('''INSERT INTO receipts (user_id, investment_id, file_id, file_type, created_at)
-                   VALUES (?, ?, ?, ?, ?)''', (user_id, investment_id, file_id, file_type, datetime.utcnow().isoformat()))
-    conn.commit()
-    return cur.lastrowid
+    cur.execute('''SELECT r.*, d.investment_id AS duplicate_investment_id, d.user_id AS duplicate_user_id
+                   FROM receipts r LEFT JOIN receipts d ON d.id = r.duplicate_of
+                   WHERE r.id=?''', (receipt_id,))
+    row = cur.fetchone()
+    return dict(row) if row else None
 
 def get_investment_by_id(investment_id: int):
     conn = get_conn()
@@ -165,11 +892,14 @@ def get_investment_by_id(investment_id: int):
     return dict(row) if row else None
 
 def get_user_by_id(uid: int):
+    row = _user_cache.get(uid)
+    if row is not None:
+        return row
+    version = _user_cache.version
     conn = get_conn()
     cur = conn.cursor()
     cur.execute('SELECT * FROM users WHERE id=?', (uid,))
-    row = cur.fetchone()
-    return dict(row) if row else None
+    return _cached_user(cur.fetchone(), version)
 
 def get_referrals_of(user_id: int):
     conn = get_conn()
@@ -182,4 +912,138 @@ def add_withdrawal_request(user_id: int, amount: float):
     cur = conn.cursor()
     cur.execute('INSERT INTO withdrawals (user_id, amount, status, created_at) VALUES (?, ?, ?, ?)',
                 (user_id, amount, 'pending', datetime.utcnow().isoformat()))
-    conn.commit()
+    _commit(conn)
+    return cur.lastrowid
+
+def enqueue_outbox(messages: List[tuple]):
+    # messages: [(chat_id, method, payload_json), ...]
+    conn = get_conn()
+    cur = conn.cursor()
+    now = datetime.utcnow().isoformat()
+    cur.executemany("INSERT INTO outbox (chat_id, method, payload, status, created_at) VALUES (?, ?, ?, 'pending', ?)",
+                    [(c, m, p, now) for c, m, p in messages])
+    _commit(conn)
+
+def claim_outbox(now: float, limit: int) -> List[Dict]:
+    # mark due messages as 'sending' and return them, oldest first
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT * FROM outbox WHERE status='pending' AND not_before <= ? ORDER BY id LIMIT ?", (now, limit))
+        rows = [dict(r) for r in cur.fetchall()]
+        cur.executemany("UPDATE outbox SET status='sending' WHERE id=?", [(r['id'],) for r in rows])
+    return rows
+
+def delete_outbox(message_id: int):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('DELETE FROM outbox WHERE id=?', (message_id,))
+    _commit(conn)
+
+def reschedule_outbox(message_id: int, not_before: float, error: Optional[str] = None, attempt: bool = True):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("UPDATE outbox SET status='pending', not_before=?, attempts = attempts + ?, last_error = COALESCE(?, last_error) WHERE id=?",
+                (not_before, 1 if attempt else 0, error, message_id))
+    _commit(conn)
+
+def reschedule_outbox_many(messages: List[tuple]):
+    # messages: [(id, not_before), ...]; puts them back without counting an attempt
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.executemany("UPDATE outbox SET status='pending', not_before=? WHERE id=?", [(t, i) for i, t in messages])
+    _commit(conn)
+
+def next_outbox_due() -> Optional[float]:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT MIN(not_before) FROM outbox WHERE status='pending'")
+    return cur.fetchone()[0]
+
+def fail_outbox(message_id: int, error: str):
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("UPDATE outbox SET status='failed', attempts = attempts + 1, last_error=? WHERE id=?", (error, message_id))
+    _commit(conn)
+
+def requeue_sending_outbox():
+    # messages left 'sending' by a crashed process go back to the queue
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("UPDATE outbox SET status='pending' WHERE status='sending'")
+    _commit(conn)
+
+# Admin registry. Every change bumps meta.admins_version in the same
+# transaction; processes compare it to decide whether to reload the set.
+
+def _bump_admins_version(cur):
+    cur.execute("""INSERT INTO meta (key, value) VALUES ('admins_version', 1)
+                   ON CONFLICT(key) DO UPDATE SET value = value + 1""")
+
+def get_admins_version() -> int:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT value FROM meta WHERE key='admins_version'")
+    row = cur.fetchone()
+    return row['value'] if row else 0
+
+def list_admins() -> List[Dict]:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT * FROM admins ORDER BY telegram_id')
+    return [dict(r) for r in cur.fetchall()]
+
+def upsert_admin(telegram_id: int, role: str = 'admin', notify: bool = True, source: Optional[str] = None):
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('''INSERT INTO admins (telegram_id, role, notify, source, added_at) VALUES (?, ?, ?, ?, ?)
+                       ON CONFLICT(telegram_id) DO UPDATE SET role=excluded.role, notify=excluded.notify, source=excluded.source''',
+                    (telegram_id, role, 1 if notify else 0, source, datetime.utcnow().isoformat()))
+        _bump_admins_version(cur)
+
+def remove_admin(telegram_id: int) -> bool:
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute('DELETE FROM admins WHERE telegram_id=?', (telegram_id,))
+        removed = cur.rowcount == 1
+        if removed:
+            _bump_admins_version(cur)
+    return removed
+
+def sync_env_admins(admins: List[tuple]):
+    # admins: [(telegram_id, role, notify), ...] from the environment. Rows
+    # added at runtime (other sources) are left alone.
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT telegram_id, role, notify FROM admins WHERE source='env'")
+        current = {r['telegram_id']: (r['role'], r['notify']) for r in cur.fetchall()}
+        wanted = {tid: (role, 1 if notify else 0) for tid, role, notify in admins}
+        if current == wanted:
+            return
+        cur.executemany("DELETE FROM admins WHERE telegram_id=? AND source='env'", [(tid,) for tid in current if tid not in wanted])
+        now = datetime.utcnow().isoformat()
+        cur.executemany('''INSERT INTO admins (telegram_id, role, notify, source, added_at) VALUES (?, ?, ?, 'env', ?)
+                           ON CONFLICT(telegram_id) DO UPDATE SET role=excluded.role, notify=excluded.notify, source='env'
+                           WHERE admins.source = 'env' ''',
+                        [(tid, role, notify, now) for tid, (role, notify) in wanted.items()])
+        _bump_admins_version(cur)
+
+def load_user_state(user_id: int) -> Optional[str]:
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute('SELECT data FROM user_state WHERE user_id=?', (user_id,))
+    row = cur.fetchone()
+    return row['data'] if row else None
+
+def save_user_states(states: List[tuple]):
+    # states: [(user_id, json), ...]; an empty state deletes the row
+    now = datetime.utcnow().isoformat()
+    with transaction() as conn:
+        cur = conn.cursor()
+        cur.executemany('''INSERT INTO user_state (user_id, data, updated_at) VALUES (?, ?, ?)
+                           ON CONFLICT(user_id) DO UPDATE SET data=excluded.data, updated_at=excluded.updated_at''',
+                        [(uid, data, now) for uid, data in states if data != '{}'])
+        cur.executemany('DELETE FROM user_state WHERE user_id=?', [(uid,) for uid, data in states if data == '{}'])
+
+
+# db_call_seconds{function}; must stay last so every accessor above is wrapped
+metrics.instrument_module(globals(), metrics.db_call_seconds, exclude=('get_conn', 'transaction', 'cache_stats', 'slow_queries'))
@@ -0,0 +1,100 @@
+"""Per-user serialized handler execution.
+
+`KeyedExecutor` runs tasks on a shared thread pool: tasks with different keys
+run in parallel, tasks with the same key run one at a time in submission
+order. `per_user()` wraps a PTB callback so each update is queued under its
+user id, which keeps `context.user_data` flows (pending_investment,
+awaiting_withdraw_card, ...) and same-user balance checks race-free while
+other users' updates are not held up by a slow handler.
+"""
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# tasks a worker runs for one key before handing the thread back to the pool
+MAX_BURST = 8
+
+
+class KeyedExecutor:
+    def __init__(self, workers: int):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='handler')
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._closing = False
+
+    def submit(self, key, fn, *args):
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                # a drain for this key is scheduled or running; it will pick this up
+                queue.append((fn, args))
+                return
+            self._queues[key] = deque([(fn, args)])
+        try:
+            self._pool.submit(self._drain, key)
+        except RuntimeError:
+            # submitted after shutdown(): nothing will run it
+            with self._lock:
+                dropped = len(self._queues.pop(key, ()))
+            logging.warning('Handler pool is shut down; dropped %d task(s) for %s', dropped, key)
+
+    def _drain(self, key):
+        ran = 0
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                fn, args = queue.popleft()
+            try:
+                fn(*args)
+            except Exception:
+                logging.exception('Unhandled error in handler task for %s', key)
+            ran += 1
+            if ran >= MAX_BURST and not self._closing:
+                # busy key: requeue behind other users instead of holding this worker
+                try:
+                    self._pool.submit(self._drain, key)
+                    return
+                except RuntimeError:
+                    # shutdown() started since the check; finish this key here
+                    pass
+
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(q) for q in self._queues.values())
+
+    def shutdown(self, wait: bool = True):
+        # from here on a drain keeps its key until the queue is empty, so with
+        # wait=True everything queued before the call has run when it returns
+        self._closing = True
+        self._pool.shutdown(wait=wait)
+        if wait and self.pending():
+            logging.warning('Handler pool shut down with %d task(s) still queued', self.pending())
+
+
+def _update_key(update):
+    if getattr(update, 'effective_user', None):
+        return ('user', update.effective_user.id)
+    if getattr(update, 'effective_chat', None):
+        return ('chat', update.effective_chat.id)
+    return ('update', id(update))
+
+
+def _run(callback, update, context):
+    try:
+        callback(update, context)
+    except Exception as e:
+        context.dispatcher.dispatch_error(update, e)
+    context.dispatcher.update_persistence(update)
+
+
+def per_user(executor: KeyedExecutor, callback):
+    """Wrap a handler callback so it runs on `executor`, serialized per user."""
+    def wrapper(update, context):
+        executor.submit(_update_key(update), _run, callback, update, context)
+    wrapper.__name__ = getattr(callback, '__name__', 'handler')
+    wrapper.__wrapped__ = callback
+    return wrapper
@@ -0,0 +1,4 @@
+"""Local stand-in for the Telegram Bot API plus a session-replay load generator.
+
+    python -m loadtest.run --users 50
+"""
@@ -0,0 +1,239 @@
+"""Minimal in-process Telegram Bot API server.
+
+Serves the methods the bot uses (getMe, getUpdates, sendMessage, sendPhoto,
+sendDocument, sendMediaGroup, editMessageText, editMessageReplyMarkup,
+answerCallbackQuery, deleteWebhook, setWebhook, getFile). Tests inject updates
+with `push_update()` and observe the bot's calls through `wait_for()`. Once
+the bot calls setWebhook, pushed updates are POSTed to it like Telegram would.
+File contents are served under `base_file_url`; `add_file()` sets them, other
+file ids get bytes derived from the id.
+"""
+import email.parser
+import itertools
+import json
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+BOT_USER = {'id': 1000000001, 'is_bot': True, 'first_name': 'Fake', 'username': 'fake_invest_bot'}
+# getUpdates long-poll cap, so a stopping bot is not held for its full timeout
+MAX_POLL_WAIT = 1.0
+
+
+def _parse_body(content_type: str, body: bytes) -> Dict:
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    if content_type.startswith('multipart/form-data'):
+        msg = email.parser.BytesParser().parsebytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+        data = {}
+        for part in msg.get_payload():
+            name = part.get_param('name', header='content-disposition')
+            payload = part.get_payload(decode=True)
+            data[name] = payload if part.get_filename() else payload.decode('utf-8')
+        return data
+    return {}
+
+
+class FakeTelegram:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self._lock = threading.Condition()
+        self._updates: List[Dict] = []
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._waiters = []
+        self.calls = []
+        self.polled = threading.Event()
+        # set once the bot is receiving: first getUpdates or setWebhook
+        self.ready = threading.Event()
+        self.webhook = None
+        self.files: Dict[str, bytes] = {}
+        self.server = ThreadingHTTPServer((host, port), self._handler_class())
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/bot'
+
+    @property
+    def base_file_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f'http://{host}:{port}/file/bot'
+
+    def add_file(self, file_id: str, content: bytes):
+        self.files[file_id] = content
+
+    def file_content(self, file_id: str) -> bytes:
+        return self.files.get(file_id) or (file_id.encode() * 64)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name='fake-telegram', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    # -- update side -------------------------------------------------------
+
+    def push_update(self, update: Dict) -> int:
+        with self._lock:
+            update = dict(update, update_id=next(self._update_ids))
+            if self.webhook is None:
+                self._updates.append(update)
+                self._lock.notify_all()
+                return update['update_id']
+            url, secret = self.webhook
+        self._post_webhook(url, secret, update)
+        return update['update_id']
+
+    def _post_webhook(self, url: str, secret: Optional[str], update: Dict):
+        req = urllib.request.Request(url, data=json.dumps(update).encode(), method='POST',
+                                     headers={'Content-Type': 'application/json'})
+        if secret:
+            req.add_header('X-Telegram-Bot-Api-Secret-Token', secret)
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            resp.read()
+
+    def _get_updates(self, params: Dict) -> List[Dict]:
+        offset = int(params.get('offset') or 0)
+        timeout = min(float(params.get('timeout') or 0), MAX_POLL_WAIT)
+        deadline = time.monotonic() + timeout
+        self.polled.set()
+        self.ready.set()
+        with self._lock:
+            # confirmed updates (id < offset) are dropped, like the real API
+            self._updates = [u for u in self._updates if u['update_id'] >= offset]
+            while not self._updates and time.monotonic() < deadline:
+                self._lock.wait(deadline - time.monotonic())
+            return list(self._updates[:100])
+
+    # -- bot call side -----------------------------------------------------
+
+    def wait_for(self, predicate: Callable[[str, Dict], bool], timeout: float = 10.0) -> 'Waiter':
+        """Register interest in a bot call *before* pushing the update that causes it."""
+        waiter = Waiter(predicate)
+        with self._lock:
+            self._waiters.append(waiter)
+        waiter.timeout = timeout
+        return waiter
+
+    def _record(self, method: str, params: Dict):
+        now = time.perf_counter()
+        with self._lock:
+            self.calls.append((now, method, params))
+            for waiter in list(self._waiters):
+                if waiter.predicate(method, params):
+                    waiter.fire(now, method, params)
+                    self._waiters.remove(waiter)
+
+    def _message(self, params: Dict, **extra) -> Dict:
+        chat_id = params.get('chat_id')
+        try:
+            chat_id = int(chat_id)
+        except (TypeError, ValueError):
+            pass
+        msg = {'message_id': next(self._message_ids), 'date': int(time.time()),
+               'chat': {'id': chat_id, 'type': 'private'}, 'from': BOT_USER}
+        msg.update(extra)
+        return msg
+
+    def handle(self, method: str, params: Dict):
+        if method == 'getUpdates':
+            return self._get_updates(params)
+        self._record(method, params)
+        if method == 'getMe':
+            return BOT_USER
+        if method == 'setWebhook':
+            with self._lock:
+                self.webhook = (params['url'], params.get('secret_token')) if params.get('url') else None
+            self.ready.set()
+            return True
+        if method == 'deleteWebhook':
+            with self._lock:
+                self.webhook = None
+            return True
+        if method == 'answerCallbackQuery':
+            return True
+        if method == 'getFile':
+            file_id = str(params.get('file_id'))
+            return {'file_id': file_id, 'file_unique_id': 'f' + file_id,
+                    'file_size': len(self.file_content(file_id)), 'file_path': f'files/{file_id}'}
+        if method == 'sendMessage':
+            return self._message(params, text=params.get('text', ''))
+        if method in ('editMessageText', 'editMessageReplyMarkup'):
+            return self._message(params, text=params.get('text', ''))
+        if method == 'sendPhoto':
+            return self._message(params, caption=params.get('caption'),
+                                 photo=[{'file_id': str(params.get('photo')), 'file_unique_id': 'p', 'width': 1, 'height': 1}])
+        if method == 'sendDocument':
+            return self._message(params, caption=params.get('caption'),
+                                 document={'file_id': str(params.get('document')), 'file_unique_id': 'd'})
+        if method == 'sendMediaGroup':
+            media = params.get('media')
+            media = json.loads(media) if isinstance(media, str) else (media or [])
+            return [self._message(params, caption=m.get('caption')) for m in media]
+        raise LookupError(method)
+
+    def _handler_class(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length)
+                method = self.path.rsplit('/', 1)[-1]
+                try:
+                    result = fake.handle(method, _parse_body(self.headers.get('Content-Type', ''), body))
+                    payload, status = {'ok': True, 'result': result}, 200
+                except LookupError:
+                    payload, status = {'ok': False, 'error_code': 404, 'description': 'Not Found: method not found'}, 404
+                except Exception as e:
+                    payload, status = {'ok': False, 'error_code': 400, 'description': f'Bad Request: {e}'}, 400
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                # /file/bot<token>/files/<file_id>
+                if not self.path.startswith('/file/'):
+                    return self.do_POST()
+                data = fake.file_content(self.path.rsplit('/', 1)[-1])
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+
+class Waiter:
+    def __init__(self, predicate):
+        self.predicate = predicate
+        self.timeout = 10.0
+        self.event = threading.Event()
+        self.at: Optional[float] = None
+        self.method = None
+        self.params = None
+
+    def fire(self, at, method, params):
+        self.at, self.method, self.params = at, method, params
+        self.event.set()
+
+    def wait(self) -> bool:
+        return self.event.wait(self.timeout)
@@ -0,0 +1,186 @@
+"""Replay scripted user sessions against the real bot through the fake API.
+
+Starts `loadtest.fake_api`, launches `python bot.py` pointed at it with a
+throwaway database, and runs N concurrent sessions:
+
+    /start <ref code> -> Yatırım -> confirm 50 AZN -> receipt photo
+    -> admin /verify -> Çıxarış (card, name, amount)
+
+Each step is timed from the moment its update is queued on the fake server
+until the bot's answering call arrives. Prints (or writes as JSON)
+per-step p50/p95/p99 latency and overall throughput.
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import socket
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from loadtest.fake_api import FakeTelegram
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = '123456:LOADTEST'
+ADMIN_ID = 900000001
+FIRST_USER_ID = 700000000
+
+
+def _user(uid):
+    return {'id': uid, 'is_bot': False, 'first_name': f'User{uid}', 'username': f'user{uid}'}
+
+
+def _chat(uid):
+    return {'id': uid, 'type': 'private'}
+
+
+def text_update(uid, text):
+    msg = {'message_id': 1, 'date': int(time.time()), 'chat': _chat(uid), 'from': _user(uid), 'text': text}
+    if text.startswith('/'):
+        msg['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+    return {'message': msg}
+
+
+def photo_update(uid, file_id):
+    photo = [{'file_id': file_id, 'file_unique_id': 'u' + file_id, 'width': 800, 'height': 600, 'file_size': 1000}]
+    return {'message': {'message_id': 2, 'date': int(time.time()), 'chat': _chat(uid), 'from': _user(uid), 'photo': photo}}
+
+
+def callback_update(uid, data, text='...'):
+    message = {'message_id': 3, 'date': int(time.time()), 'chat': _chat(uid), 'from': {'id': 1, 'is_bot': True, 'first_name': 'bot'}, 'text': text}
+    return {'callback_query': {'id': f'{uid}-{time.monotonic_ns()}', 'from': _user(uid), 'chat_instance': str(uid), 'data': data, 'message': message}}
+
+
+def to_chat(chat_id, contains=None, methods=('sendMessage', 'editMessageText', 'sendPhoto', 'sendDocument')):
+    def predicate(method, params):
+        if method not in methods or str(params.get('chat_id')) != str(chat_id):
+            return False
+        if contains is None:
+            return True
+        blob = f"{params.get('text') or ''}{params.get('caption') or ''}{params.get('reply_markup') or ''}"
+        return contains in blob
+    return predicate
+
+
+class Session:
+    def __init__(self, fake: FakeTelegram, uid: int, ref_code: str, timeout: float):
+        self.fake = fake
+        self.uid = uid
+        self.ref_code = ref_code
+        self.timeout = timeout
+        self.timings = {}
+        self.error = None
+
+    def step(self, name, update, predicate):
+        waiter = self.fake.wait_for(predicate, self.timeout)
+        start = time.perf_counter()
+        self.fake.push_update(update)
+        if not waiter.wait():
+            raise TimeoutError(f'user {self.uid}: no answer for step {name!r}')
+        self.timings[name] = waiter.at - start
+        return waiter
+
+    def run(self):
+        uid = self.uid
+        try:
+            self.step('start', text_update(uid, f'/start {self.ref_code}'), to_chat(uid))
+            self.step('invest_menu', text_update(uid, '💼 Yatırım'), to_chat(uid))
+            w = self.step('confirm_pay', callback_update(uid, 'confirm_pay:50'), to_chat(uid, 'prompt_upload:'))
+            inv_id = int(re.search(r'prompt_upload:(\d+)', w.params['reply_markup']).group(1))
+            self.step('receipt_photo', photo_update(uid, f'PHOTO{uid}'), to_chat(uid, 'Qəbz'))
+            self.step('admin_verify', text_update(ADMIN_ID, f'/verify {inv_id}'), to_chat(ADMIN_ID, f'Invest ID {inv_id} '))
+            self.step('withdraw_menu', text_update(uid, '💸 Çıxarış'), to_chat(uid))
+            self.step('withdraw_card', text_update(uid, '4169738812345678'), to_chat(uid))
+            self.step('withdraw_name', text_update(uid, 'Load Test'), to_chat(uid, 'withdraw_amt:'))
+            self.step('withdraw_amount', callback_update(uid, 'withdraw_amt:50'), to_chat(uid, methods=('editMessageText',)))
+        except Exception as e:
+            self.error = e
+        return self
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20, help='concurrent sessions')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds to wait for each answer')
+    parser.add_argument('--out', help='write results JSON here')
+    parser.add_argument('--bot-log', help='file for the bot process output (default: discarded)')
+    parser.add_argument('--webhook', action='store_true', help='run the bot in webhook mode instead of polling')
+    args = parser.parse_args(argv)
+
+    fake = FakeTelegram().start()
+    workdir = tempfile.mkdtemp(prefix='loadtest-')
+    env = dict(os.environ, TELEGRAM_TOKEN=TOKEN, TELEGRAM_API_URL=fake.base_url, TELEGRAM_FILE_URL=fake.base_file_url,
+               DATABASE_FILE=os.path.join(workdir, 'loadtest.db'),
+               ADMIN_CHAT_IDS=str(ADMIN_ID), ADMIN_TELEGRAM_ID=str(ADMIN_ID), PYTHONUNBUFFERED='1')
+    if args.webhook:
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            port = s.getsockname()[1]
+        env.update(BOT_MODE='webhook', PORT=str(port), WEBHOOK_LISTEN='127.0.0.1',
+                   WEBHOOK_URL=f'http://127.0.0.1:{port}/telegram', WEBHOOK_SECRET='loadtest-secret')
+    log = open(args.bot_log, 'w') if args.bot_log else subprocess.DEVNULL
+    proc = subprocess.Popen([sys.executable, 'bot.py'], cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not fake.ready.wait(60):
+            raise SystemExit('bot did not start receiving updates')
+        # a referrer everyone signs up under
+        referrer = FIRST_USER_ID - 1
+        w = fake.wait_for(to_chat(referrer, 'referal kodunuz'), args.timeout)
+        fake.push_update(text_update(referrer, '/start'))
+        if not w.wait():
+            raise SystemExit('bot did not answer /start')
+        ref_code = re.search(r'referal kodunuz: (\w+)', w.params['text']).group(1)
+
+        sessions = [Session(fake, FIRST_USER_ID + i, ref_code, args.timeout) for i in range(args.users)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            done = list(pool.map(Session.run, sessions))
+        elapsed = time.perf_counter() - started
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(15)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        fake.stop()
+        if log is not subprocess.DEVNULL:
+            log.close()
+
+    steps = {}
+    for s in done:
+        for name, seconds in s.timings.items():
+            steps.setdefault(name, []).append(seconds)
+    errors = [str(s.error) for s in done if s.error]
+    updates = sum(len(s.timings) for s in done)
+    report = {
+        'users': args.users,
+        'completed_sessions': len(done) - len(errors),
+        'errors': errors[:20],
+        'elapsed_seconds': elapsed,
+        'sessions_per_sec': (len(done) - len(errors)) / elapsed if elapsed else None,
+        'updates_per_sec': updates / elapsed if elapsed else None,
+        'steps': {name: {'count': len(v), 'p50_ms': percentile(v, 0.5) * 1000, 'p95_ms': percentile(v, 0.95) * 1000,
+                         'p99_ms': percentile(v, 0.99) * 1000, 'max_ms': max(v) * 1000} for name, v in steps.items()},
+    }
+    print(f"{report['completed_sessions']}/{args.users} sessions in {elapsed:.2f}s — "
+          f"{report['updates_per_sec']:.1f} updates/s, {report['sessions_per_sec']:.2f} sessions/s")
+    for name, st in report['steps'].items():
+        print(f"  {name:16} p50 {st['p50_ms']:8.1f} ms  p95 {st['p95_ms']:8.1f} ms  p99 {st['p99_ms']:8.1f} ms")
+    for e in errors[:5]:
+        print('  error:', e)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    return 1 if errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,247 @@
+"""In-process metrics served in the Prometheus text format.
+
+Counters and histograms are kept per label value in plain dicts under one
+lock. Nothing is recorded until `serve()` starts the exposition endpoint
+(METRICS_PORT); before that every observation is a flag check.
+
+    handler_seconds{handler}          PTB handlers and routed callbacks/menus
+    db_call_seconds{function}         every public db.py function
+    telegram_api_calls_total{method}  Bot API requests
+    telegram_api_errors_total{method,error}
+    payout_run_seconds{mode}          daily payout runs
+"""
+import functools
+import inspect
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# seconds; +Inf is implied
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_enabled = False
+_lock = threading.Lock()
+_metrics: List['_Metric'] = []
+
+
+def _labels(names: Tuple[str, ...], values: Tuple, extra: str = '') -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        with _lock:
+            _metrics.append(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        return '\n'.join([f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}'] + self.samples())
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self._values: Dict[Tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1.0):
+        if not _enabled:
+            return
+        with _lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with _lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.labels, k)} {v:g}' for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._values: Dict[Tuple, list] = {}
+
+    def observe(self, seconds: float, *label_values):
+        if not _enabled:
+            return
+        i = bisect_left(self.buckets, seconds)
+        with _lock:
+            entry = self._values.get(label_values)
+            if entry is None:
+                entry = self._values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][i] += 1
+            entry[1] += seconds
+
+    def time(self, *label_values):
+        return _Timer(self, label_values)
+
+    def samples(self) -> List[str]:
+        with _lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float('inf') else f'le="{bound:g}"'
+                lines.append(f'{self.name}_bucket{_labels(self.labels, key, le)} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labels, key)} {total:.6f}')
+            lines.append(f'{self.name}_count{_labels(self.labels, key)} {cumulative}')
+        return lines
+
+
+class _Timer:
+    __slots__ = ('histogram', 'label_values', 'started')
+
+    def __init__(self, histogram: Histogram, label_values: Tuple):
+        self.histogram = histogram
+        self.label_values = label_values
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.label_values)
+
+
+class Gauge(_Metric):
+    """Value read from a callback at scrape time (kind='counter' for running totals kept elsewhere)."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read: Callable[[], Optional[float]], kind: str = 'gauge'):
+        super().__init__(name, help)
+        self._read = read
+        self.kind = kind
+
+    def samples(self) -> List[str]:
+        try:
+            value = self._read()
+        except Exception:
+            logging.exception('metrics: reading %s failed', self.name)
+            return []
+        return [] if value is None else [f'{self.name} {value:g}']
+
+
+handler_seconds = Histogram('handler_seconds', 'Time spent in bot handlers', ('handler',))
+db_call_seconds = Histogram('db_call_seconds', 'Time spent in db.py functions', ('function',))
+telegram_api_calls = Counter('telegram_api_calls_total', 'Bot API requests', ('method',))
+telegram_api_errors = Counter('telegram_api_errors_total', 'Bot API requests that raised', ('method', 'error'))
+payout_run_seconds = Histogram('payout_run_seconds', 'Duration of daily payout runs', ('mode',))
+
+
+def timed(histogram: Histogram, label: str) -> Callable:
+    """Decorator observing the wrapped function's duration under `label`."""
+    def wrap(fn):
+        @functools.wraps(fn)
+        def call(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - started, label)
+        return call
+    return wrap
+
+
+def handler(fn: Callable) -> Callable:
+    return timed(handler_seconds, fn.__name__)(fn)
+
+
+def instrument_module(namespace: Dict, histogram: Histogram, exclude: Iterable[str] = ()):
+    """Replace the public functions defined in a module's namespace with timed wrappers.
+
+    Called from the module itself, at its end, so that `from module import f`
+    elsewhere already gets the wrapper.
+    """
+    exclude = set(exclude)
+    module = namespace['__name__']
+    for name, value in list(namespace.items()):
+        if (inspect.isfunction(value) and value.__module__ == module
+                and not name.startswith('_') and name not in exclude):
+            namespace[name] = timed(histogram, name)(value)
+
+
+def instrument_request(request):
+    """Count the Bot API calls (and their errors) made through a telegram.utils.request.Request."""
+    post = request.post
+
+    @functools.wraps(post)
+    def counted_post(url, *args, **kwargs):
+        method = url.rsplit('/', 1)[-1]
+        telegram_api_calls.inc(method)
+        try:
+            return post(url, *args, **kwargs)
+        except Exception as e:
+            telegram_api_errors.inc(method, type(e).__name__)
+            raise
+    request.post = counted_post
+    return request
+
+
+def render() -> str:
+    with _lock:
+        metrics = list(_metrics)
+    return '\n'.join(m.render() for m in metrics) + '\n'
+
+
+_server = None
+
+
+def serve(port: int, host: str = '127.0.0.1'):
+    """Start recording and serve GET /metrics on host:port from a daemon thread."""
+    global _enabled, _server
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    _enabled = True
+    _server = ThreadingHTTPServer((host, port), Handler)
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name='metrics', daemon=True).start()
+    logging.info('metrics: serving on http://%s:%d/metrics', host, _server.server_address[1])
+    return _server
+
+
+def stop():
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
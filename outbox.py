@@ -0,0 +1,179 @@
+"""Persistent, rate-limited outbox for outgoing Telegram messages.
+
+Callers queue messages with `send()` / `send_many()` and return immediately;
+rows live in the `outbox` table until an `OutboxWorker` delivers them through
+a single shared Bot, respecting Telegram's global and per-chat flood limits.
+The dispatch loop paces claimed rows to the global rate itself; rows whose
+chat is still busy go back to the table in one update, and an idle loop
+sleeps until the next row is due.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional
+
+from db import (enqueue_outbox, claim_outbox, delete_outbox, reschedule_outbox, reschedule_outbox_many, fail_outbox,
+                requeue_sending_outbox, next_outbox_due)
+
+# Bot API limits: ~30 messages/second overall, ~1 message/second per chat
+GLOBAL_RATE = 30
+PER_CHAT_INTERVAL = 1.0
+MAX_ATTEMPTS = 5
+CLAIM_BATCH = 100
+POLL_INTERVAL = 1.0
+# a worker waits at most this long for a send slot; later slots go back to the table
+MAX_HOLD = 0.25
+
+_wakeup = threading.Event()
+
+
+def _encode(kwargs: Dict) -> str:
+    payload = dict(kwargs)
+    markup = payload.get('reply_markup')
+    if markup is not None and hasattr(markup, 'to_json'):
+        payload['reply_markup'] = markup.to_json()
+    return json.dumps(payload, ensure_ascii=False)
+
+
+def send(chat_id, text: Optional[str] = None, method: str = 'send_message', **kwargs):
+    """Queue one message. Extra kwargs are passed to the Bot method as-is."""
+    send_many([chat_id], text, method, **kwargs)
+
+
+def send_many(chat_ids: Iterable, text: Optional[str] = None, method: str = 'send_message', **kwargs):
+    """Queue the same message for several chats in one insert."""
+    if text is not None:
+        kwargs['caption' if method in ('send_photo', 'send_document') else 'text'] = text
+    payload = _encode(kwargs)
+    rows = [(chat_id, method, payload) for chat_id in chat_ids]
+    if rows:
+        enqueue_outbox(rows)
+        _wakeup.set()
+
+
+def send_batch(messages: Iterable, method: str = 'send_message'):
+    """Queue a different text per chat: messages is [(chat_id, text), ...]."""
+    key = 'caption' if method in ('send_photo', 'send_document') else 'text'
+    rows = [(chat_id, method, _encode({key: text})) for chat_id, text in messages]
+    if rows:
+        enqueue_outbox(rows)
+        _wakeup.set()
+
+
+class OutboxWorker:
+    def __init__(self, bot, workers: int = 4):
+        self.bot = bot
+        self.workers = workers
+        self._pool = None
+        self._thread = None
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self._next_global = 0.0
+        self._next_chat = {}
+
+    def start(self):
+        requeue_sending_outbox()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='outbox')
+        self._thread = threading.Thread(target=self._loop, name='outbox-dispatch', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        self._stopped.set()
+        _wakeup.set()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._pool:
+            self._pool.shutdown(wait=True)
+
+    def _reserve(self, chat_id, now: float) -> float:
+        # earliest slot allowed by both the global and the per-chat limit
+        with self._lock:
+            slot = max(now, self._next_global, self._next_chat.get(chat_id, 0.0))
+            if slot - now > MAX_HOLD:
+                return slot
+            self._next_global = slot + 1.0 / GLOBAL_RATE
+            self._next_chat[chat_id] = slot + PER_CHAT_INTERVAL
+            if len(self._next_chat) > 10000:
+                self._next_chat = {c: t for c, t in self._next_chat.items() if t > now}
+            return slot
+
+    def _global_wait(self, now: float) -> float:
+        with self._lock:
+            return self._next_global - MAX_HOLD - now
+
+    def _idle_wait(self) -> float:
+        try:
+            due = next_outbox_due()
+        except Exception:
+            logging.exception('outbox: reading next due time failed')
+            due = None
+        if due is None:
+            return POLL_INTERVAL
+        return min(POLL_INTERVAL, max(due - time.time(), 0.01))
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            _wakeup.clear()
+            try:
+                rows = claim_outbox(time.time(), CLAIM_BATCH)
+            except Exception:
+                logging.exception('outbox: claim failed')
+                rows = []
+            if not rows:
+                _wakeup.wait(self._idle_wait())
+                continue
+            later = []
+            busy = {}
+            for row in rows:
+                if self._stopped.is_set():
+                    later.append((row['id'], time.time()))
+                    continue
+                # rows past the global rate wait here, in memory
+                wait = self._global_wait(time.time())
+                if wait > 0:
+                    self._stopped.wait(wait)
+                now = time.time()
+                slot = self._reserve(row['chat_id'], now)
+                if slot - now > MAX_HOLD:
+                    # chat is busy; put it back instead of holding a worker,
+                    # one interval apart from the chat's other rows in this batch
+                    slot = busy.get(row['chat_id'], slot)
+                    busy[row['chat_id']] = slot + PER_CHAT_INTERVAL
+                    later.append((row['id'], slot))
+                    continue
+                self._pool.submit(self._deliver, row, slot)
+            if later:
+                try:
+                    reschedule_outbox_many(later)
+                except Exception:
+                    # left 'sending'; requeue_sending_outbox() returns them on the next start
+                    logging.exception('outbox: rescheduling %d messages failed', len(later))
+
+    def _deliver(self, row: Dict, slot: float):
+        from telegram.error import RetryAfter, TimedOut, NetworkError, BadRequest, Unauthorized
+        delay = slot - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        try:
+            getattr(self.bot, row['method'])(chat_id=row['chat_id'], **json.loads(row['payload']))
+        except RetryAfter as e:
+            until = time.time() + float(e.retry_after)
+            with self._lock:
+                self._next_chat[row['chat_id']] = until
+            reschedule_outbox(row['id'], until, str(e), attempt=False)
+        except (BadRequest, Unauthorized) as e:
+            # blocked bot, unknown chat, bad file id: retrying will not help
+            logging.warning('outbox: dropping message %s to %s: %s', row['id'], row['chat_id'], e)
+            fail_outbox(row['id'], str(e))
+        except (TimedOut, NetworkError) as e:
+            if row['attempts'] + 1 >= MAX_ATTEMPTS:
+                fail_outbox(row['id'], str(e))
+            else:
+                reschedule_outbox(row['id'], time.time() + 2 ** row['attempts'], str(e))
+        except Exception as e:
+            logging.exception('outbox: failed to send message %s', row['id'])
+            fail_outbox(row['id'], str(e))
+        else:
+            delete_outbox(row['id'])
@@ -1,45 +1,84 @@
-from typing import Dict
+import logging
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 from datetime import datetime
-from db import get_all_active_investments, get_user_by_id, update_user_balance, get_referrals_of
+import metrics
+import payout_engine
+import payout_shards
+from db import (REFERRAL_RATE, REFERRAL_BONUS, apply_balance_deltas, transaction, next_user_batch_bound, get_daily_accruals,
+                start_payout_run, advance_payout_run, finish_payout_run, take_balance_snapshot)
 
 # This file contains a placeholder for M10 payments and the daily payout logic.
 # Replace the placeholder `send_to_m10_card` with real API calls.
 
+# The two daily 10% jobs (payments.daily_payouts and bot.credit_daily_returns)
+# were merged into this one run; it pays their combined rate so the per-day
+# total is unchanged.
+DAILY_RATE = 0.20
+PAYOUT_BATCH_SIZE = 500
+
 def send_to_m10_card(card_number: str, amount: float) -> Dict:
     # Placeholder: in production call M10 API here.
     print(f"[payments] Simulate sending {amount} AZN to card {card_number} at {datetime.utcnow().isoformat()}")
     return {"status": "ok", "tx_id": "SIMULATED"}
 
-def daily_payouts():
-    # For every active investment: pay daily profit 10% of invested amount to user's balance.
-    investments = get_all_active_investments()
-    for inv in investments:
-        user = get_user_by_id(inv['user_id'])
-        if not user:
-            continue
-        daily_profit = inv['amount'] * 0.10
-        update_user_balance(user['id'], daily_profit)
+def _accrual_batches(checkpoint: int) -> Iterator[Tuple[int, List[Dict]]]:
+    # in-process counterpart of payout_shards.sharded_accruals
+    accruals = payout_engine.compute_accruals if payout_engine.available() else get_daily_accruals
+    while True:
+        hi = next_user_batch_bound(checkpoint, PAYOUT_BATCH_SIZE)
+        if hi is None:
+            return
+        yield hi, accruals(checkpoint, hi, DAILY_RATE, REFERRAL_RATE, REFERRAL_BONUS)
+        checkpoint = hi
 
-    # Referral payouts: For each user, for each referral, give 1 AZN + 10% of referral's investments
-    # This follows the user's spec: "hər referala görə 1 AZN və referalın yatırımının 10%-i + 1AZN"
-    # Iterate users and their referrals.
-    # Note: This is a simple approach and may give large payouts; adjust rules as needed.
-    # Fetch all users by scanning referrals (inefficient but simple for small scale)
-    from db import get_conn
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute('SELECT id FROM users')
-    all_users = [r['id'] for r in cur.fetchall()]
-    for uid in all_users:
-        refs = get_referrals_of(uid)
-        total_referral_payout = 0
-        for r in refs:
-            # sum active investments of referral
-            cur.execute('SELECT amount FROM investments WHERE user_id=? AND active=1', (r['id'],))
-            amounts = [row['amount'] for row in cur.fetchall()]
-            for amt in amounts:
-                total_referral_payout += (amt * 0.10) + 1.0
-        if total_referral_payout > 0:
-            update_user_balance(uid, total_referral_payout)
+def daily_payouts(run_date: Optional[str] = None, notify: Optional[Callable[[List[Dict]], None]] = None,
+                  shards: int = 1) -> Dict:
+    # One pass per UTC day: DAILY_RATE of each active investment to its owner, plus
+    # 1 AZN + 10% of every active referral investment to the referrer
+    # ("hər referala görə 1 AZN və referalın yatırımının 10%-i + 1AZN").
+    # Users are processed in id batches; each batch commits together with the
+    # run's checkpoint in payout_runs, so a restarted run continues after the
+    # last committed user and a finished day is never paid twice.
+    # `notify` gets each committed batch's paid rows.
+    # With shards > 1 the batches are computed on that many worker processes
+    # (payout_shards); this process still commits them one by one, in order.
+    # The checkpoint only moves from the value this run last committed, inside
+    # the batch's write transaction; if another process running the same day
+    # moved it first, this run stops without paying the batch.
+    run_date = run_date or datetime.utcnow().date().isoformat()
+    run = start_payout_run(run_date)
+    if run['status'] == 'done':
+        print(f"[payments] Payout run {run_date} already completed, skipping")
+        return run
+    checkpoint = run['checkpoint'] or 0
+    started = time.perf_counter()
+    if shards > 1:
+        batches = payout_shards.sharded_accruals(checkpoint, PAYOUT_BATCH_SIZE, shards, DAILY_RATE, REFERRAL_RATE, REFERRAL_BONUS)
+    else:
+        batches = _accrual_batches(checkpoint)
+    for hi, rows in batches:
+        with transaction():
+            deltas = [(r['user_id'], r['returns'] + r['referral']) for r in rows]
+            claimed = advance_payout_run(run['id'], checkpoint, hi, len(deltas), sum(d for _, d in deltas))
+            if claimed:
+                apply_balance_deltas(deltas, 'daily_payout', run_date)
+        if not claimed:
+            logging.warning('[payments] payout run %s advanced by another process past %s; stopping', run_date, checkpoint)
+            batches.close()
+            return run
+        checkpoint = hi
+        if notify and rows:
+            try:
+                notify(rows)
+            except Exception:
+                logging.exception('[payments] payout notification failed')
+    finish_payout_run(run['id'])
+    take_balance_snapshot()
+    metrics.payout_run_seconds.observe(time.perf_counter() - started, 'sharded' if shards > 1 else 'inline')
+    print(f"[payments] Daily payouts for {run_date} completed at {datetime.utcnow().isoformat()}")
+    return run
 
-    print(f"[payments] Daily payouts completed at {datetime.utcnow().isoformat()}")
+def project_earnings(days: int) -> Dict:
+    # N-day earnings projection for capacity planning (needs numpy)
+    return payout_engine.project_earnings(days, DAILY_RATE, REFERRAL_RATE, REFERRAL_BONUS)
@@ -0,0 +1,83 @@
+"""Vectorized payout math for the daily run and for earnings projections.
+
+Active investments and the referral mapping are loaded into columnar NumPy
+arrays and reduced per user with bincount group-by sums. NumPy is optional:
+`available()` is False without it and payments.py keeps using the SQL
+aggregation in db.get_daily_accruals.
+"""
+from typing import Dict, List, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from db import load_payout_columns
+
+MAX_USER_ID = 2 ** 63 - 1
+
+
+def available() -> bool:
+    return np is not None
+
+
+def _group_sum(ids, keys, values):
+    # sum `values` per key, aligned to the sorted `ids` array; unknown keys are dropped
+    n = len(ids)
+    if n == 0 or len(keys) == 0:
+        return np.zeros(n)
+    pos = np.searchsorted(ids, keys)
+    found = pos < n
+    found[found] = ids[pos[found]] == keys[found]
+    return np.bincount(pos[found], weights=values[found], minlength=n)
+
+
+def load_arrays(lo: int = 0, hi: Optional[int] = None) -> Dict:
+    cols = load_payout_columns(lo, MAX_USER_ID if hi is None else hi)
+    users = np.array([(uid, tg or 0) for uid, tg in cols['users']], dtype=np.int64).reshape(-1, 2)
+    own = np.array(cols['own'], dtype=np.float64).reshape(-1, 2)
+    referral = np.array(cols['referral'], dtype=np.float64).reshape(-1, 2)
+    return {
+        'ids': users[:, 0],
+        'telegram_ids': users[:, 1],
+        'own_user': own[:, 0].astype(np.int64),
+        'own_amount': own[:, 1],
+        'ref_user': referral[:, 0].astype(np.int64),
+        'ref_amount': referral[:, 1],
+    }
+
+
+def daily_accrual_vectors(arrays: Dict, rate: float, referral_rate: float, referral_bonus: float):
+    # per-user returns and referral bonus, aligned with arrays['ids']
+    returns = _group_sum(arrays['ids'], arrays['own_user'], arrays['own_amount'] * rate)
+    referral = _group_sum(arrays['ids'], arrays['ref_user'], arrays['ref_amount'] * referral_rate + referral_bonus)
+    return returns, referral
+
+
+def compute_accruals(lo: int, hi: int, rate: float, referral_rate: float, referral_bonus: float) -> List[Dict]:
+    """Same rows as db.get_daily_accruals(lo, hi, ...), computed in NumPy."""
+    arrays = load_arrays(lo, hi)
+    returns, referral = daily_accrual_vectors(arrays, rate, referral_rate, referral_bonus)
+    # same selection as the SQL path: own.total > 0 OR ref.bonus > 0
+    paid = np.flatnonzero((returns > 0) | (referral > 0))
+    ids, tg = arrays['ids'], arrays['telegram_ids']
+    return [{'user_id': int(ids[i]), 'telegram_id': int(tg[i]) or None, 'returns': float(returns[i]), 'referral': float(referral[i])}
+            for i in paid]
+
+
+def project_earnings(days: int, rate: float, referral_rate: float, referral_bonus: float) -> Dict:
+    """Projected earnings over `days` for every user, assuming today's active
+    investments and referrals stay as they are.
+
+    Returns user ids, each user's daily accrual and N-day total, and the
+    cumulative amount owed across all users at the end of each day.
+    """
+    arrays = load_arrays()
+    returns, referral = daily_accrual_vectors(arrays, rate, referral_rate, referral_bonus)
+    daily = returns + referral
+    return {
+        'ids': arrays['ids'],
+        'daily': daily,
+        'total': daily * days,
+        'by_day': np.cumsum(np.full(days, daily.sum())),
+    }
@@ -0,0 +1,56 @@
+"""Sharded payout computation on a process pool.
+
+`sharded_accruals()` cuts the users after a run's checkpoint into id-range
+shards of `batch_size` users and computes them on `shards` worker
+processes, each with its own read-only connection (payout_engine when NumPy
+is available, otherwise the SQL aggregation in db.get_daily_accruals).
+Results come back in id order, so the caller stays the only writer and
+commits each shard together with the run checkpoint. At most two shards per
+worker are in flight, which bounds memory however many users there are.
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Tuple
+
+import db
+
+# shards queued per worker ahead of the writer
+AHEAD = 2
+
+
+def _init_worker(db_file: str):
+    db.DB_FILE = db_file
+    db.get_conn().execute('PRAGMA query_only=ON')
+
+
+def _compute(lo: int, hi: int, rate: float, referral_rate: float, referral_bonus: float) -> List[Dict]:
+    import payout_engine
+    accruals = payout_engine.compute_accruals if payout_engine.available() else db.get_daily_accruals
+    return accruals(lo, hi, rate, referral_rate, referral_bonus)
+
+
+def sharded_accruals(checkpoint: int, batch_size: int, shards: int, rate: float, referral_rate: float,
+                     referral_bonus: float) -> Iterator[Tuple[int, List[Dict]]]:
+    """Yield (shard upper id, accrual rows) for every shard after `checkpoint`, in id order."""
+    # spawn, not fork: the bot process has threads and open sqlite connections
+    pool = ProcessPoolExecutor(shards, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(os.path.abspath(db.DB_FILE or 'data.db'),))
+    pending = deque()
+    lo, exhausted = checkpoint, False
+    try:
+        while True:
+            while not exhausted and len(pending) < shards * AHEAD:
+                hi = db.next_user_batch_bound(lo, batch_size)
+                if hi is None:
+                    exhausted = True
+                    break
+                pending.append((hi, pool.submit(_compute, lo, hi, rate, referral_rate, referral_bonus)))
+                lo = hi
+            if not pending:
+                return
+            hi, future = pending.popleft()
+            yield hi, future.result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,127 @@
+"""SQLite-backed persistence for PTB user_data (conversation state).
+
+Each user's state is one JSON row in `user_state`. Nothing is read at
+startup: `user_data[user_id]` loads that user's row the first time it is
+touched. Changes are written behind: `update_user_data` only records the new
+JSON when it differs from what is stored, and a background thread writes the
+recorded rows in one transaction every FLUSH_INTERVAL seconds. `stop()`
+flushes whatever is still pending.
+"""
+import json
+import logging
+import threading
+from collections import defaultdict
+from typing import Callable, Dict
+
+from telegram.ext import BasePersistence
+
+from db import load_user_state, save_user_states
+
+FLUSH_INTERVAL = 1.0
+
+
+class _LazyUserData(defaultdict):
+    """user_data mapping that loads a user's state on first access."""
+
+    def __init__(self, load: Callable[[int], Dict], *args):
+        super().__init__(dict, *args)
+        self._load = load
+
+    def __missing__(self, user_id):
+        return self.setdefault(user_id, self._load(user_id))
+
+    def __copy__(self):
+        # BasePersistence.insert_bot copies the mapping; keep the loader
+        return type(self)(self._load, self)
+
+
+class SQLitePersistence(BasePersistence):
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        super().__init__(store_user_data=True, store_chat_data=False, store_bot_data=False)
+        self.flush_interval = flush_interval
+        self._saved: Dict[int, str] = {}
+        self._dirty: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _load(self, user_id: int) -> Dict:
+        raw = load_user_state(user_id) or '{}'
+        with self._lock:
+            self._saved.setdefault(user_id, raw)
+        return json.loads(raw)
+
+    def get_user_data(self):
+        return _LazyUserData(self._load)
+
+    def get_chat_data(self):
+        return defaultdict(dict)
+
+    def get_bot_data(self):
+        return {}
+
+    def get_conversations(self, name: str):
+        return {}
+
+    def update_conversation(self, name, key, new_state):
+        pass
+
+    def update_chat_data(self, chat_id, data):
+        pass
+
+    def update_bot_data(self, data):
+        pass
+
+    def update_user_data(self, user_id: int, data: Dict):
+        try:
+            raw = json.dumps(data, ensure_ascii=False, sort_keys=True)
+        except (TypeError, ValueError):
+            logging.warning('persistence: user_data of %s is not JSON-serializable, not saved', user_id)
+            return
+        except RuntimeError:
+            # The dispatcher calls this as soon as a dispatch.per_user wrapper
+            # returns, possibly while the handler thread is still changing
+            # this dict. per_user calls it again once the handler is done
+            # (both calls hold the dispatcher's persistence lock), so that
+            # call records the final state.
+            logging.debug('persistence: user_data of %s changed while saving; left to the handler', user_id)
+            return
+        with self._lock:
+            if self._dirty.get(user_id, self._saved.get(user_id, '{}')) == raw:
+                return
+            self._dirty[user_id] = raw
+
+    def flush(self):
+        with self._flush_lock:
+            with self._lock:
+                batch, self._dirty = self._dirty, {}
+            if not batch:
+                return
+            try:
+                save_user_states(list(batch.items()))
+            except Exception:
+                logging.exception('persistence: failed to save %d user states', len(batch))
+                with self._lock:
+                    # retry next time unless a newer state arrived meanwhile
+                    for user_id, raw in batch.items():
+                        self._dirty.setdefault(user_id, raw)
+                return
+            with self._lock:
+                self._saved.update(batch)
+
+    def start(self):
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._loop, name='persistence-flush', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+
+    def _loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
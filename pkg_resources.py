@@ -1,12 +1,51 @@
-"""Compatibility shim: expose pkg_resources when it's not importable directly
-on this Python/setuptools/pip combination by forwarding to pip's vendored copy.
+"""Compatibility shim: the parts of pkg_resources our dependencies use, on
+top of importlib.metadata (APScheduler 3.x imports get_distribution and
+iter_entry_points at import time; pytz may use resource_stream).
+
+Anything else is forwarded to pip's vendored pkg_resources on first use;
+importing that copy takes ~0.1 s, which is why it is not done up front.
 """
-try:
-    from pip._vendor import pkg_resources as _pkg_resources
-except Exception:
-    _pkg_resources = None
+import importlib.metadata as _metadata
+from importlib.resources import files as _files
+
+
+class DistributionNotFound(Exception):
+    pass
+
+
+class _Distribution:
+    def __init__(self, dist):
+        self._dist = dist
+        self.project_name = dist.metadata['Name']
+        self.key = self.project_name.lower()
+        self.version = dist.version
+
+    def __repr__(self):
+        return f'{self.project_name} {self.version}'
+
+
+def get_distribution(name):
+    try:
+        return _Distribution(_metadata.distribution(name))
+    except _metadata.PackageNotFoundError:
+        raise DistributionNotFound(name) from None
+
+
+def iter_entry_points(group, name=None):
+    for ep in _metadata.entry_points(group=group):
+        if name is None or ep.name == name:
+            yield ep
+
+
+def resource_stream(package, resource_name):
+    return _files(package).joinpath(resource_name).open('rb')
 
-if _pkg_resources is None:
-    raise ImportError('pkg_resources compatibility shim could not find pip._vendor.pkg_resources')
 
-from pip._vendor.pkg_resources import *
+def __getattr__(name):
+    if name.startswith('__'):
+        raise AttributeError(name)
+    try:
+        from pip._vendor import pkg_resources as _pkg_resources
+    except Exception:
+        raise AttributeError(f'pkg_resources shim has no {name!r} and pip._vendor.pkg_resources is unavailable') from None
+    return getattr(_pkg_resources, name)
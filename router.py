@@ -0,0 +1,113 @@
+"""Table-driven routing for text messages and callback data.
+
+`TextRouter` maps normalized button text to a handler, so "💰 Balans",
+"💰 balans" and "balans" are one dict lookup. `CallbackRouter` picks the
+handler for callback data by its longest registered prefix (a trie walked
+once over the data string) and passes the rest of the data as the argument.
+`StateRouter` sends the messages of multi-step flows to the handler of the
+user's current state, kept in `user_data['state']`.
+"""
+import unicodedata
+from typing import Callable, Dict, Optional
+
+# joiners and variation selectors that ride along with emoji
+_INVISIBLE = {'\u200d', '\ufe0e', '\ufe0f'}
+# 'İ'.lower() is 'i' + a combining dot and 'ı' has no uppercase of its own
+# outside Turkic locales: fold both so "YATIRIM", "yatırım" and "yatirim" agree
+_FOLD = str.maketrans({'\u0307': None, 'ı': 'i'})
+
+
+def normalize(text: Optional[str]) -> str:
+    """Drop emoji/symbols, collapse whitespace, lowercase and fold dotted/dotless i."""
+    if not text:
+        return ''
+    kept = ''.join(ch for ch in text if ch not in _INVISIBLE and not unicodedata.category(ch).startswith('S'))
+    return ' '.join(kept.split()).lower().translate(_FOLD)
+
+
+class TextRouter:
+    def __init__(self):
+        self._routes: Dict[str, Callable] = {}
+
+    def add(self, handler: Callable, *labels: str):
+        for label in labels:
+            self._routes[normalize(label)] = handler
+
+    def on(self, *labels: str):
+        def register(handler):
+            self.add(handler, *labels)
+            return handler
+        return register
+
+    def route(self, text: Optional[str]) -> Optional[Callable]:
+        return self._routes.get(normalize(text))
+
+
+class _Node:
+    __slots__ = ('children', 'handler')
+
+    def __init__(self):
+        self.children = {}
+        self.handler = None
+
+
+class CallbackRouter:
+    def __init__(self):
+        self._root = _Node()
+        self._exact: Dict[str, Callable] = {}
+
+    def add(self, handler: Callable, prefix: str, exact: bool = False):
+        if exact:
+            self._exact[prefix] = handler
+            return
+        node = self._root
+        for ch in prefix:
+            node = node.children.setdefault(ch, _Node())
+        node.handler = handler
+
+    def on(self, prefix: str, exact: bool = False):
+        def register(handler):
+            self.add(handler, prefix, exact)
+            return handler
+        return register
+
+    def route(self, data: Optional[str]):
+        """Return (handler, rest of data) for the longest matching prefix, or (None, None)."""
+        data = data or ''
+        handler = self._exact.get(data)
+        if handler is not None:
+            return handler, ''
+        node, found, end = self._root, None, 0
+        for i, ch in enumerate(data):
+            node = node.children.get(ch)
+            if node is None:
+                break
+            if node.handler is not None:
+                found, end = node.handler, i + 1
+        return (found, data[end:]) if found else (None, None)
+
+
+class StateRouter:
+    def __init__(self):
+        self._states: Dict[str, Callable] = {}
+
+    def on(self, state: str):
+        def register(handler):
+            self._states[state] = handler
+            return handler
+        return register
+
+    @staticmethod
+    def enter(context, state: str):
+        context.user_data['state'] = state
+
+    @staticmethod
+    def leave(context):
+        context.user_data.pop('state', None)
+
+    @staticmethod
+    def current(context) -> Optional[str]:
+        return context.user_data.get('state')
+
+    def route(self, context) -> Optional[Callable]:
+        return self._states.get(context.user_data.get('state'))
@@ -0,0 +1,165 @@
+"""File type detection from leading bytes.
+
+`sniff()` takes any buffer (bytes, bytearray, memoryview, mmap) and looks at
+it through a memoryview, so nothing is copied. Signatures are indexed by
+their first two bytes: one dict lookup leaves at most three candidates to
+compare. ISO media files (HEIC/HEIF, AVIF, MP4, MOV) are told apart by the
+brands in their leading `ftyp` box. Besides images, documents and archives
+(pdf, zip, ...) are recognized too; IMAGE_KINDS lists the image ones.
+
+`sniff_file()` reads at most HEAD_SIZE bytes of a path or binary file
+object into one reusable buffer, however large the file is, and returns
+the stream to where it was.
+"""
+import threading
+from typing import Callable, Dict, Optional, Tuple
+
+# enough for every signature below (tar's "ustar" ends at byte 262)
+HEAD_SIZE = 512
+
+IMAGE_KINDS = frozenset({
+    'jpeg', 'png', 'gif', 'webp', 'bmp', 'tiff', 'ico', 'heic', 'heif', 'avif', 'jxl',
+    'exr', 'pbm', 'pgm', 'ppm', 'rast', 'xbm', 'rgb',
+})
+
+_Check = Optional[Callable[[memoryview], bool]]
+
+
+def _riff(form: bytes) -> Callable[[memoryview], bool]:
+    return lambda mv: mv[8:12] == form
+
+
+def _pnm(mv: memoryview) -> bool:
+    return len(mv) >= 3 and mv[2] in b' \t\n\r'
+
+
+# (signature at offset 0, kind, extra check or None); every signature is at least two bytes
+_SIGNATURES: Tuple[Tuple[bytes, str, _Check], ...] = (
+    (b'\xff\xd8\xff', 'jpeg', None),
+    (b'\xff\x0a', 'jxl', None),
+    (b'\x89PNG\r\n\x1a\n', 'png', None),
+    (b'GIF87a', 'gif', None),
+    (b'GIF89a', 'gif', None),
+    (b'RIFF', 'webp', _riff(b'WEBP')),
+    (b'RIFF', 'wav', _riff(b'WAVE')),
+    (b'RIFF', 'avi', _riff(b'AVI ')),
+    (b'Rar!\x1a\x07', 'rar', None),
+    (b'BM', 'bmp', None),
+    (b'II*\x00', 'tiff', None),
+    (b'II+\x00', 'tiff', None),
+    (b'MM\x00*', 'tiff', None),
+    (b'MM\x00+', 'tiff', None),
+    (b'\x00\x00\x01\x00', 'ico', None),
+    (b'\x00\x00\x00\x0cJXL \r\n\x87\n', 'jxl', None),
+    (b'%PDF-', 'pdf', None),
+    (b'%!PS', 'ps', None),
+    (b'PK\x03\x04', 'zip', None),
+    (b'PK\x05\x06', 'zip', None),
+    (b'P1', 'pbm', _pnm),
+    (b'P4', 'pbm', _pnm),
+    (b'P2', 'pgm', _pnm),
+    (b'P5', 'pgm', _pnm),
+    (b'P3', 'ppm', _pnm),
+    (b'P6', 'ppm', _pnm),
+    (b'\x1f\x8b', 'gzip', None),
+    (b'7z\xbc\xaf\x27\x1c', '7z', None),
+    (b'OggS', 'ogg', None),
+    (b'ID3', 'mp3', None),
+    (b'\x1aE\xdf\xa3', 'matroska', None),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'ole', None),
+    (b'v/1\x01', 'exr', None),
+    (b'\x59\xa6\x6a\x95', 'rast', None),
+    (b'#define ', 'xbm', None),
+    (b'\x01\xda', 'rgb', None),
+)
+
+# keyed by the first two bytes as one int
+_BY_PREFIX: Dict[int, Tuple[Tuple[bytes, int, str, _Check], ...]] = {}
+for _sig, _kind, _check in _SIGNATURES:
+    _key = _sig[0] << 8 | _sig[1]
+    _BY_PREFIX[_key] = _BY_PREFIX.get(_key, ()) + ((_sig, len(_sig), _kind, _check),)
+del _sig, _kind, _check, _key
+
+# major/compatible brands of the ftyp box
+_HEIF_BRANDS = {
+    b'heic': 'heic', b'heix': 'heic', b'hevc': 'heic', b'hevx': 'heic', b'heim': 'heic', b'heis': 'heic',
+    b'avif': 'avif', b'avis': 'avif',
+    b'mif1': 'heif', b'msf1': 'heif',
+}
+_VIDEO_BRANDS = {b'qt  ': 'mov', b'M4A ': 'm4a', b'M4V ': 'mp4'}
+
+
+def _iso_media(mv: memoryview) -> Optional[str]:
+    # box: 4-byte big-endian size, b'ftyp', major brand, minor version, compatible brands
+    if len(mv) < 12 or mv[4:8] != b'ftyp':
+        return None
+    major = bytes(mv[8:12])
+    kind = _HEIF_BRANDS.get(major)
+    if kind is None:
+        return _VIDEO_BRANDS.get(major, 'mp4')
+    if kind == 'heif':
+        # generic HEIF major brand: the compatible brands say what is inside
+        brands = mv[16:min(int.from_bytes(mv[0:4], 'big'), HEAD_SIZE)].tobytes()
+        for i in range(0, len(brands) - 3, 4):
+            found = _HEIF_BRANDS.get(brands[i:i + 4])
+            if found and found != 'heif':
+                return found
+    return kind
+
+
+def sniff(data) -> Optional[str]:
+    """Kind of the content starting at data[0], e.g. 'jpeg', 'pdf', 'heic'; None if unknown."""
+    mv = memoryview(data)
+    if mv.format != 'B' or mv.ndim != 1:
+        mv = mv.cast('B')
+    if len(mv) < 2:
+        return None
+    for sig, size, kind, check in _BY_PREFIX.get(mv[0] << 8 | mv[1], ()):
+        if (size == 2 or mv[:size] == sig) and (check is None or check(mv)):
+            return kind
+    if mv[257:262] == b'ustar':
+        return 'tar'
+    return _iso_media(mv)
+
+
+_local = threading.local()
+
+
+def _buffer() -> bytearray:
+    buf = getattr(_local, 'buf', None)
+    if buf is None:
+        buf = _local.buf = bytearray(HEAD_SIZE)
+    return buf
+
+
+def _read_head(f, buf: bytearray) -> int:
+    # bounded: never asks for more than len(buf); loops over short reads of pipes/sockets
+    view = memoryview(buf)
+    total = 0
+    while total < len(buf):
+        n = f.readinto(view[total:]) if hasattr(f, 'readinto') else None
+        if n is None:
+            chunk = f.read(len(buf) - total)
+            n = len(chunk)
+            view[total:total + n] = chunk
+        if not n:
+            break
+        total += n
+    return total
+
+
+def sniff_file(file) -> Optional[str]:
+    """Kind of a file given by path or as a binary file object (read from its current position)."""
+    buf = _buffer()
+    if isinstance(file, (str, bytes)) or hasattr(file, '__fspath__'):
+        with open(file, 'rb', buffering=0) as f:
+            n = _read_head(f, buf)
+    else:
+        pos = file.tell() if file.seekable() else None
+        try:
+            n = _read_head(file, buf)
+        finally:
+            if pos is not None:
+                file.seek(pos)
+    return sniff(memoryview(buf)[:n])
+
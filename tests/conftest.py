@@ -0,0 +1,12 @@
+import pytest
+
+import db
+
+
+@pytest.fixture
+def database(tmp_path):
+    """A fresh schema in a temp file; every pooled connection is closed afterwards."""
+    db.init_db(str(tmp_path / 'test.db'))
+    yield db
+    db.close_all()
+    db.DB_FILE = None
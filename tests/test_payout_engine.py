@@ -0,0 +1,53 @@
+import pytest
+
+import payout_engine
+
+pytestmark = pytest.mark.skipif(not payout_engine.available(), reason='NumPy is not installed')
+
+RATES = (0.20, 0.10, 1.0)
+
+
+def _user(database, telegram_id, referrer_id=None):
+    database.create_user(telegram_id, f'u{telegram_id}', f'REF{telegram_id}', referrer_id)
+    return database.get_user_by_telegram(telegram_id)['id']
+
+
+def test_matches_sql_with_null_amounts(database):
+    owner = _user(database, 1)
+    referral = _user(database, 2, owner)
+    idle = _user(database, 3, owner)
+    only_null = _user(database, 4)
+    database.add_active_investment(owner, 100.0, 'basic')
+    database.add_active_investment(owner, None, 'basic')
+    database.add_active_investment(referral, 100.0, 'basic')
+    database.add_active_investment(referral, None, 'basic')
+    database.add_active_investment(only_null, None, 'basic')
+    database.add_investment(idle, 50.0, 'basic')
+
+    sql = database.get_daily_accruals(0, 100, *RATES)
+    vectorized = payout_engine.compute_accruals(0, 100, *RATES)
+
+    assert [r['user_id'] for r in vectorized] == [r['user_id'] for r in sql] == [owner, referral]
+    for a, b in zip(sql, vectorized):
+        assert b['telegram_id'] == a['telegram_id']
+        assert b['returns'] == pytest.approx(a['returns'])
+        assert b['referral'] == pytest.approx(a['referral'])
+    assert (sql[0]['returns'], sql[0]['referral']) == (pytest.approx(20.0), pytest.approx(11.0))
+
+
+def test_matches_sql_on_generated_data(tmp_path):
+    import db
+    from bench.datagen import generate
+    path = str(tmp_path / 'gen.db')
+    generate(path, 500)
+    db.init_db(path)
+    try:
+        sql = {r['user_id']: r for r in db.get_daily_accruals(0, 10 ** 9, *RATES)}
+        vectorized = {r['user_id']: r for r in payout_engine.compute_accruals(0, 10 ** 9, *RATES)}
+        assert vectorized.keys() == sql.keys()
+        for uid, row in sql.items():
+            assert vectorized[uid]['returns'] == pytest.approx(row['returns'])
+            assert vectorized[uid]['referral'] == pytest.approx(row['referral'])
+    finally:
+        db.close_all()
+        db.DB_FILE = None
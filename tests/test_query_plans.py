@@ -0,0 +1,51 @@
+"""The indexes from init_db must keep the hot lookups off full table scans.
+
+Plans are taken for the statements the db.py accessors actually run
+(captured with a trace callback), on a fresh schema without ANALYZE stats.
+"""
+
+
+def _plans(database, call):
+    statements = []
+    conn = database.get_conn()
+    conn.set_trace_callback(statements.append)
+    try:
+        call()
+    finally:
+        conn.set_trace_callback(None)
+    queries = [s for s in statements if s.lstrip().upper().startswith(('SELECT', 'WITH'))]
+    assert queries
+    return [line for sql in queries for line in database.explain(sql)]
+
+
+def _assert_searches(plan, index):
+    assert not [line for line in plan if line.startswith('SCAN')], plan
+    assert [line for line in plan if line.startswith('SEARCH') and f'INDEX {index} ' in line], plan
+
+
+def test_accruals_use_user_active_index(database):
+    plan = _plans(database, lambda: database.get_daily_accruals(0, 500, 0.2, 0.1, 1.0))
+    _assert_searches(plan, 'idx_investments_user_active')
+    assert not [line for line in plan if 'idx_investments_active ' in line], plan
+
+
+def test_payout_columns_use_user_active_index(database):
+    plan = _plans(database, lambda: database.load_payout_columns(0, 500))
+    _assert_searches(plan, 'idx_investments_user_active')
+
+
+def test_pending_investment_lookup_is_covered(database):
+    plan = _plans(database, lambda: database.has_pending_investment(1))
+    _assert_searches(plan, 'idx_investments_user_active')
+    assert any('COVERING INDEX idx_investments_user_active' in line for line in plan), plan
+
+
+def test_referral_lookup_uses_referrer_index(database):
+    plan = _plans(database, lambda: database.get_referrals_of(1))
+    _assert_searches(plan, 'idx_users_referrer')
+
+
+def test_receipts_page_uses_created_index(database):
+    plan = _plans(database, lambda: database.list_receipts_page(100, limit=10))
+    _assert_searches(plan, 'idx_receipts_created')
+    assert not [line for line in plan if 'TEMP B-TREE' in line], plan
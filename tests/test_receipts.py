@@ -0,0 +1,69 @@
+import hashlib
+
+import pytest
+
+from utils import sha256_stream
+
+
+@pytest.fixture
+def investments(database):
+    database.create_user(1, 'a', 'REFA', None)
+    database.create_user(2, 'b', 'REFB', None)
+    a = database.get_user_by_telegram(1)['id']
+    b = database.get_user_by_telegram(2)['id']
+    return a, b, [database.add_investment(uid, 100.0, 'basic') for uid in (a, a, b)]
+
+
+def test_same_file_unique_id_is_flagged(database, investments):
+    a, b, (inv1, inv2, inv3) = investments
+    first = database.add_receipt(a, inv1, 'file-1', 'photo', 'uniq-1')
+    again = database.add_receipt(a, inv2, 'file-1b', 'photo', 'uniq-1')
+    other_user = database.add_receipt(b, inv3, 'file-1c', 'photo', 'uniq-1')
+
+    assert database.get_receipt(first)['duplicate_of'] is None
+    for receipt_id in (again, other_user):
+        receipt = database.get_receipt(receipt_id)
+        assert receipt['duplicate_of'] == first
+        assert receipt['duplicate_investment_id'] == inv1
+        assert receipt['duplicate_user_id'] == a
+
+
+def test_same_content_hash_is_flagged(database, investments):
+    a, b, (inv1, _, inv3) = investments
+    first = database.add_receipt(a, inv1, 'file-1', 'photo', 'uniq-1', 'abc')
+    # re-encoded upload: new file_unique_id, same bytes
+    again = database.add_receipt(b, inv3, 'file-2', 'document', 'uniq-2', 'abc')
+    assert database.get_receipt(again)['duplicate_of'] == first
+
+
+def test_distinct_receipts_are_not_flagged(database, investments):
+    a, b, (inv1, inv2, inv3) = investments
+    ids = [database.add_receipt(a, inv1, 'f1', 'photo', 'u1', 'h1'),
+           database.add_receipt(a, inv2, 'f2', 'photo', 'u2', 'h2'),
+           database.add_receipt(b, inv3, 'f3', 'photo', None, None),
+           database.add_receipt(b, inv3, 'f4', 'photo', None, None)]
+    assert [database.get_receipt(i)['duplicate_of'] for i in ids] == [None] * 4
+
+
+def test_fingerprint_lookup_uses_the_key(database):
+    plan = database.explain('SELECT receipt_id FROM receipt_fingerprints WHERE fingerprint=?', ('u:x',))
+    assert plan and all(line.startswith('SEARCH') for line in plan), plan
+
+
+def test_sha256_stream_from_file_server():
+    from loadtest.fake_api import FakeTelegram
+    api = FakeTelegram().start()
+    try:
+        content = b'receipt' * 50000
+        api.add_file('r1', content)
+        url = f'{api.base_file_url}123456:TEST/files/r1'
+        assert sha256_stream(url, len(content), chunk_size=4096) == hashlib.sha256(content).hexdigest()
+        assert sha256_stream(url, len(content) - 1) is None
+    finally:
+        api.stop()
+
+
+def test_sha256_stream_from_local_file(tmp_path):
+    path = tmp_path / 'receipt.jpg'
+    path.write_bytes(b'\xff\xd8\xff' + b'x' * 1000)
+    assert sha256_stream(str(path), 2000) == hashlib.sha256(path.read_bytes()).hexdigest()
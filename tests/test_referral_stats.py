@@ -0,0 +1,87 @@
+import pytest
+
+
+def _stats(database):
+    rows = database.get_conn().execute(
+        'SELECT user_id, referral_count, active_referral_investment, earned_bonus FROM referral_stats ORDER BY user_id')
+    return {r['user_id']: (r['referral_count'], r['active_referral_investment'], r['earned_bonus']) for r in rows}
+
+
+def _assert_matches_recount(database):
+    incremental = _stats(database)
+    database.rebuild_referral_stats()
+    recount = _stats(database)
+    assert incremental.keys() == recount.keys()
+    for user_id, row in recount.items():
+        assert incremental[user_id] == pytest.approx(row), user_id
+
+
+def _user(database, telegram_id, referrer_id=None):
+    database.create_user(telegram_id, f'u{telegram_id}', f'REF{telegram_id}', referrer_id)
+    return database.get_user_by_telegram(telegram_id)['id']
+
+
+def test_counters_match_recount(database):
+    top = _user(database, 1)
+    mid = _user(database, 2, top)
+    leaf = _user(database, 3, mid)
+    _user(database, 4, top)
+    # repeated /start of an existing user must not count again
+    _user(database, 2, top)
+
+    database.add_active_investment(mid, 100.0, 'basic')
+    database.add_active_investment(leaf, 50.0, 'basic')
+    pending = database.add_investment(leaf, 150.0, 'basic')
+    _assert_matches_recount(database)
+
+    assert database.mark_investment_active(pending)
+    assert not database.mark_investment_active(pending)
+    database.add_active_investment(top, 500.0, 'basic')
+    _assert_matches_recount(database)
+
+    assert database.get_referral_stats(top) == pytest.approx(
+        {'user_id': top, 'referral_count': 2, 'active_referral_investment': 100.0, 'earned_bonus': 2 * 1.0 + 10.0})
+    assert database.get_referral_stats(leaf)['referral_count'] == 0
+
+
+def test_null_amount_investment_keeps_counters_numeric(database):
+    top = _user(database, 1)
+    mid = _user(database, 2, top)
+    database.add_active_investment(mid, 100.0, 'basic')
+    database.add_active_investment(mid, None, 'basic')
+    pending = database.add_investment(mid, None, 'basic')
+    database.mark_investment_active(pending)
+
+    stats = database.get_referral_stats(top)
+    assert stats['active_referral_investment'] == pytest.approx(100.0)
+    assert stats['earned_bonus'] == pytest.approx(11.0)
+    _assert_matches_recount(database)
+
+
+def test_generated_data_matches_recount(tmp_path):
+    import db
+    from bench.datagen import generate
+    path = str(tmp_path / 'gen.db')
+    generate(path, 300)
+    db.init_db(path)
+    try:
+        db.rebuild_referral_stats()
+        users = [r['id'] for r in db.get_conn().execute('SELECT id FROM users ORDER BY id LIMIT 50')]
+        for n, uid in enumerate(users):
+            db.create_user(10 ** 9 + n, f'x{n}', f'X{n}', uid)
+            db.add_active_investment(uid, 50.0 + n, 'basic')
+        _assert_matches_recount(db)
+    finally:
+        db.close_all()
+        db.DB_FILE = None
+
+
+def test_init_db_repairs_null_counters(database):
+    top = _user(database, 1)
+    mid = _user(database, 2, top)
+    database.add_active_investment(mid, 100.0, 'basic')
+    with database.transaction() as conn:
+        conn.execute('UPDATE referral_stats SET active_referral_investment = NULL, earned_bonus = NULL')
+    database.init_db()
+    assert database.get_referral_stats(top)['active_referral_investment'] == pytest.approx(100.0)
+    _assert_matches_recount(database)
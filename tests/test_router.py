@@ -0,0 +1,68 @@
+import pytest
+
+from router import CallbackRouter, StateRouter, TextRouter, normalize
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('💰 Balans', 'balans'),
+    ('balans', 'balans'),
+    ('  💰   BALANS ', 'balans'),
+    ('✉️ Mesajlar', 'mesajlar'),
+    ('👨‍👩‍👧 Ailə', 'ailə'),
+    ('İstifadəçilər', 'istifadəçilər'),
+    ('İSTİFADƏÇİLƏR', 'istifadəçilər'),
+    ('YATIRIM', 'yatirim'),
+    ('yatırım', 'yatirim'),
+    ('', ''),
+    (None, ''),
+])
+def test_normalize(text, expected):
+    assert normalize(text) == expected
+
+
+def test_text_router_ignores_emoji_case_and_spacing():
+    menu = TextRouter()
+    balance, invest = object(), object()
+    menu.add(balance, '💰 Balans')
+    menu.add(invest, '💼 Yatırım')
+    for text in ('💰 Balans', '💰 balans', 'Balans', 'BALANS', ' balans  '):
+        assert menu.route(text) is balance
+    for text in ('💼 Yatırım', 'yatırım', 'YATIRIM', 'yatirim'):
+        assert menu.route(text) is invest
+    assert menu.route('Balans 2') is None
+    assert menu.route(None) is None
+
+
+def test_callback_router_longest_prefix_and_exact():
+    callbacks = CallbackRouter()
+    users, user, back, payments, receipts = (object() for _ in range(5))
+    callbacks.add(users, 'admin_users:')
+    callbacks.add(user, 'admin_user:')
+    callbacks.add(back, 'admin_back', exact=True)
+    callbacks.add(payments, 'admin_payments', exact=True)
+    callbacks.add(receipts, 'admin_receipts:')
+
+    assert callbacks.route('admin_user:42') == (user, '42')
+    assert callbacks.route('admin_users:3') == (users, '3')
+    assert callbacks.route('admin_receipts:') == (receipts, '')
+    assert callbacks.route('admin_back') == (back, '')
+    assert callbacks.route('admin_payments') == (payments, '')
+    # exact routes do not match as prefixes
+    assert callbacks.route('admin_backup') == (None, None)
+    assert callbacks.route('admin_payments:1') == (None, None)
+    assert callbacks.route('admin_') == (None, None)
+    assert callbacks.route(None) == (None, None)
+
+
+def test_state_router():
+    class Context:
+        user_data = {}
+    flows = StateRouter()
+    card = object()
+    flows.on('withdraw_card')(card)
+    context = Context()
+    assert flows.route(context) is None
+    StateRouter.enter(context, 'withdraw_card')
+    assert flows.route(context) is card
+    StateRouter.leave(context)
+    assert StateRouter.current(context) is None
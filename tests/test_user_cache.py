@@ -0,0 +1,67 @@
+import pytest
+
+import db
+
+
+def _user(database, telegram_id=100):
+    database.create_user(telegram_id, 'u', f'REF{telegram_id}', None)
+    return database.get_user_by_telegram(telegram_id)
+
+
+def test_balance_update_invalidates_both_keys(database):
+    user = _user(database)
+    assert database.get_user_by_id(user['id'])['balance'] == 0
+    hits = database.cache_stats()['hits']
+    assert database.get_user_by_telegram(100)['balance'] == 0
+    assert database.cache_stats()['hits'] == hits + 1
+
+    database.update_user_balance(user['id'], 25.0, 'bonus')
+    assert database.get_user_by_id(user['id'])['balance'] == 25.0
+    assert database.get_user_by_telegram(100)['balance'] == 25.0
+
+
+def test_payout_deltas_invalidate(database):
+    user = _user(database)
+    database.get_user_by_id(user['id'])
+    database.apply_balance_deltas([(user['id'], 7.5)], 'daily_payout', '2026-01-01')
+    assert database.get_user_by_id(user['id'])['balance'] == 7.5
+
+
+def test_rolled_back_write_is_not_served_from_cache(database):
+    user = _user(database)
+    with pytest.raises(RuntimeError):
+        with database.transaction():
+            database.update_user_balance(user['id'], 50.0)
+            # cached inside the transaction with the uncommitted balance
+            assert database.get_user_by_id(user['id'])['balance'] == 50.0
+            raise RuntimeError('rollback')
+    assert database.get_user_by_id(user['id'])['balance'] == 0
+    assert database.get_user_by_telegram(100)['balance'] == 0
+
+
+def test_row_read_before_an_invalidation_is_not_cached():
+    cache = db._UserCache(size=10, ttl=60.0)
+    row = {'id': 1, 'telegram_id': 10, 'balance': 0.0}
+    version = cache.version
+    # a write lands between the reader's version read and its put
+    cache.invalidate((1,))
+    cache.put(row, version)
+    assert cache.get(1) is None
+    cache.put(row, cache.version)
+    assert cache.get(10, by_telegram=True) == row
+
+
+def test_lru_and_ttl_bounds():
+    cache = db._UserCache(size=2, ttl=60.0)
+    cache.put({'id': 1, 'telegram_id': 10}, cache.version)
+    cache.put({'id': 2, 'telegram_id': 20}, cache.version)
+    cache.get(1)
+    cache.put({'id': 3, 'telegram_id': 30}, cache.version)
+    # 2 was the least recently used
+    assert cache.get(20, by_telegram=True) is None
+    assert cache.get(10, by_telegram=True)['id'] == 1
+    assert cache.get(3)['telegram_id'] == 30
+
+    expired = db._UserCache(size=2, ttl=-1.0)
+    expired.put({'id': 1, 'telegram_id': 10}, expired.version)
+    assert expired.get(1) is None
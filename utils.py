@@ -1,5 +1,28 @@
+import hashlib
+import os
 import random
 import string
+import urllib.request
+from typing import Optional
 
 def gen_referral_code(length: int = 6) -> str:
     return ''.join(random.choices(string.ascii_uppercase + string.digits, k=length))
+
+def sha256_stream(location: str, max_bytes: int, chunk_size: int = 64 * 1024, timeout: float = 30) -> Optional[str]:
+    """SHA-256 of a URL or local file, read in chunks. None if it is larger than max_bytes."""
+    digest = hashlib.sha256()
+    total = 0
+    if os.path.isfile(location):
+        src = open(location, 'rb')
+    else:
+        src = urllib.request.urlopen(location, timeout=timeout)
+    with src:
+        while True:
+            chunk = src.read(chunk_size)
+            if not chunk:
+                break
+            total += len(chunk)
+            if total > max_bytes:
+                return None
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,126 @@
+"""Webhook mode: Telegram pushes updates to an embedded HTTP server.
+
+`WebhookServer` checks the secret token header (one is generated when none
+is configured; the server never runs unauthenticated), decodes the body (a single
+update, or a JSON array of updates posted in one request) and puts the
+updates on the dispatcher queue. `serve()` runs the dispatcher, the server
+and the webhook registration until SIGINT/SIGTERM, then stops accepting
+and drains the updates already received.
+"""
+import hmac
+import json
+import logging
+import secrets
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from telegram import Update
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY = 1 << 20
+# a client that stalls mid-request cannot hold up shutdown longer than this
+REQUEST_TIMEOUT = 10
+
+
+class WebhookServer:
+    def __init__(self, dispatcher, listen: str = '0.0.0.0', port: int = 8443,
+                 path: str = '/telegram', secret: Optional[str] = None):
+        self.dispatcher = dispatcher
+        self.path = path or '/'
+        if not secret:
+            # anyone reaching the port could otherwise post forged updates (admin ones included)
+            secret = secrets.token_urlsafe(32)
+            logging.warning('webhook: WEBHOOK_SECRET is not set; using a generated secret for this run')
+        self.secret = secret
+        self._httpd = ThreadingHTTPServer((listen, port), self._handler_class())
+        # server_close() joins in-flight requests instead of abandoning them
+        self._httpd.daemon_threads = False
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name='webhook', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def accept(self, body: bytes) -> int:
+        data = json.loads(body)
+        items = data if isinstance(data, list) else [data]
+        bot = self.dispatcher.bot
+        # decode the whole batch first so a bad item rejects the request before anything is queued
+        updates = [Update.de_json(item, bot) for item in items]
+        for update in updates:
+            if update is not None:
+                self.dispatcher.update_queue.put(update)
+        return len(updates)
+
+    def _authorized(self, headers) -> bool:
+        return hmac.compare_digest(headers.get(SECRET_HEADER, ''), self.secret)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            timeout = REQUEST_TIMEOUT
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status: int, body: bytes = b''):
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                # health check for the hosting platform
+                self._reply(200, b'ok')
+
+            def do_POST(self):
+                if self.path.split('?', 1)[0] != server.path:
+                    return self._reply(404)
+                if not server._authorized(self.headers):
+                    return self._reply(403)
+                length = int(self.headers.get('Content-Length') or 0)
+                if length > MAX_BODY:
+                    return self._reply(413)
+                try:
+                    server.accept(self.rfile.read(length))
+                except (ValueError, TypeError, KeyError, AttributeError):
+                    logging.warning('webhook: rejected malformed update body')
+                    return self._reply(400)
+                self._reply(200)
+
+        return Handler
+
+
+def serve(updater, server: WebhookServer, url: Optional[str] = None, max_connections: int = 40):
+    """Run until SIGINT/SIGTERM. Without `url` the webhook is not registered (local testing)."""
+    dp = updater.dispatcher
+    ready = threading.Event()
+    threading.Thread(target=dp.start, kwargs={'ready': ready}, name='dispatcher', daemon=True).start()
+    ready.wait()
+    server.start()
+    if url:
+        updater.bot.set_webhook(url=url, secret_token=server.secret, max_connections=max_connections)
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    print(f'Webhook listening on port {server.port}{server.path}')
+    while not stop.wait(1):
+        pass
+
+    # stop taking new updates (Telegram keeps and retries them while we are down),
+    # then let the dispatcher work through what was already accepted
+    server.stop()
+    dp.stop()